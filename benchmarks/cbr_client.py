@@ -0,0 +1,97 @@
+"""
+    Compares fetching the CBR rates with a new connection and a full download per fetch (the former
+    fetch_and_store_rate) against the long-lived conditional CbrClient.
+
+    Usage:
+        python -m benchmarks.cbr_client [--fetches 200] [--currencies 43]
+
+    The rates are served by a local fake CBR server, which answers conditional requests
+    with 304 as the real one does.
+"""
+import argparse
+import hashlib
+import json
+import socket
+import statistics
+import time
+
+import asyncio
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+from utils.cbr_client import CbrClient
+
+
+def fake_cbr_app(currencies: int) -> Starlette:
+    """
+        Builds the fake CBR server with a daily_json.js of the given number of currencies.
+    """
+    body = json.dumps({
+        'Date': '2026-10-17T11:30:00+03:00',
+        'Valute': {f'C{number:02d}': {'CharCode': f'C{number:02d}', 'Nominal': 1, 'Name': 'Currency ' * 4,
+                                      'Value': 10 + number, 'Previous': 10 + number}
+                   for number in range(currencies)}
+    }).encode()
+    etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+
+    async def daily_json(request: Request) -> Response:
+        if request.headers.get('If-None-Match') == etag:
+            return Response(status_code=304, headers={'ETag': etag})
+        return Response(body, media_type='application/json', headers={'ETag': etag})
+
+    return Starlette(routes=[Route('/daily_json.js', daily_json)])
+
+
+async def measure(fetch, fetches: int) -> dict:
+    latencies = []
+    for _ in range(fetches):
+        started = time.perf_counter()
+        await fetch()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {'mean_ms': round(statistics.mean(latencies), 3),
+            'p95_ms': round(statistics.quantiles(latencies, n=20)[-1], 3)}
+
+
+async def run(fetches: int, currencies: int) -> dict:
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(fake_cbr_app(currencies), host='127.0.0.1', port=port,
+                                           log_level='warning', access_log=False))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    url = f'http://127.0.0.1:{port}/daily_json.js'
+
+    async def fetch_with_new_client():
+        async with httpx.AsyncClient() as client:
+            response = await client.get(url, timeout=30.0)
+            response.raise_for_status()
+            return response.json()['Valute']
+
+    client = CbrClient(url=url)
+    try:
+        return {
+            'new_client': await measure(fetch_with_new_client, fetches),
+            'keep_alive_conditional': await measure(client.fetch_rates, fetches)
+        }
+    finally:
+        await client.close()
+        server.should_exit = True
+        await serving
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CBR rates fetching latency')
+    parser.add_argument('--fetches', type=int, default=200)
+    parser.add_argument('--currencies', type=int, default=43)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.fetches, args.currencies)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
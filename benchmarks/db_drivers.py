@@ -0,0 +1,143 @@
+"""
+    Compares the async MySQL drivers on the queries of the service.
+
+    Usage:
+        python -m benchmarks.db_drivers [--queries 2000] [--packages 10000] [--drivers aiomysql asyncmy]
+
+    Every driver gets a fresh database (BENCHMARK_DATABASE_NAME, 'benchmark_delivery_service' by default)
+    on the MySQL server from .env, dropped afterwards, and runs the queries one by one on one connection:
+    a package insert with its commit, a point select of the package details, a page of the package list
+    with its count and a bulk update of 100 delivery costs by primary key. The report has the mean and p95
+    latency and the CPU time of the benchmark process per query, the latter is mostly spent in the driver
+    and SQLAlchemy since the server runs in another process.
+"""
+import argparse
+import json
+import statistics
+import time
+
+import asyncio
+from environs import Env
+from sqlalchemy import create_engine, text, insert, update
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+
+from db.base import Base
+from db.packages import PackageTable, PackageTypeTable
+from db import tariffs  # noqa: F401
+from endpoints.deliveries import PACKAGE_LIST_STATEMENTS, PACKAGE_DETAILS_STATEMENTS
+from utils.db_utils import DATABASE_DRIVERS, database_url
+
+SESSIONS = 100
+PAGE_SIZE = 50
+BULK_UPDATE_SIZE = 100
+
+
+def session_id(number: int) -> str:
+    return f'{number % SESSIONS:036d}'
+
+
+async def seed(engine, packages: int):
+    """
+        Creates the schema and generates the packages of SESSIONS sessions.
+    """
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        await connection.execute(insert(PackageTypeTable), [{'type_name': name}
+                                                            for name in ('одежда', 'электроника', 'разное')])
+        await connection.execute(insert(PackageTable), [
+            {'name': f'package {number}', 'weight': 0.5 + number % 50, 'type_id': 1 + number % 3,
+             'content_value_usd': 10 + number % 1000, 'session_id': session_id(number)}
+            for number in range(packages)
+        ])
+
+
+async def measure(call, queries: int) -> dict:
+    """
+        Runs the call the given number of times after a warm-up.
+
+        Returns:
+            dict: Mean and p95 latency in milliseconds and CPU microseconds per query
+    """
+    for number in range(10):
+        await call(number)
+    latencies = []
+    cpu_started = time.process_time()
+    for number in range(queries):
+        started = time.perf_counter()
+        await call(number)
+        latencies.append(time.perf_counter() - started)
+    cpu_seconds = time.process_time() - cpu_started
+    return {'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+            'p95_ms': round(statistics.quantiles(latencies, n=20)[-1] * 1000, 3),
+            'cpu_us': round(cpu_seconds / queries * 1e6, 1)}
+
+
+async def run_driver(url: str, packages: int, queries: int) -> dict:
+    engine = create_async_engine(url, pool_size=1, max_overflow=0)
+    try:
+        await seed(engine, packages)
+        async with AsyncSession(bind=engine, expire_on_commit=False) as db:
+            async def insert_package(number: int):
+                await db.execute(insert(PackageTable).values(
+                    name=f'inserted {number}', weight=1.5, type_id=1, content_value_usd=10,
+                    session_id=session_id(number)))
+                await db.commit()
+
+            async def point_select(number: int):
+                await db.execute(PACKAGE_DETAILS_STATEMENTS[False], {'package_ids': [number % packages + 1]})
+                await db.commit()
+
+            stmt, count_stmt = PACKAGE_LIST_STATEMENTS[(False, None)]
+
+            async def paged_select(number: int):
+                filters = {'session_id': session_id(number), 'type_name': None}
+                await db.execute(count_stmt, filters)
+                (await db.execute(stmt, {**filters, 'limit': PAGE_SIZE, 'offset': 0})).all()
+                await db.commit()
+
+            async def bulk_update(number: int):
+                start = number * BULK_UPDATE_SIZE
+                await db.execute(update(PackageTable), [
+                    {'id': package_id % packages + 1, 'delivery_cost': float(number % 1000)}
+                    for package_id in range(start, start + BULK_UPDATE_SIZE)
+                ])
+                await db.commit()
+
+            return {name: await measure(call, queries) for name, call in (
+                ('insert', insert_package), ('point_select', point_select), ('paged_select', paged_select),
+                ('bulk_update', bulk_update)
+            )}
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency and CPU per query of the async MySQL drivers')
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--packages', type=int, default=10000)
+    parser.add_argument('--drivers', nargs='+', choices=DATABASE_DRIVERS, default=list(DATABASE_DRIVERS))
+    args = parser.parse_args()
+
+    env = Env()
+    env.read_env()
+    database = env.str('BENCHMARK_DATABASE_NAME', 'benchmark_delivery_service')
+    user, password = env.str('DATABASE_USER'), env.str('DATABASE_PASSWORD')
+    server = f'{env.str("DATABASE_HOST")}:{env.str("DATABASE_PORT")}'
+    admin = create_engine(database_url(user, password, server, driver='pymysql'))
+
+    report = {}
+    try:
+        for driver in args.drivers:
+            with admin.connect() as connection:
+                connection.execute(text(f'DROP DATABASE IF EXISTS {database}'))
+                connection.execute(text(f'CREATE DATABASE {database}'))
+            report[driver] = asyncio.run(run_driver(database_url(user, password, server, database, driver),
+                                                    args.packages, args.queries))
+    finally:
+        with admin.connect() as connection:
+            connection.execute(text(f'DROP DATABASE IF EXISTS {database}'))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+    Runs the microbenchmarks of the per-request and per-row hot functions (benchmarks/micro)
+    and compares their medians with the committed baseline.
+
+    Usage:
+        python -m benchmarks.hot_paths [--threshold 0.3]
+        python -m benchmarks.hot_paths --update-baseline
+        python -m benchmarks.hot_paths --results results.json
+
+    The suite needs no MySQL or Redis. The command exits with 1 if a benchmark is slower than its baseline
+    by more than the threshold, 0.3 by default, i.e. 30 %. --results compares a pytest-benchmark JSON report
+    made before instead of running the suite. The baseline depends on the machine, so it is updated
+    on the machine that runs the comparison.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+SUITE = os.path.join(os.path.dirname(__file__), 'micro')
+BASELINE = os.path.join(SUITE, 'baseline.json')
+
+
+def run_suite() -> dict:
+    """
+        Runs the suite and returns its pytest-benchmark report.
+
+        Raises:
+            RuntimeError: If a benchmark fails
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'results.json')
+        # The log records of the measured functions are not kept by pytest
+        completed = subprocess.run([sys.executable, '-m', 'pytest', '-q', '-p', 'no:logging', '-p', 'no:cacheprovider',
+                                    f'--benchmark-json={path}', SUITE])
+        if completed.returncode != 0:
+            raise RuntimeError(f'The benchmark suite failed with exit code {completed.returncode}')
+        with open(path) as file:
+            return json.load(file)
+
+
+def medians(report: dict) -> dict[str, float]:
+    """
+        Returns the median time of every benchmark of a pytest-benchmark report in microseconds.
+    """
+    return {benchmark['name']: round(benchmark['stats']['median'] * 1e6, 3) for benchmark in report['benchmarks']}
+
+
+def compare(baseline: dict[str, float], current: dict[str, float], threshold: float) -> list[dict]:
+    """
+        Compares the medians of the benchmarks with the baseline.
+
+        Args:
+            baseline (dict[str, float]): Baseline medians by benchmark name
+            current (dict[str, float]): Current medians by benchmark name
+            threshold (float): Allowed slowdown, a share of the baseline
+
+        Returns:
+            list[dict]: One row per benchmark with the 'regression' flag, the benchmarks missing
+                from the baseline are never regressions
+    """
+    rows = []
+    for name, median_us in sorted(current.items()):
+        baseline_us = baseline.get(name)
+        change = round(median_us / baseline_us - 1, 3) if baseline_us else None
+        rows.append({'name': name, 'baseline_us': baseline_us, 'median_us': median_us, 'change': change,
+                     'regression': change is not None and change > threshold})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmarks of the hot functions compared with the baseline')
+    parser.add_argument('--threshold', type=float, default=0.3)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--results', help='pytest-benchmark JSON report to compare instead of running the suite')
+    args = parser.parse_args()
+
+    if args.results:
+        with open(args.results) as file:
+            report = json.load(file)
+    else:
+        report = run_suite()
+    current = medians(report)
+
+    if args.update_baseline:
+        with open(BASELINE, 'w') as file:
+            json.dump({'machine': {'python': platform.python_version(), 'processor': platform.machine(),
+                                   'cpu': report['machine_info'].get('cpu', {}).get('brand_raw')},
+                       'median_us': current}, file, indent=2, ensure_ascii=False)
+            file.write('\n')
+        print(f'The baseline of {len(current)} benchmarks is written to {BASELINE}')
+        return
+
+    with open(BASELINE) as file:
+        baseline = json.load(file)['median_us']
+    rows = compare(baseline, current, args.threshold)
+    print(json.dumps(rows, indent=2, ensure_ascii=False))
+    regressions = [row['name'] for row in rows if row['regression']]
+    if regressions:
+        print(f'Slower than the baseline by more than {args.threshold:.0%}: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
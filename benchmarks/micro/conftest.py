@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+from sqlalchemy import BigInteger, create_engine, insert
+from sqlalchemy.ext.compiler import compiles
+
+from db.base import Base
+from db.packages import PackageTable, PackageTypeTable
+from db import tariffs  # noqa: F401
+from endpoints.deliveries import PACKAGE_LIST_STATEMENTS
+
+SESSION_ID = '00000000-0000-0000-0000-000000000001'
+PAGE_SIZE = 1000
+
+
+@compiles(BigInteger, 'sqlite')
+def sqlite_big_integer(type_, compiler, **kw):
+    # SQLite only autoincrements INTEGER primary keys
+    return 'INTEGER'
+
+
+@pytest.fixture(scope='session')
+def run():
+    """
+        Runs a coroutine to completion, the benchmarks themselves are synchronous.
+    """
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
+
+@pytest.fixture(scope='session')
+def package_rows():
+    """
+        Rows of a package list page as the list endpoint reads them, half of the packages are priced.
+    """
+    engine = create_engine('sqlite://')
+    with engine.begin() as connection:
+        Base.metadata.create_all(connection)
+        connection.execute(insert(PackageTypeTable), [{'type_name': name}
+                                                      for name in ('одежда', 'электроника', 'разное')])
+        connection.execute(insert(PackageTable), [
+            {'name': f'package {number}', 'weight': 0.5 + number % 50, 'type_id': 1 + number % 3,
+             'content_value_usd': 10 + number % 1000, 'session_id': SESSION_ID,
+             'delivery_cost': 100.0 + number if number % 2 else None}
+            for number in range(PAGE_SIZE)
+        ])
+        stmt, _ = PACKAGE_LIST_STATEMENTS[(False, None)]
+        rows = connection.execute(stmt, {'session_id': SESSION_ID, 'type_name': None,
+                                         'limit': PAGE_SIZE, 'offset': 0}).all()
+    engine.dispose()
+    return rows
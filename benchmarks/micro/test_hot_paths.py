@@ -0,0 +1,88 @@
+import json
+
+import pytest
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi_pagination import Params, create_page
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from endpoints.deliveries import get_package_info_by_session_id
+from main import app
+from middleware.session import SessionMiddleware, is_valid_uuid
+from models.packages import PackageCreate, PackageInfo
+from tasks.calculate_delivery_cost_task import calculate_delivery_cost
+
+SESSION_ID = '6f1c2a4e-8d3b-4f5a-9c7e-2b1d0e9f8a7c'
+
+
+def test_calculate_delivery_cost(benchmark):
+    assert benchmark(calculate_delivery_cost, 2.5, 120.0, 90.5, 1) is not None
+
+
+def test_package_create_validation(benchmark):
+    payload = {'name': 'Куртка', 'weight': 2.5, 'type_name': 'Одежда', 'content_value_usd': 120.456}
+    assert benchmark(PackageCreate.model_validate, payload).type_name == 'одежда'
+
+
+@pytest.mark.parametrize('delivery_cost', [1234.567, 'Не рассчитано'], ids=['priced', 'not_priced'])
+def test_package_info_validation(benchmark, delivery_cost):
+    payload = {'id': 1, 'name': 'Куртка', 'weight': 2.5, 'type_id': 1, 'type_name': 'одежда',
+               'content_value_usd': 120.456, 'delivery_cost': delivery_cost}
+    assert benchmark(PackageInfo.model_validate, payload).id == 1
+
+
+@pytest.mark.parametrize('value', [SESSION_ID, 'not-a-session-id'], ids=['valid', 'invalid'])
+def test_is_valid_uuid(benchmark, value):
+    assert benchmark(is_valid_uuid, value) == (value == SESSION_ID)
+
+
+@pytest.fixture(scope='module')
+def session_app():
+    async def endpoint(request):
+        return PlainTextResponse(request.state.session_id)
+
+    return Starlette(routes=[Route('/', endpoint)], middleware=[Middleware(SessionMiddleware)])
+
+
+async def call(asgi_app, headers: list[tuple[bytes, bytes]]) -> list[dict]:
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+             'path': '/', 'raw_path': b'/', 'root_path': '', 'query_string': b'', 'headers': headers,
+             'client': ('127.0.0.1', 50000), 'server': ('test', 80)}
+    requested = False
+    messages = []
+
+    async def receive():
+        nonlocal requested
+        if requested:
+            return {'type': 'http.disconnect'}
+        requested = True
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi_app(scope, receive, send)
+    return messages
+
+
+@pytest.mark.parametrize('headers', [[(b'x-session-id', SESSION_ID.encode())], []], ids=['session', 'new_session'])
+def test_session_middleware_dispatch(benchmark, run, session_app, headers):
+    messages = benchmark(lambda: run(call(session_app, headers)))
+    assert messages[0]['status'] == 200
+
+
+def test_package_page_serialization(benchmark, run, package_rows):
+    route = next(route for route in app.routes if getattr(route, 'endpoint', None) is get_package_info_by_session_id)
+    # The API limits the page size to 100, the larger page makes the per-row cost dominate
+    params = Params.model_construct(page=1, size=len(package_rows))
+
+    def serialize() -> bytes:
+        page = create_page(package_rows, total=len(package_rows), params=params)
+        return JSONResponse(run(serialize_response(field=route.response_field, response_content=page))).body
+
+    page = json.loads(benchmark(serialize))
+    assert len(page['items']) == page['total'] == len(package_rows)
+    assert {item['delivery_cost'] for item in page['items'][:2]} == {'Не рассчитано', '101.0'}
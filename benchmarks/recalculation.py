@@ -0,0 +1,102 @@
+"""
+    Measures the delivery cost recalculation throughput for several concurrency levels.
+
+    Usage:
+        python -m benchmarks.recalculation [--packages 200000] [--chunk-size 1000] [--concurrency 1 2 4 8]
+
+    The packages are generated in a separate database (BENCHMARK_DATABASE_NAME, 'benchmark_delivery_service'
+    by default) on the MySQL server from .env, which is dropped afterwards. Every run alternates the USD rate,
+    so all the packages are rewritten each time.
+"""
+import argparse
+import json
+import os
+import time
+
+import asyncio
+from environs import Env
+from sqlalchemy import create_engine, text, insert
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+
+from db.base import Base
+from db.packages import PackageTable, PackageTypeTable
+from db import tariffs  # noqa: F401
+
+INSERT_BATCH_SIZE = 10000
+
+
+async def seed(engine, packages: int):
+    """
+        Creates the schema and generates the packages of 1000 sessions.
+    """
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        await connection.execute(insert(PackageTypeTable), [{'type_name': name}
+                                                            for name in ('одежда', 'электроника', 'разное')])
+    for start in range(0, packages, INSERT_BATCH_SIZE):
+        async with engine.begin() as connection:
+            await connection.execute(insert(PackageTable), [
+                {'name': f'package {number}', 'weight': 0.5 + number % 50, 'type_id': 1 + number % 3,
+                 'content_value_usd': 10 + number % 1000, 'session_id': f'{number % 1000:036d}'}
+                for number in range(start, min(start + INSERT_BATCH_SIZE, packages))
+            ])
+
+
+async def measure(engine, packages: int, chunk_size: int, levels: list[int]) -> list[dict]:
+    """
+        Recalculates all the packages once per concurrency level.
+    """
+    from tasks.calculate_delivery_cost_task import recalculate_delivery_costs
+
+    report = []
+    for number, concurrency in enumerate(levels):
+        async with AsyncSession(bind=engine, expire_on_commit=False) as db:
+            started = time.perf_counter()
+            await recalculate_delivery_costs(db, usd_rate=90.0 + number % 2, chunk_size=chunk_size,
+                                             concurrency=concurrency)
+            seconds = time.perf_counter() - started
+        report.append({'concurrency': concurrency, 'seconds': round(seconds, 2),
+                       'packages_per_second': round(packages / seconds)})
+    baseline = report[0]['packages_per_second'] / report[0]['concurrency']
+    for row in report:
+        row['scaling_efficiency'] = round(row['packages_per_second'] / (baseline * row['concurrency']), 2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Delivery cost recalculation throughput')
+    parser.add_argument('--packages', type=int, default=200000)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    env = Env()
+    env.read_env()
+    # The package events are not measured
+    os.environ.setdefault('REDIS_CALL_TIMEOUT', '0.05')
+    database = env.str('BENCHMARK_DATABASE_NAME', 'benchmark_delivery_service')
+    server = (f'{env.str("DATABASE_USER")}:{env.str("DATABASE_PASSWORD")}'
+              f'@{env.str("DATABASE_HOST")}:{env.str("DATABASE_PORT")}')
+    admin = create_engine(f'mysql+pymysql://{server}/')
+    with admin.connect() as connection:
+        connection.execute(text(f'DROP DATABASE IF EXISTS {database}'))
+        connection.execute(text(f'CREATE DATABASE {database}'))
+
+    async def run() -> list[dict]:
+        engine = create_async_engine(f'mysql+aiomysql://{server}/{database}',
+                                     pool_size=max(args.concurrency) + 1, max_overflow=0)
+        try:
+            await seed(engine, args.packages)
+            return await measure(engine, args.packages, args.chunk_size, args.concurrency)
+        finally:
+            await engine.dispose()
+
+    try:
+        print(json.dumps(asyncio.run(run()), indent=2))
+    finally:
+        with admin.connect() as connection:
+            connection.execute(text(f'DROP DATABASE IF EXISTS {database}'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+    Compares requests per second of the development launch mode and the production one.
+
+    Usage:
+        python -m benchmarks.serving [--duration 10] [--concurrency 64] [--clients 2] [--workers N]
+                                     [--path /api/v1/health/live]
+
+    Both servers run with SERVICE_ROLE=api, so that the background tasks do not affect
+    the measurement. The default path goes through the middleware stack without touching
+    MySQL or Redis, pass another path to include the database in the measurement.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import asyncio
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def launch_commands(port: int, workers: int) -> dict[str, list[str]]:
+    """
+        Builds the server commands of the compared launch modes.
+    """
+    return {
+        # What `python main.py` runs in the image without uvloop and httptools, minus the reloader process
+        'dev': [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port), '--log-level', 'warning',
+                '--loop', 'asyncio', '--http', 'h11'],
+        'production': [sys.executable, 'serve.py', '--role', 'api', '--port', str(port), '--host', '127.0.0.1',
+                       '--workers', str(workers)]
+    }
+
+
+async def load(url: str, duration: float, concurrency: int) -> list[float]:
+    """
+        Sends requests with the given concurrency for the given duration.
+
+        Returns:
+            list[float]: Latencies of the successful requests in milliseconds
+    """
+    latencies = []
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=10) as client:
+        async def user():
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                response = await client.get(url)
+                if response.status_code < 500:
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+    return latencies
+
+
+def load_process(args: tuple[str, float, int]) -> list[float]:
+    return asyncio.run(load(*args))
+
+
+def wait_until_up(url: str, timeout: float = 30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise TimeoutError(f'The server did not start in {timeout} seconds')
+
+
+def run_mode(command: list[str], url: str, duration: float, concurrency: int, clients: int) -> dict[str, float]:
+    """
+        Starts a server, loads it from several client processes and stops it.
+
+        Returns:
+            dict[str, float]: Requests per second and latency percentiles
+    """
+    server = subprocess.Popen(command, cwd=ROOT, env={**os.environ, 'SERVICE_ROLE': 'api'},
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(url)
+        # Warming up the workers and the connections
+        load_process((url, 1, concurrency))
+        with multiprocessing.Pool(clients) as pool:
+            results = pool.map(load_process, [(url, duration, concurrency // clients or 1)] * clients)
+    finally:
+        server.terminate()
+        server.wait()
+    latencies = sorted(latency for result in results for latency in result)
+    return {
+        'requests': len(latencies),
+        'rps': round(len(latencies) / duration, 1),
+        'p50_ms': round(statistics.median(latencies), 2),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1], 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serving mode benchmark')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--clients', type=int, default=2, help='Number of load generating processes')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--port', type=int, default=8898)
+    parser.add_argument('--path', default='/api/v1/health/live')
+    args = parser.parse_args()
+
+    url = f'http://127.0.0.1:{args.port}{args.path}'
+    report = {'cpus': os.cpu_count(), 'workers': args.workers, 'path': args.path}
+    for mode, command in launch_commands(args.port, args.workers).items():
+        report[mode] = run_mode(command, url, args.duration, args.concurrency, args.clients)
+    report['speedup'] = round(report['production']['rps'] / report['dev']['rps'], 2)
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+    Measures the application import time and the time to the first served request.
+
+    Usage:
+        python -m benchmarks.startup_report [--runs 10] [--port 8899] [--skip-server]
+
+    The import time is measured in fresh interpreters with `-X importtime`. The server part
+    starts uvicorn with the real lifespan, so it needs the database and Redis from .env.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+\d+ \|\s+(\d+) \| (\S+)$')
+
+
+def measure_import_time(module: str, runs: int) -> dict[str, float]:
+    """
+        Measures the cumulative import time of a module in fresh interpreters.
+
+        Args:
+            module (str): The imported module
+            runs (int): Number of interpreter runs
+
+        Returns:
+            dict[str, float]: The min and median import time in milliseconds
+    """
+    samples = []
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                   cwd=ROOT, capture_output=True, text=True, check=True)
+        for line in completed.stderr.splitlines():
+            match = IMPORT_TIME_LINE.match(line)
+            if match and match.group(2) == module:
+                samples.append(int(match.group(1)) / 1000)
+    return {'min_ms': round(min(samples), 1), 'median_ms': round(statistics.median(samples), 1)}
+
+
+def wait_for(client: httpx.Client, url: str, started: float, timeout: float, status_code: int = 200) -> float:
+    """
+        Polls the url until it responds with the expected status code.
+
+        Returns:
+            float: Seconds passed since the server process was started
+    """
+    while time.perf_counter() - started < timeout:
+        try:
+            if client.get(url).status_code == status_code:
+                return time.perf_counter() - started
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(f'{url} did not respond with {status_code} in {timeout} seconds')
+
+
+def measure_server_startup(port: int, timeout: float) -> dict[str, float]:
+    """
+        Starts the application and measures the time to the first responses.
+
+        Returns:
+            dict[str, float]: Seconds to the first liveness response, to readiness and
+                the latency of the first and the second package types request in milliseconds
+    """
+    base_url = f'http://127.0.0.1:{port}'
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port), '--log-level', 'warning'],
+                              cwd=ROOT)
+    try:
+        with httpx.Client(base_url=base_url, timeout=5) as client:
+            live = wait_for(client, '/api/v1/health/live', started, timeout)
+            ready = wait_for(client, '/api/v1/health/ready', started, timeout)
+            latencies = []
+            for _ in range(2):
+                request_started = time.perf_counter()
+                client.get('/api/v1/package_types').raise_for_status()
+                latencies.append(round((time.perf_counter() - request_started) * 1000, 2))
+            startup_report = client.get('/api/v1/health/ready').json()['startup']
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        'first_response_s': round(live, 3),
+        'ready_s': round(ready, 3),
+        'first_request_ms': latencies[0],
+        'second_request_ms': latencies[1],
+        'warm_up': startup_report
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Startup time report')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--port', type=int, default=8899)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--skip-server', action='store_true', help='Measure only the import time')
+    args = parser.parse_args()
+
+    report = {'import_main': measure_import_time('main', args.runs)}
+    if not args.skip_server:
+        report['server'] = measure_server_startup(args.port, args.timeout)
+    print(json.dumps(report, indent=4, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+    Compares the CPU time per request of the hot queries built on every request (the former code)
+    against the statements built once at import.
+
+    Usage:
+        python -m benchmarks.statements [--requests 2000] [--page-size 50]
+
+    The queries run against an in-memory SQLite database, so the measured time is mostly
+    the Python side: building the statement, looking up its compiled SQL, binding the parameters
+    and reading the rows. The package list cycles through all the combinations of its filters.
+"""
+import argparse
+import itertools
+import json
+import time
+
+import asyncio
+from fastapi_pagination import Params, create_page
+from fastapi_pagination.ext.sqlalchemy import apaginate
+from sqlalchemy import BigInteger, select, insert, case, cast, literal_column, String
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.ext.compiler import compiles
+
+from db.base import Base
+from db.packages import PackageTable, PackageTypeTable, SessionSummaryTable
+from db import tariffs  # noqa: F401
+from endpoints.deliveries import (filter_session_packages, PACKAGE_LIST_STATEMENTS, SESSION_SUMMARY_STATEMENT,
+                                  PACKAGE_DETAILS_STATEMENTS, PACKAGE_DETAILS_COLUMNS)
+
+SESSION_ID = '00000000-0000-0000-0000-000000000001'
+FILTERS = list(itertools.product((None, 'одежда'), (None, True, False)))
+
+
+@compiles(BigInteger, 'sqlite')
+def sqlite_big_integer(type_, compiler, **kw):
+    # SQLite only autoincrements INTEGER primary keys
+    return 'INTEGER'
+
+
+async def seed(engine, packages: int):
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        await connection.execute(insert(PackageTypeTable), [{'type_name': name}
+                                                            for name in ('одежда', 'электроника', 'разное')])
+        await connection.execute(insert(PackageTable), [
+            {'name': f'package {number}', 'weight': 1.5, 'type_id': 1 + number % 3, 'content_value_usd': 10,
+             'session_id': SESSION_ID, 'delivery_cost': 100.0 if number % 2 else None}
+            for number in range(packages)
+        ])
+        await connection.execute(insert(SessionSummaryTable), [
+            {'session_id': SESSION_ID, 'type_id': type_id, 'package_count': 1, 'total_value_usd': 10,
+             'priced_count': 1, 'total_delivery_cost': 100}
+            for type_id in (1, 2, 3)
+        ])
+
+
+async def rebuilt_list(db: AsyncSession, type_name: str | None, has_delivery_cost: bool | None, params: Params):
+    stmt = select(PackageTable.id, PackageTable.name, PackageTable.weight, PackageTable.type_id,
+                  PackageTypeTable.type_name, PackageTable.content_value_usd,
+                  case((PackageTable.delivery_cost.is_(None), literal_column('\'Не рассчитано\'')),
+                       else_=cast(PackageTable.delivery_cost, String)).label(
+                      'delivery_cost')).join(
+        PackageTypeTable, PackageTable.type_id == PackageTypeTable.id)
+    stmt = filter_session_packages(stmt, SESSION_ID, type_name, has_delivery_cost)
+    return await apaginate(db, stmt, params)
+
+
+async def prebuilt_list(db: AsyncSession, type_name: str | None, has_delivery_cost: bool | None, params: Params):
+    stmt, count_stmt = PACKAGE_LIST_STATEMENTS[(type_name is not None, has_delivery_cost)]
+    filters = {'session_id': SESSION_ID, 'type_name': type_name}
+    raw_params = params.to_raw_params().as_limit_offset()
+    total = (await db.execute(count_stmt, filters)).scalar()
+    rows = (await db.execute(stmt, {**filters, 'limit': raw_params.limit, 'offset': raw_params.offset})).all()
+    return create_page(rows, total=total, params=params)
+
+
+async def rebuilt_summary(db: AsyncSession):
+    stmt = select(SessionSummaryTable).where(SessionSummaryTable.session_id == SESSION_ID).order_by(
+        SessionSummaryTable.type_id)
+    return (await db.execute(stmt)).scalars().all()
+
+
+async def prebuilt_summary(db: AsyncSession):
+    return (await db.execute(SESSION_SUMMARY_STATEMENT, {'session_id': SESSION_ID})).scalars().all()
+
+
+async def rebuilt_details(db: AsyncSession, package_ids: list[int]):
+    columns = [getattr(PackageTable, column) for column in PACKAGE_DETAILS_COLUMNS]
+    return (await db.execute(select(*columns).where(PackageTable.id.in_(package_ids)))).all()
+
+
+async def prebuilt_details(db: AsyncSession, package_ids: list[int]):
+    return (await db.execute(PACKAGE_DETAILS_STATEMENTS[False], {'package_ids': package_ids})).all()
+
+
+async def measure(call, requests: int) -> float:
+    """
+        Returns the CPU microseconds per call, after a warm-up filling the compiled SQL cache.
+    """
+    for number in range(len(FILTERS)):
+        await call(number)
+    started = time.process_time()
+    for number in range(requests):
+        await call(number)
+    return round((time.process_time() - started) / requests * 1e6, 1)
+
+
+async def run(requests: int, page_size: int) -> dict:
+    engine = create_async_engine('sqlite+aiosqlite:///:memory:')
+    await seed(engine, page_size * 4)
+    params = Params(page=1, size=page_size)
+    report = {}
+    try:
+        async with AsyncSession(engine) as db:
+            for name, rebuilt, prebuilt in (
+                ('packages', lambda number: rebuilt_list(db, *FILTERS[number % len(FILTERS)], params),
+                 lambda number: prebuilt_list(db, *FILTERS[number % len(FILTERS)], params)),
+                ('summary', lambda number: rebuilt_summary(db), lambda number: prebuilt_summary(db)),
+                ('details', lambda number: rebuilt_details(db, [number % 100 + 1]),
+                 lambda number: prebuilt_details(db, [number % 100 + 1]))
+            ):
+                rebuilt_us = await measure(rebuilt, requests)
+                prebuilt_us = await measure(prebuilt, requests)
+                report[name] = {'rebuilt_cpu_us': rebuilt_us, 'prebuilt_cpu_us': prebuilt_us,
+                                'saved_cpu_us': round(rebuilt_us - prebuilt_us, 1)}
+    finally:
+        await engine.dispose()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CPU per request of the rebuilt and prebuilt hot statements')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--page-size', type=int, default=50)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.requests, args.page_size)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
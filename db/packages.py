@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Float, ForeignKey, DateTime, Numeric, JSON, func
 from sqlalchemy.dialects.mysql import CHAR
 
 from db.base import Base
@@ -12,7 +12,8 @@ class PackageTypeTable(Base):
 
 class PackageTable(Base):
     __tablename__ = 'package'
-    id = Column(Integer, primary_key=True, autoincrement=True)
+    # The bits above utils.sharding.PACKAGE_ID_SHARD_SHIFT hold the shard that allocated the id
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
     name = Column(String(200), nullable=False)
     weight = Column(Float, nullable=False)
     type_id = Column(Integer, ForeignKey(PackageTypeTable.id), nullable=False)
@@ -20,3 +21,44 @@ class PackageTable(Base):
     session_id = Column(CHAR(36), nullable=False)
     delivery_cost = Column(Float, nullable=True)
     shipping_company_id = Column(Integer, nullable=True)
+    # Only client-driven changes (registration, shipping company assignment) count as activity,
+    # the periodic delivery cost recalculation does not
+    last_activity_at = Column(DateTime, nullable=False, server_default=func.now(), index=True)
+    # In the read-time pricing mode a package assigned to a shipping company keeps the rate version
+    # it was assigned at, the other packages are priced by the latest rate version
+    rate_version_id = Column(Integer, ForeignKey('rate_version.id'), nullable=True)
+
+
+class PackageArchiveTable(Base):
+    __tablename__ = 'package_archive'
+    id = Column(BigInteger, primary_key=True, autoincrement=False)
+    name = Column(String(200), nullable=False)
+    weight = Column(Float, nullable=False)
+    type_id = Column(Integer, ForeignKey(PackageTypeTable.id), nullable=False)
+    content_value_usd = Column(Float, nullable=False)
+    session_id = Column(CHAR(36), nullable=False, index=True)
+    delivery_cost = Column(Float, nullable=True)
+    shipping_company_id = Column(Integer, nullable=True)
+    last_activity_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, nullable=False, server_default=func.now())
+
+
+class SessionSummaryTable(Base):
+    __tablename__ = 'session_summary'
+    session_id = Column(CHAR(36), primary_key=True)
+    type_id = Column(Integer, ForeignKey(PackageTypeTable.id), primary_key=True)
+    package_count = Column(Integer, nullable=False, default=0)
+    total_value_usd = Column(Numeric(20, 2), nullable=False, default=0)
+    priced_count = Column(Integer, nullable=False, default=0)
+    total_delivery_cost = Column(Numeric(20, 2), nullable=False, default=0)
+
+
+class PackageOutboxTable(Base):
+    __tablename__ = 'package_outbox'
+    # Written in the transaction of the package change and deleted when relayed to the package stream
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    event_type = Column(String(50), nullable=False)
+    package_id = Column(BigInteger, nullable=False)
+    session_id = Column(CHAR(36), nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
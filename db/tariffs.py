@@ -0,0 +1,38 @@
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, func
+
+from db.base import Base
+from db.packages import PackageTypeTable
+
+
+class TariffTable(Base):
+    __tablename__ = 'tariff'
+    # The id is the tariff version, the tariff with the latest effective_from in the past is active
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(200), nullable=False)
+    effective_from = Column(DateTime, nullable=False, server_default=func.now(), index=True)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+
+class TariffRateTable(Base):
+    __tablename__ = 'tariff_rate'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    tariff_id = Column(Integer, ForeignKey(TariffTable.id, ondelete='CASCADE'), nullable=False, index=True)
+    # Rates without a type apply to the types that have no rates of their own
+    type_id = Column(Integer, ForeignKey(PackageTypeTable.id), nullable=True)
+    # The weight bracket starts at this weight and ends at the next bracket of the same type
+    weight_from = Column(Float, nullable=False, default=0)
+    # All the amounts are in USD
+    weight_rate = Column(Float, nullable=False)
+    value_rate = Column(Float, nullable=False)
+    base_fee = Column(Float, nullable=False, default=0)
+    min_charge = Column(Float, nullable=False, default=0)
+
+
+class RateVersionTable(Base):
+    __tablename__ = 'rate_version'
+    # Pricing inputs for the read-time pricing mode, the latest version prices the packages without their own
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    usd_rate = Column(Float, nullable=False)
+    # Empty when the default tariff was in effect
+    tariff_id = Column(Integer, ForeignKey(TariffTable.id), nullable=True)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
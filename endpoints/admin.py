@@ -1,9 +1,6 @@
 import logging
 
-from fastapi import APIRouter
-
-from tasks.calculate_delivery_cost_task import calculate_delivery_cost_task_one_time
-from tasks.usd_rate_task import usd_rate_task_one_time
+from fastapi import APIRouter, HTTPException, status
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -11,6 +8,42 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix='/api/v1', tags=['admin'])
 
 
+async def run_job(name: str) -> dict:
+    """
+        Runs a scheduled job immediately.
+
+        Args:
+            name (str): Job name
+
+        Returns:
+            dict: The run record with the status, the duration and the result of the run
+
+        Raises:
+            HTTPException: 409 error if the job is already running
+    """
+    from tasks.background import get_scheduler
+    from tasks.scheduler import JobAlreadyRunning
+
+    try:
+        return await get_scheduler().run_now(name)
+    except JobAlreadyRunning as ex:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(ex)
+        )
+
+
+@router.get('/tasks', description='This method returns the schedule and the recent runs of the background tasks')
+async def get_tasks():
+    """
+        Returns the schedule, the next run time, the number of consecutive failures
+        and the recent runs of every background task.
+    """
+    from tasks.background import get_scheduler
+
+    return await get_scheduler().status()
+
+
 @router.post('/tasks/refresh_usd_rate', description='This method manually refreshes USD rate')
 async def manual_refresh_usd_rate():
     """
@@ -20,14 +53,10 @@ async def manual_refresh_usd_rate():
         the same routine used in scheduled tasks.
 
         Raises:
-            HTTPException: 500 error if any exception occurs during processing
+            HTTPException: 409 error if the rate is being refreshed
     """
     logger.info('Manual refresh USD rate')
-    try:
-        return await usd_rate_task_one_time()
-    except Exception as ex:
-        logger.error(f'Manual USD rate refresh failed: {str(ex)}')
-        raise
+    return await run_job('refresh_usd_rate')
 
 
 @router.post('/tasks/calculate_delivery_cost', description='This method manually calculates delivery cost')
@@ -38,11 +67,42 @@ async def calculate_delivery_cost():
         Executes an on-demand run of the delivery cost calculation.
 
         Raises:
-            HTTPException: 500 error if critical failure occurs in processing
+            HTTPException: 409 error if the calculation is running
     """
     logger.info('Manual calculation of delivery cost')
+    return await run_job('calculate_delivery_cost')
+
+
+@router.post('/tasks/archive_packages', description='This method manually archives inactive packages')
+async def archive_packages():
+    """
+        Manually triggers archiving of inactive packages.
+
+        Moves priced packages assigned to a shipping company and without activity for the configured
+        number of days from the package table to the archive.
+
+        Raises:
+            HTTPException: 409 error if the archiving is running
+    """
+    logger.info('Manual archiving of packages')
+    return await run_job('archive_packages')
+
+
+@router.post('/tasks/rebuild_session_summary', description='This method rebuilds the session summary')
+async def rebuild_session_summary():
+    """
+        Manually triggers the session summary rebuild.
+
+        Recomputes the package totals of all sessions from the package and package archive tables.
+
+        Raises:
+            HTTPException: 500 error if critical failure occurs in processing
+    """
+    from tasks.rebuild_session_summary import rebuild_session_summary_one_time
+
+    logger.info('Manual rebuild of the session summary')
     try:
-        return await calculate_delivery_cost_task_one_time()
+        return await rebuild_session_summary_one_time()
     except Exception as ex:
-        logger.error(f'Manual calculation of delivery cost failed: {str(ex)}')
+        logger.error(f'Manual rebuild of the session summary failed: {str(ex)}')
         raise
@@ -1,14 +1,36 @@
+import csv
+import io
+import json
 import logging
+from collections import defaultdict
+from typing import AsyncIterator, Literal
 
-from fastapi import APIRouter, Depends, Path, Query, HTTPException, status
-from fastapi_pagination import Page, Params
+import asyncio
+from fastapi import APIRouter, Depends, Path, Query, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+from fastapi_pagination import Page, Params, create_page
 from fastapi_pagination.ext.sqlalchemy import apaginate
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, case, literal_column, String, cast
-
-from utils.session import get_session_id, get_db
-from models.packages import PackageCreate, PackageId, PackageType, PackageInfo, PackageInfoNoId
-from db.packages import PackageTable, PackageTypeTable
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy import (select, update, case, literal_column, String, cast, func, bindparam, Select, ColumnElement,
+                        BindParameter)
+
+from redis_db.package_events import package_event_broker, publish_package_events
+from redis_db.summary_costs import get_summary_costs, cache_summary_costs
+from redis_db.versions import bump_session_versions, get_session_version
+from utils import package_types as package_types_cache
+from utils.etag import make_etag, etag_matches, not_modified
+from utils.package_types import get_package_type_id, get_package_types as get_cached_package_types
+from utils.pricing import read_time_pricing, price_packages, priced_condition, get_current_rate_version
+from utils.session import (get_session_id, get_db, get_read_db, get_shard_db, get_shard_read_db,
+                           get_shard_session_factory, shard_count, shard_session, is_replica_session)
+from utils.sharding import PACKAGE_ID_SHARD_SHIFT, shard_for_session, package_home_shard
+from utils.outbox import add_outbox_events, PACKAGE_REGISTERED, SHIPPING_COMPANY_ASSIGNED
+from utils.summary import SummaryDeltas, apply_summary_deltas
+from models.packages import (PackageCreate, PackageId, PackageType, PackageInfo, PackageInfoNoId, SessionSummary,
+                             PackageTypeSummary, ShippingCompanyPackages, ShippingCompanyAssignment, PackageLookup,
+                             PackageLookupResult)
+from db.packages import PackageTable, PackageTypeTable, PackageArchiveTable, SessionSummaryTable
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -16,17 +38,228 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix='/api/v1', tags=['deliveries'])
 
 
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_COLUMNS = ['id', 'name', 'weight', 'type_id', 'type_name', 'content_value_usd', 'delivery_cost']
+EXPORT_MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8'
+}
+SSE_HEARTBEAT_INTERVAL = 15
+SSE_RETRY_MS = 5000
+# The catalog only changes with migrations, the session data has to be revalidated on every use
+PACKAGE_TYPES_CACHE_CONTROL = 'private, max-age=300'
+SESSION_DATA_CACHE_CONTROL = 'private, no-cache'
+PACKAGE_DETAILS_COLUMNS = ('id', 'name', 'weight', 'type_id', 'content_value_usd', 'delivery_cost')
+# Number of package ids claimed by one statement of the bulk assignment
+BULK_ASSIGN_CHUNK_SIZE = 1000
+
+
+def filter_session_packages(stmt: Select, session_id: str | BindParameter, type_name: str | BindParameter | None,
+                            has_delivery_cost: bool | None, priced: ColumnElement[bool] | None = None) -> Select:
+    """
+        Applies the session and optional filters of the package list to a statement.
+
+        Args:
+            stmt (Select): Statement selecting from the package table joined with package types
+            session_id (str | BindParameter): Session identifier or its parameter
+            type_name (str | BindParameter | None): Optional type name filter or its parameter
+            has_delivery_cost (bool | None): Optional delivery cost status filter
+            priced (ColumnElement[bool] | None): Condition of having a delivery cost,
+                the stored delivery cost is checked by default
+
+        Returns:
+            Select: The filtered statement ordered by package id
+    """
+    stmt = stmt.where(PackageTable.session_id == session_id)
+    if type_name is not None:
+        stmt = stmt.where(PackageTypeTable.type_name == type_name)
+    if has_delivery_cost is not None:
+        if priced is None:
+            priced = PackageTable.delivery_cost.is_not(None)
+        stmt = stmt.where(priced if has_delivery_cost else ~priced)
+    return stmt.order_by(PackageTable.id)
+
+
+def package_list_statements(type_filter: bool, has_delivery_cost: bool | None) -> tuple[Select, Select]:
+    """
+        Builds the page and the count statements of the package list for a combination of the filters.
+
+        The statements take the session_id, type_name, limit and offset parameters.
+
+        Args:
+            type_filter (bool): Whether the list is filtered by the type name
+            has_delivery_cost (bool | None): Optional delivery cost status filter
+
+        Returns:
+            tuple[Select, Select]: The page statement and the count statement
+    """
+    stmt = select(PackageTable.id, PackageTable.name, PackageTable.weight, PackageTable.type_id,
+                  PackageTypeTable.type_name, PackageTable.content_value_usd,
+                  case((PackageTable.delivery_cost.is_(None), literal_column('\'Не рассчитано\'')),
+                       else_=cast(PackageTable.delivery_cost, String)).label(
+                      'delivery_cost')).join(
+        PackageTypeTable, PackageTable.type_id == PackageTypeTable.id)
+    count_stmt = select(func.count()).select_from(PackageTable)
+    if type_filter:
+        count_stmt = count_stmt.join(PackageTypeTable, PackageTable.type_id == PackageTypeTable.id)
+    type_name = bindparam('type_name') if type_filter else None
+    stmt = filter_session_packages(stmt, bindparam('session_id'), type_name, has_delivery_cost)
+    count_stmt = filter_session_packages(count_stmt, bindparam('session_id'), type_name, has_delivery_cost)
+    return stmt.limit(bindparam('limit')).offset(bindparam('offset')), count_stmt.order_by(None)
+
+
+# The hot statements are built once, so that a request only binds its parameters and SQLAlchemy
+# finds their compiled SQL in the cache without building and hashing the statement again.
+# The package list statements by the presence of the type filter and the delivery cost filter
+PACKAGE_LIST_STATEMENTS = {(type_filter, has_delivery_cost): package_list_statements(type_filter, has_delivery_cost)
+                           for type_filter in (False, True) for has_delivery_cost in (None, True, False)}
+SESSION_SUMMARY_STATEMENT = (
+    select(SessionSummaryTable)
+    .where(SessionSummaryTable.session_id == bindparam('session_id'))
+    .order_by(SessionSummaryTable.type_id)
+)
+# The package details by the read-time pricing mode, which also needs the rate versions
+PACKAGE_DETAILS_STATEMENTS = {
+    read_time: select(*(getattr(PackageTable, column) for column in PACKAGE_DETAILS_COLUMNS),
+                      *([PackageTable.rate_version_id] if read_time else []))
+    .where(PackageTable.id.in_(bindparam('package_ids', expanding=True)))
+    for read_time in (False, True)
+}
+ARCHIVED_PACKAGE_DETAILS_STATEMENT = (
+    select(*(getattr(PackageArchiveTable, column) for column in PACKAGE_DETAILS_COLUMNS))
+    .where(PackageArchiveTable.id.in_(bindparam('package_ids', expanding=True)))
+)
+PACKAGE_IDS_STATEMENT = select(PackageTable.id).where(PackageTable.id.in_(bindparam('package_ids', expanding=True)))
+
+
+async def session_packages_etag(request: Request, db: AsyncSession, session_id: str) -> str | None:
+    """
+        Builds the ETag of a response derived from the session packages.
+
+        The ETag depends on the package version of the session, which is bumped by every write
+        to the session packages, and on the query parameters, so it is known without querying the packages.
+        The responses read from the replica are sent without it, since a lagging replica may still return
+        the packages of an older version, but they are answered with 304 for an ETag of a primary read.
+
+        Args:
+            request (Request): The incoming request
+            db (AsyncSession): Database session, used for the rate version in the read-time pricing mode
+            session_id (str): Session identifier
+
+        Returns:
+            str | None: The ETag, None if the session version is not available
+    """
+    session_version = await get_session_version(session_id)
+    if session_version is None:
+        return None
+    parts = [request.url.path, session_id, session_version, sorted(request.query_params.multi_items())]
+    if read_time_pricing():
+        current = await get_current_rate_version(db)
+        parts.append(current.id if current else None)
+    return make_etag(*parts)
+
+
+async def with_read_time_costs(db: AsyncSession, rows: list) -> list[tuple]:
+    """
+        Replaces the stored delivery cost of package rows with the cost calculated by their rate versions.
+
+        Args:
+            db (AsyncSession): Database session
+            rows (list): Rows with the type_id, weight and content_value_usd columns,
+                ending with the delivery_cost and rate_version_id columns
+
+        Returns:
+            list[tuple]: The rows without the rate_version_id column, ending with the calculated delivery cost
+    """
+    costs = await price_packages(db,
+                                 [row.type_id for row in rows],
+                                 [row.weight for row in rows],
+                                 [row.content_value_usd for row in rows],
+                                 [row.rate_version_id for row in rows])
+    return [(*row[:-2], cost) for row, cost in zip(rows, costs)]
+
+
+async def stream_packages(session_factory: sessionmaker, stmt: Select,
+                          export_format: str, read_time: bool = False) -> AsyncIterator[str]:
+    """
+        Yields exported packages chunk by chunk.
+
+        The stream uses its own database session, because the request session
+        is closed before the response body is sent. In the read-time pricing mode the rate versions
+        are loaded through a second session, since the connection of the first one is busy
+        with the server-side cursor until the stream ends.
+
+        Args:
+            session_factory (sessionmaker): Database session factory
+            stmt (Select): Statement selecting EXPORT_COLUMNS, and rate_version_id in the read-time pricing mode
+            export_format (str): 'ndjson' or 'csv'
+            read_time (bool): Whether the delivery cost is calculated from the rate versions
+
+        Yields:
+            str: Serialized rows
+    """
+    if export_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        yield buffer.getvalue()
+
+    # A session connects on its first query, so the pricing session costs nothing without read-time pricing
+    async with session_factory() as db, session_factory() as pricing_db:
+        result = await db.stream(stmt)
+        async for rows in result.partitions():
+            if read_time:
+                rows = await with_read_time_costs(pricing_db, rows)
+            if export_format == 'csv':
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerows(
+                    row if row[-1] is not None else (*row[:-1], 'Не рассчитано') for row in rows
+                )
+                yield buffer.getvalue()
+            else:
+                yield ''.join(
+                    json.dumps({**dict(zip(EXPORT_COLUMNS, row)),
+                                'delivery_cost': row[-1] if row[-1] is not None else 'Не рассчитано'},
+                               ensure_ascii=False) + '\n'
+                    for row in rows
+                )
+
+
+async def package_event_stream(session_id: str) -> AsyncIterator[str]:
+    """
+        Yields the session package events in the Server-Sent Events format.
+
+        Args:
+            session_id (str): Session identifier
+
+        Yields:
+            str: SSE messages and keep-alive comments
+    """
+    yield f'retry: {SSE_RETRY_MS}\n\n'
+    async with package_event_broker.subscribe(session_id) as queue:
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            yield f'event: {event["type"]}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n'
+
+
 @router.post('/package',
              response_model=PackageId,
              description='This method registers a package')
 async def register_package(package: PackageCreate,
-                           db: AsyncSession = Depends(get_db),
+                           db: AsyncSession = Depends(get_shard_db),
+                           catalog_db: AsyncSession = Depends(get_db),
                            session_id: str = Depends(get_session_id)) -> PackageId:
     """
         Registers a new package in the system.
 
-        Creates a package record associated with the current session.
-        The Initial delivery cost is set to None until calculated separately.
+        Creates a package record associated with the current session in the shard of the session.
+        The Initial delivery cost is set to None until calculated separately, the registration event
+        written to the outbox with the package lets the pricing consumer calculate it.
 
         Args:
             package (PackageCreate): Package creation payload containing:
@@ -34,15 +267,18 @@ async def register_package(package: PackageCreate,
                 - weight: float - Package weight in kg
                 - type_name: str - Package type name
                 - content_value_usd: float - Declared value in USD
-            db (AsyncSession): Database session dependency
+            db (AsyncSession): Database session of the shard of the session
+            catalog_db (AsyncSession): Session of the primary database holding the package type catalog
             session_id (str): Authenticated session identifier
 
         Returns:
             PackageId: The ID of the created package
+
+        Raises:
+            RuntimeError: If the shard allocates the package ids outside of its range
     """
     logger.info(f'Registering package for session id: {session_id}')
-    stmt = select(PackageTypeTable.id).where(PackageTypeTable.type_name == package.type_name.lower())
-    result = (await db.execute(stmt)).scalars().first()
+    result = await get_package_type_id(catalog_db, package.type_name.lower())
     if result:
         type_id = result
     else:
@@ -59,23 +295,39 @@ async def register_package(package: PackageCreate,
         delivery_cost=None
     )
     db.add(new_package)
+    await db.flush()
+    # A shard without its id range would allocate the ids of shard 0
+    if new_package.id >> PACKAGE_ID_SHARD_SHIFT != shard_for_session(session_id, shard_count()):
+        raise RuntimeError('The package ids of the shard are not initialized, run python -m tasks.reshard init')
+    deltas = SummaryDeltas()
+    deltas.add_package(session_id, type_id, package.content_value_usd)
+    await apply_summary_deltas(db, deltas)
+    await add_outbox_events(db, [{'session_id': session_id, 'type': PACKAGE_REGISTERED, 'package_id': new_package.id,
+                                  'type_id': type_id, 'weight': package.weight,
+                                  'content_value_usd': package.content_value_usd}])
     await db.commit()
     await db.refresh(new_package)
     package_id = new_package.id
+    await bump_session_versions([session_id])
     return PackageId(id=package_id)
 
 
 @router.get('/package_types',
             response_model=list[PackageType],
             description='This method returns package types and their ids')
-async def get_package_types(db: AsyncSession = Depends(get_db)) -> list[PackageType]:
+async def get_package_types(request: Request,
+                            response: Response,
+                            db: AsyncSession = Depends(get_read_db)) -> list[PackageType] | Response:
     """
         Retrieves all package types.
 
-        Returns a list of all package types with their identifiers.
+        Returns a list of all package types with their identifiers from the cached catalog.
+        The ETag is the catalog version, so a client with the current catalog gets 304.
 
         Args:
-            db (AsyncSession): Database session dependency
+            request (Request): The incoming request
+            response (Response): The response headers
+            db (AsyncSession): Read database session dependency, the replica if configured
 
         Returns:
             list[PackageType]: List of package types containing:
@@ -83,34 +335,43 @@ async def get_package_types(db: AsyncSession = Depends(get_db)) -> list[PackageT
                 - type_name: str - Type name
      """
     logger.info('Retrieving package types')
-    stmt = select(PackageTypeTable)
-    result = await db.execute(stmt)
-    package_type_list = result.scalars().all()
-    return package_type_list
+    types = await get_cached_package_types(db)
+    etag = make_etag('package_types', package_types_cache.package_types_version)
+    if etag_matches(request, etag):
+        return not_modified(etag, PACKAGE_TYPES_CACHE_CONTROL)
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = PACKAGE_TYPES_CACHE_CONTROL
+    return types
 
 
 @router.get('/packages',
             response_model=Page[PackageInfo],
             description='This method returns all user packages')
 async def get_package_info_by_session_id(
+        request: Request,
+        response: Response,
         type_name: str | None = Query(
             None,
             description='Filter by package type name'),
         has_delivery_cost: bool | None = Query(None,
                                                description='Filter by delivery cost calculation availability'),
-        db: AsyncSession = Depends(get_db),
+        db: AsyncSession = Depends(get_shard_read_db),
         session_id: str = Depends(get_session_id),
-        params: Params = Depends()) -> Page[PackageInfo]:
+        params: Params = Depends()) -> Page[PackageInfo] | Response:
     """
         Retrieves a paginated package list for the current session with filters.
 
+        A request with the ETag of the current page in If-None-Match gets 304 without querying the packages.
+
         Args:
+            request (Request): The incoming request
+            response (Response): The response headers
             type_name (str | None): Optional type name filter
             has_delivery_cost (bool | None): Filter for delivery cost status:
                 - True: Only packages with calculated cost
                 - False: Only packages without calculated cost
                 - None: All packages (default)
-            db (AsyncSession): Database session dependency
+            db (AsyncSession): Read database session of the shard of the session
             session_id (str): Authenticated session identifier
 
         Returns:
@@ -122,51 +383,371 @@ async def get_package_info_by_session_id(
     """
     logger.info(f'Getting packages for session id: {session_id}')
 
-    stmt = select(PackageTable.id, PackageTable.name, PackageTable.weight, PackageTable.type_id,
-                  PackageTypeTable.type_name, PackageTable.content_value_usd,
-                  case((PackageTable.delivery_cost.is_(None), literal_column('\'Не рассчитано\'')),
-                       else_=cast(PackageTable.delivery_cost, String)).label(
-                      'delivery_cost')).join(
-        PackageTypeTable, PackageTable.type_id == PackageTypeTable.id).where(PackageTable.session_id == session_id)
-    if type_name is not None:
-        stmt = stmt.where(PackageTypeTable.type_name == type_name)
-    if has_delivery_cost is not None:
-        if has_delivery_cost:
-            stmt = stmt.where(PackageTable.delivery_cost.is_not(None))
-        else:
-            stmt = stmt.where(PackageTable.delivery_cost.is_(None))
-    stmt = stmt.order_by(PackageTable.id)
-    return await apaginate(db, stmt, params)
+    etag = await session_packages_etag(request, db, session_id)
+    if etag is not None:
+        if etag_matches(request, etag):
+            return not_modified(etag, SESSION_DATA_CACHE_CONTROL)
+        if not is_replica_session(db):
+            response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = SESSION_DATA_CACHE_CONTROL
+
+    if read_time_pricing():
+        stmt = select(PackageTable.id, PackageTable.name, PackageTable.weight, PackageTable.type_id,
+                      PackageTypeTable.type_name, PackageTable.content_value_usd, PackageTable.delivery_cost,
+                      PackageTable.rate_version_id).join(
+            PackageTypeTable, PackageTable.type_id == PackageTypeTable.id)
+        priced = await priced_condition(db) if has_delivery_cost is not None else None
+        stmt = filter_session_packages(stmt, session_id, type_name, has_delivery_cost, priced)
+
+        async def transformer(rows):
+            return [
+                {**dict(zip(EXPORT_COLUMNS, row)), 'delivery_cost': row[-1] if row[-1] is not None else 'Не рассчитано'}
+                for row in await with_read_time_costs(db, rows)
+            ]
+
+        return await apaginate(db, stmt, params, transformer=transformer)
+
+    stmt, count_stmt = PACKAGE_LIST_STATEMENTS[(type_name is not None, has_delivery_cost)]
+    filters = {'session_id': session_id, 'type_name': type_name}
+    raw_params = params.to_raw_params().as_limit_offset()
+    total = (await db.execute(count_stmt, filters)).scalar()
+    rows = (await db.execute(stmt, {**filters, 'limit': raw_params.limit, 'offset': raw_params.offset})).all()
+    return create_page(rows, total=total, params=params)
+
+
+async def read_time_summary_costs(db: AsyncSession, session_id: str) -> dict[int, tuple[int, float]]:
+    """
+        Calculates how the read-time delivery costs of the session packages in the package table
+        change the priced count and the delivery cost total of the session summary.
+
+        The result depends only on the session packages and the latest rate version, so it is cached
+        under the ETag of the summary, which changes with both.
+
+        Args:
+            db (AsyncSession): Read database session of the shard of the session
+            session_id (str): Session identifier
+
+        Returns:
+            dict[int, tuple[int, float]]: The priced count and the delivery cost changes by package type
+    """
+    live_stmt = select(PackageTable.type_id, PackageTable.weight, PackageTable.content_value_usd,
+                       PackageTable.delivery_cost, PackageTable.rate_version_id).where(
+        PackageTable.session_id == session_id)
+    live_rows = (await db.execute(live_stmt)).all()
+    deltas = SummaryDeltas()
+    # The stored costs of the packages in the package table are replaced by the calculated ones
+    for (type_id, _, _, stored_cost, _), (*_, delivery_cost) in zip(
+            live_rows, await with_read_time_costs(db, live_rows)):
+        deltas.change_cost(session_id, type_id, stored_cost, delivery_cost)
+    return {type_id: (delta['priced_count'], delta['total_delivery_cost'])
+            for (_, type_id), delta in deltas.deltas.items()}
+
+
+@router.get('/packages/summary',
+            response_model=SessionSummary,
+            description='This method returns the package totals of the user')
+async def get_session_summary(request: Request,
+                              response: Response,
+                              db: AsyncSession = Depends(get_shard_read_db),
+                              catalog_db: AsyncSession = Depends(get_db),
+                              session_id: str = Depends(get_session_id)) -> SessionSummary | Response:
+    """
+        Retrieves the package count, the declared value and the delivery cost totals of the current session.
+
+        The totals are read from the session summary, which is updated by the package registration
+        and the delivery cost recalculation, so the response time does not depend on the number of packages.
+        Archived packages are included. In the read-time pricing mode the delivery cost of the packages
+        in the package table is calculated from their rate versions instead, once per session
+        and rate version, see read_time_summary_costs().
+
+        Args:
+            request (Request): The incoming request
+            response (Response): The response headers
+            db (AsyncSession): Read database session of the shard of the session
+            catalog_db (AsyncSession): Session of the primary database holding the package type catalog
+            session_id (str): Authenticated session identifier
+
+        Returns:
+            SessionSummary: The session totals and the totals by package type
+    """
+    logger.info(f'Getting package summary for session id: {session_id}')
+    etag = await session_packages_etag(request, db, session_id)
+    if etag is not None:
+        if etag_matches(request, etag):
+            return not_modified(etag, SESSION_DATA_CACHE_CONTROL)
+        if not is_replica_session(db):
+            response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = SESSION_DATA_CACHE_CONTROL
+    rows = (await db.execute(SESSION_SUMMARY_STATEMENT, {'session_id': session_id})).scalars().all()
+    type_names = {package_type.id: package_type.type_name
+                  for package_type in await get_cached_package_types(catalog_db)}
+    priced_counts = {row.type_id: row.priced_count for row in rows}
+    delivery_costs = {row.type_id: float(row.total_delivery_cost) for row in rows}
+    if read_time_pricing():
+        costs = await get_summary_costs(etag) if etag is not None else None
+        if costs is None:
+            costs = await read_time_summary_costs(db, session_id)
+            # A lagging replica may return the packages of an older version than the one in the ETag
+            if etag is not None and not is_replica_session(db):
+                await cache_summary_costs(etag, costs)
+        for type_id, (priced_count, delivery_cost) in costs.items():
+            priced_counts[type_id] = priced_counts.get(type_id, 0) + priced_count
+            delivery_costs[type_id] = delivery_costs.get(type_id, 0) + delivery_cost
+    by_type = [
+        PackageTypeSummary(type_id=row.type_id,
+                           type_name=type_names.get(row.type_id, ''),
+                           package_count=row.package_count,
+                           total_value_usd=row.total_value_usd,
+                           priced_count=priced_counts[row.type_id],
+                           total_delivery_cost=round(delivery_costs[row.type_id], 2))
+        for row in rows if row.package_count
+    ]
+    return SessionSummary(package_count=sum(item.package_count for item in by_type),
+                          total_value_usd=round(sum(item.total_value_usd for item in by_type), 2),
+                          priced_count=sum(item.priced_count for item in by_type),
+                          total_delivery_cost=round(sum(item.total_delivery_cost for item in by_type), 2),
+                          by_type=by_type)
+
+
+@router.get('/packages/events',
+            response_class=StreamingResponse,
+            description='This method streams package events of the user as Server-Sent Events')
+async def stream_package_events(session_id: str = Depends(get_session_id)) -> StreamingResponse:
+    """
+        Streams the events of the current session packages.
+
+        Sends the 'delivery_cost_calculated' event when the delivery cost of a package is calculated
+        and the 'shipping_company_assigned' event when a shipping company is assigned to a package,
+        so that the clients do not have to poll the package info. The events are delivered through
+        Redis pub/sub, so any worker can serve the stream. A comment is sent every
+        SSE_HEARTBEAT_INTERVAL seconds to keep idle connections open.
+
+        Args:
+            session_id (str): Authenticated session identifier
+
+        Returns:
+            StreamingResponse: The text/event-stream response
+    """
+    logger.info(f'Streaming package events for session id: {session_id}')
+    return StreamingResponse(
+        package_event_stream(session_id),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@router.get('/packages/export',
+            response_class=StreamingResponse,
+            description='This method streams all user packages as NDJSON or CSV')
+async def export_packages_by_session_id(
+        export_format: Literal['ndjson', 'csv'] = Query('ndjson', alias='format', description='Export format'),
+        type_name: str | None = Query(
+            None,
+            description='Filter by package type name'),
+        has_delivery_cost: bool | None = Query(None,
+                                               description='Filter by delivery cost calculation availability'),
+        session_factory: sessionmaker = Depends(get_shard_session_factory),
+        session_id: str = Depends(get_session_id)) -> StreamingResponse:
+    """
+        Streams the package list for the current session with the same filters as the paginated list.
+
+        Rows are read through a server-side cursor and sent in chunks of EXPORT_CHUNK_SIZE rows,
+        so the memory usage does not depend on the number of exported packages.
+
+        Args:
+            export_format (str): 'ndjson' (default) or 'csv'
+            type_name (str | None): Optional type name filter
+            has_delivery_cost (bool | None): Filter for delivery cost status
+            session_factory (sessionmaker): Factory of the database session used while streaming
+            session_id (str): Authenticated session identifier
+
+        Returns:
+            StreamingResponse: The NDJSON or CSV stream of packages
+    """
+    logger.info(f'Exporting packages for session id: {session_id} as {export_format}')
+
+    read_time = read_time_pricing()
+    columns = [PackageTable.id, PackageTable.name, PackageTable.weight, PackageTable.type_id,
+               PackageTypeTable.type_name, PackageTable.content_value_usd, PackageTable.delivery_cost]
+    priced = None
+    if read_time:
+        columns.append(PackageTable.rate_version_id)
+        if has_delivery_cost is not None:
+            async with session_factory() as db:
+                priced = await priced_condition(db)
+    stmt = select(*columns).join(PackageTypeTable, PackageTable.type_id == PackageTypeTable.id)
+    stmt = filter_session_packages(stmt, session_id, type_name, has_delivery_cost, priced)
+    stmt = stmt.execution_options(yield_per=EXPORT_CHUNK_SIZE)
+
+    return StreamingResponse(
+        stream_packages(session_factory, stmt, export_format, read_time),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={'Content-Disposition': f'attachment; filename="packages.{export_format}"'}
+    )
+
+
+async def load_package_details(db: AsyncSession, package_ids: list[int],
+                               type_names: dict[int, str]) -> dict[int, list]:
+    """
+        Loads the details of the packages, looking up the archive for the ids missing in the package table.
+
+        The type names are taken from the package type catalog instead of joining the type table.
+
+        Args:
+            db (AsyncSession): Database session of the shard holding the packages
+            package_ids (list[int]): Package identifiers
+            type_names (dict[int, str]): Package type names by type id
+
+        Returns:
+            dict[int, list]: The name, weight, type name, declared value and delivery cost of the found packages
+                by their ids, 'Не рассчитано' stands for the missing delivery cost
+    """
+    read_time = read_time_pricing()
+    rows = (await db.execute(PACKAGE_DETAILS_STATEMENTS[read_time], {'package_ids': package_ids})).all()
+    if read_time and rows:
+        rows = await with_read_time_costs(db, rows)
+
+    found = {row[0] for row in rows}
+    missing = [package_id for package_id in package_ids if package_id not in found]
+    if missing:
+        rows += (await db.execute(ARCHIVED_PACKAGE_DETAILS_STATEMENT, {'package_ids': missing})).all()
+    return {
+        package_id: [name, weight, type_names.get(type_id), content_value_usd,
+                     delivery_cost if delivery_cost is not None else 'Не рассчитано']
+        for package_id, name, weight, type_id, content_value_usd, delivery_cost in rows
+    }
+
+
+def group_by_home_shard(package_ids: list[int], shards: int) -> dict[int, list[int]]:
+    """
+        Groups the package ids by the shard that allocated them.
+    """
+    groups = defaultdict(list)
+    for package_id in package_ids:
+        groups[package_home_shard(package_id, shards)].append(package_id)
+    return groups
+
+
+async def search_shards(db: AsyncSession, package_ids: list[int], search) -> dict[int, dict]:
+    """
+        Runs a search of packages on the shards holding them.
+
+        The ids are searched on the shards that allocated them, the ids not found there,
+        e.g. moved by resharding, on all the other shards. The shards are searched concurrently.
+
+        Args:
+            db (AsyncSession): Session of the primary database, used for shard 0
+            package_ids (list[int]): Package identifiers
+            search (Callable): Coroutine function of a shard session and ids, returning a dict by the found ids
+
+        Returns:
+            dict[int, dict]: The search results of every shard by shard index, without the empty ones
+    """
+    shards = shard_count()
+
+    async def search_shard(shard: int, ids: list[int]) -> tuple[int, dict]:
+        async with shard_session(shard, db) as session:
+            return shard, await search(session, ids)
+
+    groups = group_by_home_shard(package_ids, shards)
+    results = dict(await asyncio.gather(*(search_shard(shard, ids) for shard, ids in groups.items())))
+    found = {package_id for result in results.values() for package_id in result}
+    missing = [package_id for package_id in package_ids if package_id not in found]
+    if missing and shards > 1:
+        others = {shard: [package_id for package_id in missing if package_home_shard(package_id, shards) != shard]
+                  for shard in range(shards)}
+        for shard, result in await asyncio.gather(*(search_shard(shard, ids) for shard, ids in others.items() if ids)):
+            results[shard] = {**results.get(shard, {}), **result}
+    return {shard: result for shard, result in results.items() if result}
+
+
+async def find_package_details(db: AsyncSession, package_ids: list[int]) -> dict[int, list]:
+    """
+        Loads the details of the packages from the shards holding them.
+
+        The package type catalog is read from the primary database, the shards are only queried
+        for the package rows.
+
+        Args:
+            db (AsyncSession): Session of the primary database
+            package_ids (list[int]): Package identifiers
+
+        Returns:
+            dict[int, list]: The package details by the found ids, see load_package_details()
+    """
+    type_names = {package_type.id: package_type.type_name for package_type in await get_cached_package_types(db)}
+    if shard_count() == 1:
+        return await load_package_details(db, package_ids, type_names)
+
+    async def search(session: AsyncSession, ids: list[int]) -> dict[int, list]:
+        return await load_package_details(session, ids, type_names)
+
+    results = await search_shards(db, package_ids, search)
+    return {package_id: details for result in results.values() for package_id, details in result.items()}
+
+
+async def locate_packages(db: AsyncSession, package_ids: list[int]) -> dict[int, list[int]]:
+    """
+        Finds the shards of the packages in the package table.
+
+        Args:
+            db (AsyncSession): Session of the primary database
+            package_ids (list[int]): Package identifiers
+
+        Returns:
+            dict[int, list[int]]: The ids by the shard holding them, the ids found nowhere by the shard
+                that allocated them
+    """
+    shards = shard_count()
+    if shards == 1:
+        return {0: package_ids}
+
+    async def search(session: AsyncSession, ids: list[int]) -> dict[int, None]:
+        found = (await session.execute(PACKAGE_IDS_STATEMENT, {'package_ids': ids})).scalars().all()
+        # The transaction is ended, so that the caller can begin its own
+        await session.commit()
+        return dict.fromkeys(found)
+
+    located = {package_id: shard
+               for shard, result in (await search_shards(db, package_ids, search)).items() for package_id in result}
+    groups = defaultdict(list)
+    for package_id in package_ids:
+        groups[located.get(package_id, package_home_shard(package_id, shards))].append(package_id)
+    return groups
 
 
 @router.get('/package/{package_id}',
             response_model=PackageInfoNoId | dict[str, str],
             description='This method returns package info by id')
-async def get_package_info_by_id(package_id: int = Path(...),
-                                 db: AsyncSession = Depends(get_db)) -> PackageInfoNoId | dict[str, str]:
+async def get_package_info_by_id(request: Request,
+                                 response: Response,
+                                 package_id: int = Path(...),
+                                 db: AsyncSession = Depends(get_read_db)) -> PackageInfoNoId | dict[str, str] | Response:
     """
         Retrieves package details by package ID.
 
-        Returns full package information.
+        Returns full package information. Packages moved to the archive are looked up
+        there when the package is not found in the package table. The package is not bound
+        to the requesting session, so its ETag is derived from the content and a matching
+        If-None-Match only saves sending the body.
 
         Args:
+            request (Request): The incoming request
+            response (Response): The response headers
             package_id (int): Package identifier
-            db (AsyncSession): Database session dependency
+            db (AsyncSession): Read session of the primary database, the replica if configured
 
         Returns:
             PackageInfoNoId | dict: Either package details object or the JSON with the message 'No package for id <id>'
     """
     logger.info(f'Getting package by package id: {package_id}')
-    stmt = select(PackageTable.name, PackageTable.weight, PackageTypeTable.type_name,
-                  PackageTable.content_value_usd,
-                  PackageTable.delivery_cost).join(PackageTypeTable,
-                                                   PackageTable.type_id == PackageTypeTable.id).where(
-        PackageTable.id == package_id)
-    result = (await db.execute(stmt)).first()
-    if result:
-        package = list(result)
-        if package[-1] is None:
-            package[-1] = 'Не рассчитано'
+    package = (await find_package_details(db, [package_id])).get(package_id)
+    if package:
+        etag = make_etag('package', package_id, package)
+        if etag_matches(request, etag):
+            return not_modified(etag, SESSION_DATA_CACHE_CONTROL)
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = SESSION_DATA_CACHE_CONTROL
         return PackageInfoNoId(name=package[0],
                                weight=package[1],
                                type_name=package[2],
@@ -176,6 +757,92 @@ async def get_package_info_by_id(package_id: int = Path(...),
         return {'message': f'No package for id {package_id}'}
 
 
+@router.post('/packages/lookup',
+             response_model=PackageLookupResult,
+             description='This method returns the info of several packages by their ids')
+async def lookup_packages(body: PackageLookup,
+                          db: AsyncSession = Depends(get_read_db)) -> PackageLookupResult:
+    """
+        Retrieves the details of several packages with one query.
+
+        Packages moved to the archive are looked up there with one more query.
+
+        Args:
+            body (PackageLookup): Package identifiers
+            db (AsyncSession): Read session of the primary database, the replica if configured
+
+        Returns:
+            PackageLookupResult: The details of the found packages by their ids and the ids without a package
+    """
+    package_ids = list(dict.fromkeys(body.package_ids))
+    logger.info(f'Looking up {len(package_ids)} packages')
+    packages = await find_package_details(db, package_ids)
+    return PackageLookupResult(
+        packages={package_id: PackageInfoNoId(name=package[0],
+                                              weight=package[1],
+                                              type_name=package[2],
+                                              content_value_usd=package[3],
+                                              delivery_cost=package[4])
+                  for package_id in package_ids if (package := packages.get(package_id))},
+        not_found=[package_id for package_id in package_ids if package_id not in packages]
+    )
+
+
+async def assignment_values(db: AsyncSession, shipping_company_id: int) -> dict:
+    """
+        Builds the column values of a package assigned to a shipping company.
+
+        In the read-time pricing mode the package is bound to the latest rate version,
+        so that its cost no longer follows the rate changes.
+
+        Args:
+            db (AsyncSession): Database session
+            shipping_company_id (int): ID of the shipping company
+
+        Returns:
+            dict: The values of the package update
+    """
+    values = {'shipping_company_id': shipping_company_id, 'last_activity_at': func.now()}
+    if read_time_pricing():
+        current = await get_current_rate_version(db)
+        values['rate_version_id'] = current.id if current else None
+    return values
+
+
+async def claim_packages(db: AsyncSession, package_ids: list[int], values: dict) -> list[int]:
+    """
+        Assigns the packages without a shipping company.
+
+        All the packages are claimed by one statement. When some of them were claimed concurrently,
+        which the number of affected rows shows, the statement is rolled back to a savepoint
+        and the packages are claimed one by one to find out which.
+
+        Args:
+            db (AsyncSession): Database session in a transaction
+            package_ids (list[int]): Ids of the packages having no shipping company when read
+            values (dict): The column values of an assigned package
+
+        Returns:
+            list[int]: Ids of the packages assigned by this call
+    """
+    def claim(ids: list[int]):
+        return (
+            update(PackageTable)
+            .where(PackageTable.id.in_(ids), PackageTable.shipping_company_id.is_(None))
+            .values(values)
+            .execution_options(synchronize_session=False)
+        )
+
+    if not package_ids:
+        return package_ids
+    savepoint = await db.begin_nested()
+    if (await db.execute(claim(package_ids))).rowcount == len(package_ids):
+        await savepoint.commit()
+        return package_ids
+    await savepoint.rollback()
+    return [package_id for package_id in package_ids if (await db.execute(claim([package_id]))).rowcount]
+
+
 @router.post('/package/{package_id}/{shipping_company_id}',
              response_model=dict[str, str] | None,
              description='This method tries to assign shipping company id to the registered package')
@@ -188,6 +855,7 @@ async def assign_shipping_company_id(package_id: int = Path(...),
     This endpoint assigns a specified shipping company to a package identified by its ID.
     It performs validation to ensure that the shipping company ID is a positive integer,
     the package exists, and it hasn't already been assigned to a different company.
+    In the read-time pricing mode the package is bound to the latest rate version.
 
     Parameters:
     - package_id (int): ID of the package to update.
@@ -210,27 +878,96 @@ async def assign_shipping_company_id(package_id: int = Path(...),
             status_code=status.HTTP_400_BAD_REQUEST,
             detail='Shipping company ID must be a positive integer'
         )
-    async with db.begin():
-        stmt = (
-            select(PackageTable)
-            .where(PackageTable.id == package_id)
-            .with_for_update()
-        )
-        package = (await db.execute(stmt)).scalar_one_or_none()
-
-        if not package:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail='Package not found'
+    shard = next(iter(await locate_packages(db, [package_id])))
+    async with shard_session(shard, db) as shard_db:
+        async with shard_db.begin():
+            # The condition makes the claim atomic without locking the row for a read
+            result = await shard_db.execute(
+                update(PackageTable)
+                .where(PackageTable.id == package_id, PackageTable.shipping_company_id.is_(None))
+                .values(await assignment_values(shard_db, shipping_company_id))
+                .execution_options(synchronize_session=False)
             )
+            if result.rowcount == 0:
+                exists = (await shard_db.execute(select(PackageTable.id).where(PackageTable.id == package_id))).scalar()
+                if exists is None:
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail='Package not found'
+                    )
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail='Package already assigned to another company'
+                )
+            session_id = (await shard_db.execute(
+                select(PackageTable.session_id).where(PackageTable.id == package_id)
+            )).scalar()
+            event = {'session_id': session_id, 'type': SHIPPING_COMPANY_ASSIGNED,
+                     'package_id': package_id, 'shipping_company_id': shipping_company_id}
+            await add_outbox_events(shard_db, [event])
+    await bump_session_versions([session_id])
+    await publish_package_events([event])
+    return {'message': 'Package successfully assigned to the shipping company'}
 
-        if package.shipping_company_id is not None:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail='Package already assigned to another company'
-            )
 
-        # Обновляем значение
-        package.shipping_company_id = shipping_company_id
-        await db.commit()
-    return {'message': 'Package successfully assigned to the shipping company'}
+@router.post('/shipping_company/{shipping_company_id}/packages',
+             response_model=ShippingCompanyAssignment,
+             description='This method assigns the shipping company to many registered packages')
+async def assign_shipping_company_packages(body: ShippingCompanyPackages,
+                                           shipping_company_id: int = Path(...),
+                                           db: AsyncSession = Depends(get_db)) -> ShippingCompanyAssignment:
+    """
+        Assigns a shipping company to the packages that have none.
+
+        The ids are processed in chunks of BULK_ASSIGN_CHUNK_SIZE, each in its own transaction on every shard
+        holding its packages, of two statements: one reading the state of the packages and one claiming the free ones.
+
+        Args:
+            body (ShippingCompanyPackages): Ids of the packages
+            shipping_company_id (int): ID of the shipping company
+            db (AsyncSession): Database session
+
+        Returns:
+            ShippingCompanyAssignment: The ids assigned by this request, the ids assigned before
+                and the ids without a package
+
+        Raises:
+            HTTPException: 400 error if the shipping company ID is not a positive integer
+    """
+    if shipping_company_id <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Shipping company ID must be a positive integer'
+        )
+    package_ids = list(dict.fromkeys(body.package_ids))
+    logger.info(f'Assigning the shipping company id {shipping_company_id} to {len(package_ids)} packages')
+    report = ShippingCompanyAssignment(assigned=[], already_assigned=[], not_found=[])
+    events = []
+    for start in range(0, len(package_ids), BULK_ASSIGN_CHUNK_SIZE):
+        chunk = package_ids[start:start + BULK_ASSIGN_CHUNK_SIZE]
+        sessions, assigned = {}, set()
+        for shard, ids in (await locate_packages(db, chunk)).items():
+            async with shard_session(shard, db) as shard_db, shard_db.begin():
+                rows = (await shard_db.execute(
+                    select(PackageTable.id, PackageTable.session_id, PackageTable.shipping_company_id)
+                    .where(PackageTable.id.in_(ids))
+                )).all()
+                sessions.update((row.id, row.session_id) for row in rows)
+                free = [row.id for row in rows if row.shipping_company_id is None]
+                claimed = await claim_packages(shard_db, free, await assignment_values(shard_db, shipping_company_id))
+                claimed_events = [{'session_id': sessions[package_id], 'type': SHIPPING_COMPANY_ASSIGNED,
+                                   'package_id': package_id, 'shipping_company_id': shipping_company_id}
+                                  for package_id in claimed]
+                await add_outbox_events(shard_db, claimed_events)
+                assigned.update(claimed)
+                events.extend(claimed_events)
+        for package_id in chunk:
+            if package_id not in sessions:
+                report.not_found.append(package_id)
+            elif package_id in assigned:
+                report.assigned.append(package_id)
+            else:
+                report.already_assigned.append(package_id)
+    await bump_session_versions(event['session_id'] for event in events)
+    await publish_package_events(events)
+    return report
@@ -0,0 +1,40 @@
+import logging
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix='/api/v1/health', tags=['health'])
+
+
+@router.get('/live', description='This method reports that the process is up')
+async def liveness() -> dict[str, str]:
+    """
+        Liveness probe, responds as soon as the application accepts requests.
+
+        Returns:
+            dict[str, str]: The status message
+    """
+    return {'status': 'alive'}
+
+
+@router.get('/ready', description='This method reports whether the application finished warming up')
+async def readiness(request: Request) -> JSONResponse:
+    """
+        Readiness probe, responds with 200 only after the startup warm-up succeeded.
+
+        Args:
+            request (Request): The incoming request
+
+        Returns:
+            JSONResponse: The status and the measured startup report,
+                with the 503 status code while the application is not ready
+    """
+    ready = getattr(request.app.state, 'ready', False)
+    body = {
+        'status': 'ready' if ready else 'not ready',
+        'startup': getattr(request.app.state, 'startup_report', None)
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
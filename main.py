@@ -1,48 +1,91 @@
 import os
+import time
 from contextlib import asynccontextmanager
 
 import asyncio
-import uvicorn
 from fastapi import FastAPI
 from fastapi_pagination import add_pagination
-from environs import Env
 
+from middleware.compression import add_compression
+from middleware.idempotency import IdempotencyMiddleware
+from middleware.rate_limit import RateLimitMiddleware
 from middleware.session import SessionMiddleware
-from endpoints import deliveries, admin
-from tasks.usd_rate_task import usd_rate_task as urt
-from tasks.calculate_delivery_cost_task import calculate_delivery_cost_task as cdct
-
-env = Env()
+from endpoints import deliveries, admin, health
+from utils.session import init_engine, dispose_engine
+from tasks.background import start_background_tasks, stop_background_tasks
+from utils.startup import warm_up, is_ready
 
 
 def read_env_from_path(path: str):
+    from environs import Env
+
+    env = Env()
     env.read_env(path=path, recurse=True)
+    return env
+
+
+# The process role: 'api' serves requests only, 'worker' runs the background tasks only
+# (see serve.py), 'all' does both and is used in development
+SERVICE_ROLE = os.environ.get('SERVICE_ROLE', 'all')
+
+background_tasks = []
+warm_up_task = None
 
+# Pause between the warm-up attempts while the application is not ready
+WARM_UP_RETRY_INTERVAL = 5
+# Maximum time the startup waits for the warm-up before accepting requests
+WARM_UP_TIMEOUT = 30
 
-usd_rate_task = None
-calculate_delivery_cost_task = None
+
+async def warm_up_until_ready(app: FastAPI):
+    """
+        Repeats the warm-up until the required steps succeed and marks the application as ready.
+
+        Args:
+            app (FastAPI): The application
+    """
+    started = time.perf_counter()
+    while True:
+        report = await warm_up()
+        app.state.startup_report = {'steps': report, 'seconds': round(time.perf_counter() - started, 4)}
+        if is_ready(report):
+            app.state.ready = True
+            return
+        await asyncio.sleep(WARM_UP_RETRY_INTERVAL)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    app.state.ready = False
+    app.state.startup_report = None
     if os.environ.get("TESTING") == "True":
+        app.state.ready = True
         yield
         return
 
-    global usd_rate_task, calculate_delivery_cost_task
-    usd_rate_task = asyncio.create_task(urt())
-    calculate_delivery_cost_task = asyncio.create_task(cdct())
+    from redis_db.package_events import package_event_broker
+    from redis_db.redis_setup import close_redis_client
+    from redis_db.versions import stop_retrying_bumps
+    from utils.cbr_client import close_cbr_client
+
+    global background_tasks, warm_up_task
+    init_engine()
+    warm_up_task = asyncio.create_task(warm_up_until_ready(app))
+    # Serving starts after the warm-up, or after WARM_UP_TIMEOUT with the warm-up going on in the background
+    await asyncio.wait([warm_up_task], timeout=WARM_UP_TIMEOUT)
+    if SERVICE_ROLE == 'all':
+        background_tasks = start_background_tasks()
 
     try:
         yield
     finally:
-        usd_rate_task.cancel()
-        calculate_delivery_cost_task.cancel()
-        await asyncio.gather(
-            usd_rate_task,
-            calculate_delivery_cost_task,
-            return_exceptions=True
-        )
+        app.state.ready = False
+        await stop_background_tasks([warm_up_task, *background_tasks])
+        await package_event_broker.close()
+        await close_cbr_client()
+        await stop_retrying_bumps()
+        await close_redis_client()
+        await dispose_engine()
 
 
 app = FastAPI(
@@ -53,14 +96,23 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# The last added middleware runs first, so the session id is resolved before the rate limiting
+# and the idempotency check
+app.add_middleware(IdempotencyMiddleware)
+app.add_middleware(RateLimitMiddleware)
 app.add_middleware(SessionMiddleware)
+# Outermost, so that the stored idempotent responses are not compressed
+add_compression(app)
 add_pagination(app)
 
 app.include_router(deliveries.router)
 app.include_router(admin.router)
+app.include_router(health.router)
 
 if __name__ == '__main__':
-    read_env_from_path(os.path.join(os.getcwd(), '.env'))
+    import uvicorn
+
+    env = read_env_from_path(os.path.join(os.getcwd(), '.env'))
     SERVER_HOST = env.str('SERVER_HOST')
     SERVER_PORT = env.int('SERVER_PORT')
     uvicorn.run('main:app', port=SERVER_PORT, host=SERVER_HOST, reload=True, log_level='info')
@@ -0,0 +1,32 @@
+import os
+
+from fastapi import FastAPI
+from starlette.middleware.gzip import GZipMiddleware
+
+try:
+    # Optional, brotli is used when brotli-asgi is installed
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+# Smaller responses are sent as is, compressing them costs more than it saves
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+# Streams which have to reach the client as soon as an event is written
+UNCOMPRESSED_PATHS = ['^/api/v1/packages/events$']
+
+
+def add_compression(app: FastAPI):
+    """
+        Compresses the responses larger than COMPRESSION_MIN_SIZE bytes.
+
+        Brotli is used for the clients accepting it if brotli-asgi is installed, gzip otherwise.
+
+        Args:
+            app (FastAPI): The application
+    """
+    if BrotliMiddleware is not None:
+        app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_SIZE, gzip_fallback=True,
+                           excluded_handlers=UNCOMPRESSED_PATHS)
+    else:
+        # text/event-stream responses are not compressed by GZipMiddleware
+        app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
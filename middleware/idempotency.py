@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import os
+import re
+
+import asyncio
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import Response
+
+from redis_db.redis_setup import get_redis_client, redis_call
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+# Time the first result is returned for the retries with the same key
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', 24 * 3600))
+# Time a request in flight holds its key, the key is released if the request never completes
+IDEMPOTENCY_LOCK_TTL = int(os.getenv('IDEMPOTENCY_LOCK_TTL', 30))
+# Maximum time a duplicate waits for the result of the request in flight
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv('IDEMPOTENCY_WAIT_TIMEOUT', 10))
+IDEMPOTENCY_POLL_INTERVAL = 0.05
+
+# Requests accepting the Idempotency-Key header
+IDEMPOTENT_ROUTES = [
+    ('POST', re.compile(r'^/api/v1/package$')),
+    ('POST', re.compile(r'^/api/v1/package/\d+/-?\d+$')),
+    ('POST', re.compile(r'^/api/v1/shipping_company/-?\d+/packages$'))
+]
+
+
+class IdempotencyMiddleware(BaseHTTPMiddleware):
+    """
+        Middleware returning the first result of a request to the retries with the same Idempotency-Key.
+
+        The key is scoped by the session and the route. The first request reserves the key in Redis,
+        and its response is stored for IDEMPOTENCY_TTL seconds unless it is a server error. A retry gets
+        the stored response without reaching the handler, a duplicate arriving while the first request
+        is in flight waits for its result. Reusing a key with a different body is rejected with 422.
+
+        When Redis is not available, requests are processed without the idempotency check.
+
+        Must be added before SessionMiddleware, which resolves the session id.
+    """
+    async def dispatch(self, request: Request, call_next):
+        """
+            Processes the request once per idempotency key.
+
+            Args:
+                request (Request): The incoming request
+                call_next (Callable): The next middleware/handler in a chain
+
+            Returns:
+                Response: The handler response or the stored response of the first request
+        """
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+        if idempotency_key is None or not self.is_idempotent_route(request):
+            return await call_next(request)
+        if not idempotency_key or len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return JSONResponse({'detail': f'{IDEMPOTENCY_HEADER} must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} '
+                                           f'characters long'}, status_code=400)
+
+        session_id = getattr(request.state, 'session_id', None) or 'anonymous'
+        key = f'idempotency:{session_id}:{request.method}:{request.url.path}:{idempotency_key}'
+        fingerprint = hashlib.sha256(await request.body()).hexdigest()
+
+        try:
+            redis_client = await get_redis_client()
+            reserved = await redis_call(redis_client.set(
+                key, json.dumps({'state': 'in_progress', 'fingerprint': fingerprint}),
+                nx=True, ex=IDEMPOTENCY_LOCK_TTL
+            ))
+        except Exception as ex:
+            logger.warning(f'Processing the request without the idempotency check: {str(ex) or type(ex).__name__}')
+            return await call_next(request)
+
+        if not reserved:
+            return await self.replay(redis_client, key, fingerprint)
+
+        try:
+            response = await call_next(request)
+            body = b''.join([chunk async for chunk in response.body_iterator])
+        except BaseException:
+            await self.release(redis_client, key)
+            raise
+
+        if response.status_code >= 500:
+            # Server errors are not stored, so that the retry is processed again
+            await self.release(redis_client, key)
+        else:
+            try:
+                await redis_call(redis_client.set(key, json.dumps({
+                    'state': 'done',
+                    'fingerprint': fingerprint,
+                    'status_code': response.status_code,
+                    'media_type': response.media_type or response.headers.get('content-type'),
+                    'body': body.decode()
+                }), ex=IDEMPOTENCY_TTL))
+            except Exception as ex:
+                logger.error(f'Failed to store the idempotent response: {str(ex) or type(ex).__name__}')
+
+        return Response(content=body, status_code=response.status_code,
+                        headers=dict(response.headers), media_type=response.media_type)
+
+    async def replay(self, redis_client, key: str, fingerprint: str) -> Response:
+        """
+            Returns the stored response of the first request, waiting for it while it is in flight.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + IDEMPOTENCY_WAIT_TIMEOUT
+        while True:
+            try:
+                stored = await redis_call(redis_client.get(key))
+            except Exception as ex:
+                logger.error(f'Failed to read the idempotent response: {str(ex) or type(ex).__name__}')
+                stored = None
+            if stored is None:
+                # The first request failed, so the client can retry with the same key
+                return JSONResponse({'detail': 'The request with this idempotency key failed, retry it'},
+                                    status_code=409)
+            stored = json.loads(stored)
+            if stored['fingerprint'] != fingerprint:
+                return JSONResponse({'detail': f'{IDEMPOTENCY_HEADER} was already used with a different request'},
+                                    status_code=422)
+            if stored['state'] == 'done':
+                return Response(content=stored['body'], status_code=stored['status_code'],
+                                media_type=stored['media_type'], headers={'Idempotent-Replayed': 'true'})
+            if loop.time() >= deadline:
+                return JSONResponse({'detail': 'The request with this idempotency key is still in progress'},
+                                    status_code=409, headers={'Retry-After': '1'})
+            await asyncio.sleep(IDEMPOTENCY_POLL_INTERVAL)
+
+    @staticmethod
+    async def release(redis_client, key: str):
+        """
+            Removes the reservation of the key.
+        """
+        try:
+            await redis_call(redis_client.delete(key))
+        except Exception as ex:
+            logger.error(f'Failed to release the idempotency key: {str(ex) or type(ex).__name__}')
+
+    @staticmethod
+    def is_idempotent_route(request: Request) -> bool:
+        """
+            Checks whether the request accepts the Idempotency-Key header.
+        """
+        return any(request.method == method and pattern.match(request.url.path)
+                   for method, pattern in IDEMPOTENT_ROUTES)
@@ -0,0 +1,219 @@
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+
+import asyncio
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from redis_db.redis_setup import get_redis_client
+from utils.session import get_checkout_wait
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True') == 'True'
+# Sustained number of requests per second allowed for one session
+RATE_LIMIT_RATE = float(os.getenv('RATE_LIMIT_RATE', 20))
+# Number of requests a session can send at once after being idle
+RATE_LIMIT_BURST = float(os.getenv('RATE_LIMIT_BURST', 40))
+# Maximum time spent waiting for Redis before falling back to the in-process bucket
+RATE_LIMIT_REDIS_TIMEOUT = float(os.getenv('RATE_LIMIT_REDIS_TIMEOUT', 0.05))
+# Average pool checkout wait in seconds after which all the limited requests are shed
+LOAD_SHED_CHECKOUT_WAIT = float(os.getenv('LOAD_SHED_CHECKOUT_WAIT', 0.5))
+LOAD_SHED_RETRY_AFTER = int(os.getenv('LOAD_SHED_RETRY_AFTER', 1))
+# Maximum number of sessions tracked by one process
+LOCAL_SESSIONS_LIMIT = 10000
+
+EXEMPT_PATH_PREFIXES = ('/api/v1/health', '/api/v1/docs', '/api/v1/redocs', '/api/v1/openapi.json')
+
+# Refills the bucket according to the Redis clock and takes the requested tokens if there are enough.
+# Returns the allow flag and the number of seconds until enough tokens are available
+TOKEN_BUCKET_SCRIPT = '''
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(retry_after)}
+'''
+
+
+class TokenBucket:
+    """
+        In-process token bucket, used when Redis is not available.
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def consume(self, cost: float = 1) -> tuple[bool, float]:
+        """
+            Takes the tokens if there are enough.
+
+            Args:
+                cost (float): Number of tokens
+
+            Returns:
+                tuple[bool, float]: The allow flag and the number of seconds until enough tokens are available
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True, 0.0
+        return False, (cost - self.tokens) / self.rate
+
+
+class RateLimitMiddleware(BaseHTTPMiddleware):
+    """
+        Middleware for the per-session admission control.
+
+        Every session, and every client address sending requests without a session, gets a token
+        bucket evaluated atomically in Redis, so the limit is shared by all the worker processes.
+        Sessions over the limit are remembered in-process until their retry time, so a flooding
+        client is rejected without calls to Redis. When Redis does not respond in time, an in-process
+        bucket is used instead.
+
+        All the limited requests are shed while the average pool checkout wait is over
+        LOAD_SHED_CHECKOUT_WAIT, so that the pool is not exhausted for everyone.
+
+        Must be added before SessionMiddleware, which resolves the session id.
+    """
+    def __init__(self, app,
+                 rate: float = RATE_LIMIT_RATE,
+                 burst: float = RATE_LIMIT_BURST,
+                 enabled: bool = RATE_LIMIT_ENABLED,
+                 checkout_wait_threshold: float = LOAD_SHED_CHECKOUT_WAIT):
+        super().__init__(app)
+        self.rate = rate
+        self.burst = burst
+        self.enabled = enabled
+        self.checkout_wait_threshold = checkout_wait_threshold
+        self.script = None
+        self.denied_until: OrderedDict[str, float] = OrderedDict()
+        self.local_buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+
+    async def dispatch(self, request: Request, call_next):
+        """
+            Admits, rejects with 429 or sheds with 503 the incoming request.
+
+            Args:
+                request (Request): The incoming request
+                call_next (Callable): The next middleware/handler in a chain
+
+            Returns:
+                Response: The handler response, or the rejection with the Retry-After header
+        """
+        if not self.enabled or request.url.path.startswith(EXEMPT_PATH_PREFIXES):
+            return await call_next(request)
+
+        if get_checkout_wait() > self.checkout_wait_threshold:
+            logger.warning('Shedding the request, the database pool is saturated')
+            return JSONResponse({'detail': 'Service is overloaded, try again later'},
+                                status_code=503, headers={'Retry-After': str(LOAD_SHED_RETRY_AFTER)})
+
+        allowed, retry_after = await self.admit(self.bucket_key(request))
+        if not allowed:
+            return JSONResponse({'detail': 'Too many requests'},
+                                status_code=429, headers={'Retry-After': str(max(1, math.ceil(retry_after)))})
+        return await call_next(request)
+
+    @staticmethod
+    def bucket_key(request: Request) -> str:
+        """
+            Returns the key of the bucket the request is counted in.
+
+            A client without a session gets a new session id on every request, so its requests
+            are counted by the client address instead.
+
+            Args:
+                request (Request): The incoming request
+
+            Returns:
+                str: The session id, or the client address for the requests without a session
+        """
+        session_id = getattr(request.state, 'session_id', None)
+        if session_id and not getattr(request.state, 'new_session', False):
+            return session_id
+        return f'client:{request.client.host}' if request.client else 'anonymous'
+
+    async def admit(self, session_id: str) -> tuple[bool, float]:
+        """
+            Takes a token from the session bucket.
+
+            Args:
+                session_id (str): Session identifier
+
+            Returns:
+                tuple[bool, float]: The allow flag and the number of seconds to wait when not allowed
+        """
+        now = time.monotonic()
+        denied_until = self.denied_until.get(session_id)
+        if denied_until is not None:
+            if denied_until > now:
+                return False, denied_until - now
+            del self.denied_until[session_id]
+
+        try:
+            allowed, retry_after = await asyncio.wait_for(self.consume_redis(session_id),
+                                                          timeout=RATE_LIMIT_REDIS_TIMEOUT)
+        except Exception as ex:
+            logger.warning(f'Rate limiting falls back to the in-process bucket: {str(ex) or type(ex).__name__}')
+            # The script is registered again with the current client on the next call
+            self.script = None
+            allowed, retry_after = self.consume_local(session_id)
+
+        if not allowed:
+            self.remember(self.denied_until, session_id, now + retry_after)
+        return allowed, retry_after
+
+    async def consume_redis(self, session_id: str) -> tuple[bool, float]:
+        """
+            Takes a token from the session bucket stored in Redis.
+        """
+        if self.script is None:
+            self.script = (await get_redis_client()).register_script(TOKEN_BUCKET_SCRIPT)
+        allowed, retry_after = await self.script(keys=[f'rate_limit:{session_id}'],
+                                                 args=[self.rate, self.burst, 1])
+        return bool(int(allowed)), float(retry_after)
+
+    def consume_local(self, session_id: str) -> tuple[bool, float]:
+        """
+            Takes a token from the in-process session bucket.
+        """
+        bucket = self.local_buckets.get(session_id)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+            self.remember(self.local_buckets, session_id, bucket)
+        return bucket.consume()
+
+    @staticmethod
+    def remember(storage: OrderedDict, session_id: str, value):
+        """
+            Stores the session value, evicting the least recently stored sessions over the limit.
+        """
+        storage[session_id] = value
+        storage.move_to_end(session_id)
+        if len(storage) > LOCAL_SESSIONS_LIMIT:
+            storage.popitem(last=False)
@@ -43,7 +43,9 @@ class SessionMiddleware(BaseHTTPMiddleware):
                 request.cookies.get('session_id') or
                 request.query_params.get('session_id')
         )
-        if not session_id or not is_valid_uuid(session_id):
+        # A new session id tells the rate limiter that the client did not identify itself
+        request.state.new_session = not session_id or not is_valid_uuid(session_id)
+        if request.state.new_session:
             session_id = str(uuid.uuid4())
 
         request.state.session_id = session_id
@@ -6,15 +6,17 @@ from alembic import context
 import asyncio
 
 from db import packages # noqa: F401
-from utils.db_utils import DATABASE_URL
+from db import tariffs # noqa: F401
+from utils.db_utils import DATABASE_SHARD_URLS
 from db.base import Base
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
 
-# Set connection db string
+# Set connection db string, `alembic -x shard=N upgrade head` migrates the N-th shard (0 is the primary database)
 section = config.config_ini_section
-config.set_section_option(section, 'DATABASE_CONNECTION_STRING', DATABASE_URL)
+shard = int(context.get_x_argument(as_dictionary=True).get('shard', 0))
+config.set_section_option(section, 'DATABASE_CONNECTION_STRING', DATABASE_SHARD_URLS[shard])
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
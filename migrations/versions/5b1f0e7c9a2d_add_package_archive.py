@@ -0,0 +1,55 @@
+"""add package_archive table and last_activity_at field
+
+Revision ID: 5b1f0e7c9a2d
+Revises: cadf43ac83ac
+Create Date: 2026-10-19 10:12:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1f0e7c9a2d'
+down_revision: Union[str, None] = 'cadf43ac83ac'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('package', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_activity_at', sa.DateTime(), server_default=sa.text('now()'),
+                                      nullable=False))
+        batch_op.create_index(batch_op.f('ix_package_last_activity_at'), ['last_activity_at'], unique=False)
+
+    op.create_table('package_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('name', sa.String(length=200), nullable=False),
+    sa.Column('weight', sa.Float(), nullable=False),
+    sa.Column('type_id', sa.Integer(), nullable=False),
+    sa.Column('content_value_usd', sa.Float(), nullable=False),
+    sa.Column('session_id', mysql.CHAR(length=36), nullable=False),
+    sa.Column('delivery_cost', sa.Float(), nullable=True),
+    sa.Column('shipping_company_id', sa.Integer(), nullable=True),
+    sa.Column('last_activity_at', sa.DateTime(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['type_id'], ['package_type.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('package_archive', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_package_archive_session_id'), ['session_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('package_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_package_archive_session_id'))
+
+    op.drop_table('package_archive')
+
+    with op.batch_alter_table('package', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_package_last_activity_at'))
+        batch_op.drop_column('last_activity_at')
@@ -0,0 +1,37 @@
+"""add session_summary table
+
+Revision ID: 8d3e6a1f4c70
+Revises: 5b1f0e7c9a2d
+Create Date: 2026-10-19 12:40:08.118532
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision: str = '8d3e6a1f4c70'
+down_revision: Union[str, None] = '5b1f0e7c9a2d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('session_summary',
+    sa.Column('session_id', mysql.CHAR(length=36), nullable=False),
+    sa.Column('type_id', sa.Integer(), nullable=False),
+    sa.Column('package_count', sa.Integer(), nullable=False),
+    sa.Column('total_value_usd', sa.Numeric(precision=20, scale=2), nullable=False),
+    sa.Column('priced_count', sa.Integer(), nullable=False),
+    sa.Column('total_delivery_cost', sa.Numeric(precision=20, scale=2), nullable=False),
+    sa.ForeignKeyConstraint(['type_id'], ['package_type.id'], ),
+    sa.PrimaryKeyConstraint('session_id', 'type_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('session_summary')
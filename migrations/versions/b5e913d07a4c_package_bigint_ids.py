@@ -0,0 +1,39 @@
+"""widen package ids to BIGINT for the shard id ranges
+
+Revision ID: b5e913d07a4c
+Revises: f7c2d95e1b38
+Create Date: 2026-10-19 19:42:08.517309
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e913d07a4c'
+down_revision: Union[str, None] = 'f7c2d95e1b38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('package', schema=None) as batch_op:
+        batch_op.alter_column('id', existing_type=sa.Integer(), type_=sa.BigInteger(),
+                              existing_nullable=False, autoincrement=True)
+
+    with op.batch_alter_table('package_archive', schema=None) as batch_op:
+        batch_op.alter_column('id', existing_type=sa.Integer(), type_=sa.BigInteger(),
+                              existing_nullable=False, autoincrement=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('package_archive', schema=None) as batch_op:
+        batch_op.alter_column('id', existing_type=sa.BigInteger(), type_=sa.Integer(),
+                              existing_nullable=False, autoincrement=False)
+
+    with op.batch_alter_table('package', schema=None) as batch_op:
+        batch_op.alter_column('id', existing_type=sa.BigInteger(), type_=sa.Integer(),
+                              existing_nullable=False, autoincrement=True)
@@ -0,0 +1,55 @@
+"""add tariff tables
+
+Revision ID: e41a7c2b9d05
+Revises: 8d3e6a1f4c70
+Create Date: 2026-10-19 15:02:47.530118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'e41a7c2b9d05'
+down_revision: Union[str, None] = '8d3e6a1f4c70'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('tariff',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('name', sa.String(length=200), nullable=False),
+    sa.Column('effective_from', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_tariff_effective_from'), 'tariff', ['effective_from'], unique=False)
+    op.create_table('tariff_rate',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('tariff_id', sa.Integer(), nullable=False),
+    sa.Column('type_id', sa.Integer(), nullable=True),
+    sa.Column('weight_from', sa.Float(), nullable=False),
+    sa.Column('weight_rate', sa.Float(), nullable=False),
+    sa.Column('value_rate', sa.Float(), nullable=False),
+    sa.Column('base_fee', sa.Float(), nullable=False),
+    sa.Column('min_charge', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['tariff_id'], ['tariff.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['type_id'], ['package_type.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_tariff_rate_tariff_id'), 'tariff_rate', ['tariff_id'], unique=False)
+    # The first version keeps the formula used before the tariffs: (weight * 0.5 + value * 0.01) * rate
+    op.execute('INSERT INTO tariff(id, name) values (1, \'base\')')
+    op.execute('INSERT INTO tariff_rate(tariff_id, type_id, weight_from, weight_rate, value_rate, base_fee, min_charge) '
+               'values (1, NULL, 0, 0.5, 0.01, 0, 0)')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_tariff_rate_tariff_id'), table_name='tariff_rate')
+    op.drop_table('tariff_rate')
+    op.drop_index(op.f('ix_tariff_effective_from'), table_name='tariff')
+    op.drop_table('tariff')
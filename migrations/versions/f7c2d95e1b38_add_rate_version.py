@@ -0,0 +1,40 @@
+"""add rate_version table
+
+Revision ID: f7c2d95e1b38
+Revises: e41a7c2b9d05
+Create Date: 2026-10-19 16:21:35.904417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'f7c2d95e1b38'
+down_revision: Union[str, None] = 'e41a7c2b9d05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('rate_version',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('usd_rate', sa.Float(), nullable=False),
+    sa.Column('tariff_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['tariff_id'], ['tariff.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('package', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rate_version_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('package_rate_version_id_fk', 'rate_version', ['rate_version_id'], ['id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('package', schema=None) as batch_op:
+        batch_op.drop_constraint('package_rate_version_id_fk', type_='foreignkey')
+        batch_op.drop_column('rate_version_id')
+    op.drop_table('rate_version')
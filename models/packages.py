@@ -76,3 +76,39 @@ class PackageInfoNoId(PackageBase):
 class PaginatedPackages(BaseModel):
     data: list[PackageInfo]
     meta: dict
+
+
+class PackageTypeSummary(BaseModel):
+    type_id: int = Field(..., description='Package type id')
+    type_name: str = Field(..., description='Package type name')
+    package_count: int = Field(..., description='Number of packages')
+    total_value_usd: float = Field(..., description='Total declared value in dollars')
+    priced_count: int = Field(..., description='Number of packages with calculated delivery cost')
+    total_delivery_cost: float = Field(..., description='Total delivery cost in roubles')
+
+
+class SessionSummary(BaseModel):
+    package_count: int = Field(..., description='Number of packages')
+    total_value_usd: float = Field(..., description='Total declared value in dollars')
+    priced_count: int = Field(..., description='Number of packages with calculated delivery cost')
+    total_delivery_cost: float = Field(..., description='Total delivery cost in roubles')
+    by_type: list[PackageTypeSummary] = Field(..., description='Totals by package type')
+
+
+class ShippingCompanyPackages(BaseModel):
+    package_ids: list[int] = Field(..., min_length=1, max_length=10000, description='Ids of the packages to assign')
+
+
+class ShippingCompanyAssignment(BaseModel):
+    assigned: list[int] = Field(..., description='Packages assigned to the shipping company by this request')
+    already_assigned: list[int] = Field(..., description='Packages assigned to a shipping company before')
+    not_found: list[int] = Field(..., description='Ids without a package')
+
+
+class PackageLookup(BaseModel):
+    package_ids: list[int] = Field(..., min_length=1, max_length=100, description='Package ids')
+
+
+class PackageLookupResult(BaseModel):
+    packages: dict[int, PackageInfoNoId] = Field(..., description='Package info by package id')
+    not_found: list[int] = Field(..., description='Ids without a package')
@@ -0,0 +1,132 @@
+import json
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import asyncio
+from redis.asyncio.client import PubSub
+
+from redis_db.redis_setup import get_redis_client, execute_pipeline
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PACKAGE_EVENTS_CHANNEL = 'package_events:{session_id}'
+# Events kept for a slow subscriber, the oldest ones are dropped on overflow
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def package_events_channel(session_id: str) -> str:
+    """
+        Returns the pub/sub channel of the session package events.
+    """
+    return PACKAGE_EVENTS_CHANNEL.format(session_id=session_id)
+
+
+async def publish_package_events(events: list[dict]):
+    """
+        Publishes package events to the channels of their sessions with one pipeline.
+
+        A failed publication is logged and does not fail the caller, the events are a notification only.
+
+        Args:
+            events (list[dict]): Events with the 'session_id' and 'type' keys and the event data
+    """
+    if not events:
+        return
+    def build(pipe):
+        for event in events:
+            data = {key: value for key, value in event.items() if key != 'session_id'}
+            pipe.publish(package_events_channel(event['session_id']), json.dumps(data, ensure_ascii=False))
+
+    try:
+        await execute_pipeline(build)
+    except Exception as ex:
+        logger.error(f'Failed to publish {len(events)} package events: {str(ex) or type(ex).__name__}')
+
+
+class PackageEventBroker:
+    """
+        Fans out package events received from Redis to the subscribers of this process.
+
+        The process uses one pub/sub connection subscribed only to the channels of the sessions
+        with local subscribers, every subscriber is an in-memory queue.
+    """
+    def __init__(self):
+        self.subscribers: dict[str, set[asyncio.Queue]] = defaultdict(set)
+        self.pubsub: PubSub | None = None
+        self.reader: asyncio.Task | None = None
+        self.lock = asyncio.Lock()
+
+    @asynccontextmanager
+    async def subscribe(self, session_id: str) -> AsyncIterator[asyncio.Queue]:
+        """
+            Subscribes to the events of a session.
+
+            Args:
+                session_id (str): Session identifier
+
+            Yields:
+                asyncio.Queue: The queue receiving the session events
+        """
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        async with self.lock:
+            if self.pubsub is None:
+                self.pubsub = (await get_redis_client()).pubsub(ignore_subscribe_messages=True)
+            if not self.subscribers[session_id]:
+                await self.pubsub.subscribe(package_events_channel(session_id))
+            self.subscribers[session_id].add(queue)
+            if self.reader is None or self.reader.done():
+                self.reader = asyncio.create_task(self.read())
+        try:
+            yield queue
+        finally:
+            async with self.lock:
+                self.subscribers[session_id].discard(queue)
+                if not self.subscribers[session_id]:
+                    del self.subscribers[session_id]
+                    try:
+                        await self.pubsub.unsubscribe(package_events_channel(session_id))
+                    except Exception as ex:
+                        logger.error(f'Failed to unsubscribe from the package events: {str(ex)}')
+
+    async def read(self):
+        """
+            Reads the pub/sub messages and puts them into the subscriber queues.
+        """
+        prefix_length = len(package_events_channel(''))
+        # The client may swallow the cancellation while waiting for a message
+        while not asyncio.current_task().cancelling():
+            try:
+                if not self.pubsub.subscribed:
+                    await asyncio.sleep(1)
+                    continue
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                event = json.loads(message['data'])
+                for queue in self.subscribers.get(message['channel'][prefix_length:], ()):
+                    if queue.full():
+                        queue.get_nowait()
+                    queue.put_nowait(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                logger.error(f'Package events reader error: {str(ex)}')
+                await asyncio.sleep(1)
+
+    async def close(self):
+        """
+            Stops the reader and closes the pub/sub connection.
+        """
+        if self.reader is not None:
+            self.reader.cancel()
+            await asyncio.gather(self.reader, return_exceptions=True)
+            self.reader = None
+        if self.pubsub is not None:
+            await self.pubsub.aclose()
+            self.pubsub = None
+
+
+package_event_broker = PackageEventBroker()
@@ -0,0 +1,217 @@
+import json
+import logging
+import os
+import socket
+import time
+from typing import Awaitable, Callable
+
+import asyncio
+
+from redis_db.redis_setup import get_redis_client, redis_call, execute_pipeline, REDIS_CALL_TIMEOUT
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PACKAGE_STREAM = 'package_stream'
+# Approximate number of the latest events kept in the stream
+PACKAGE_STREAM_MAXLEN = int(os.getenv('PACKAGE_STREAM_MAXLEN', 100000))
+# Events failed PACKAGE_STREAM_MAX_DELIVERIES times are moved to the dead letter stream of the group
+DEAD_LETTER_STREAM = 'package_stream:dead:{group}'
+PACKAGE_STREAM_MAX_DELIVERIES = int(os.getenv('PACKAGE_STREAM_MAX_DELIVERIES', 5))
+# Events delivered but not acknowledged for this time are delivered again, e.g. after a consumer crash
+PACKAGE_STREAM_CLAIM_IDLE_MS = int(os.getenv('PACKAGE_STREAM_CLAIM_IDLE_MS', 30000))
+# The blocking read must return before the socket timeout of the shared Redis client
+PACKAGE_STREAM_BLOCK_MS = int(os.getenv('PACKAGE_STREAM_BLOCK_MS', 400))
+# The ids of the processed events are kept for much longer than an event can be redelivered
+PROCESSED_KEY = 'package_stream_processed:{group}:{event_id}'
+PROCESSED_TTL = 7 * 24 * 3600
+
+EVENT_FIELDS = ('event_id', 'type', 'package_id', 'session_id')
+
+
+async def add_to_stream(events: list[dict]):
+    """
+        Appends the events to the package stream with one pipeline.
+
+        Args:
+            events (list[dict]): Events with the 'event_id', 'type', 'package_id' and 'session_id' keys
+                and the event data
+
+        Raises:
+            Exception: If Redis fails, the caller keeps the events to add them again
+    """
+    def build(pipe):
+        for event in events:
+            fields = {key: event[key] for key in EVENT_FIELDS}
+            fields['data'] = json.dumps({key: value for key, value in event.items() if key not in EVENT_FIELDS},
+                                        ensure_ascii=False)
+            pipe.xadd(PACKAGE_STREAM, fields, maxlen=PACKAGE_STREAM_MAXLEN, approximate=True)
+
+    if events:
+        await execute_pipeline(build)
+
+
+def parse_event(fields: dict) -> dict:
+    """
+        Restores the event from the fields of a stream entry.
+    """
+    event = {key: fields[key] for key in EVENT_FIELDS}
+    event['package_id'] = int(event['package_id'])
+    event.update(json.loads(fields.get('data') or '{}'))
+    return event
+
+
+class StreamConsumer:
+    """
+        Consumes the package stream in a consumer group.
+
+        Every event is handled once per group: the processes of a group share the events, the handled
+        events are acknowledged and marked as processed in one transaction, and a redelivered event marked
+        as processed is only acknowledged. A failed batch stays pending and is delivered again after
+        claim_idle_ms, to this or another consumer, up to max_deliveries times and then goes to the dead
+        letter stream. The handler may still see an event twice if the process stops between handling it
+        and acknowledging it, so its effect must be idempotent.
+    """
+    def __init__(self,
+                 group: str,
+                 handler: Callable[[list[dict]], Awaitable[None]],
+                 consumer: str | None = None,
+                 batch_size: int = 100,
+                 block_ms: int = PACKAGE_STREAM_BLOCK_MS,
+                 claim_idle_ms: int = PACKAGE_STREAM_CLAIM_IDLE_MS,
+                 max_deliveries: int = PACKAGE_STREAM_MAX_DELIVERIES):
+        self.group = group
+        self.handler = handler
+        self.consumer = consumer or f'{socket.gethostname()}-{os.getpid()}'
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.max_deliveries = max_deliveries
+        self.group_created = False
+        self.claimed_at = 0.0
+
+    async def ensure_group(self):
+        """
+            Creates the consumer group reading the stream from its start, if it does not exist.
+        """
+        if self.group_created:
+            return
+        client = await get_redis_client()
+        try:
+            await redis_call(client.xgroup_create(PACKAGE_STREAM, self.group, id='0', mkstream=True))
+        except Exception as ex:
+            if 'BUSYGROUP' not in str(ex):
+                raise
+        self.group_created = True
+
+    async def read(self) -> list[tuple[str, dict]]:
+        """
+            Returns the next entries of the consumer: the stale pending ones first, then the new ones.
+        """
+        await self.ensure_group()
+        if time.monotonic() - self.claimed_at >= self.claim_idle_ms / 2000:
+            self.claimed_at = time.monotonic()
+            entries = await self.claim_stale()
+            if entries:
+                return entries
+        client = await get_redis_client()
+        response = await redis_call(
+            client.xreadgroup(self.group, self.consumer, {PACKAGE_STREAM: '>'}, count=self.batch_size,
+                              block=self.block_ms),
+            timeout=self.block_ms / 1000 + REDIS_CALL_TIMEOUT
+        )
+        return [entry for _, entries in response or () for entry in entries]
+
+    async def claim_stale(self) -> list[tuple[str, dict]]:
+        """
+            Takes over the entries pending longer than claim_idle_ms and moves the ones delivered
+            max_deliveries times to the dead letter stream.
+        """
+        client = await get_redis_client()
+        pending = await redis_call(client.xpending_range(PACKAGE_STREAM, self.group, min='-', max='+',
+                                                         count=self.batch_size))
+        stale = {item['message_id']: item['times_delivered'] for item in pending
+                 if item['time_since_delivered'] >= self.claim_idle_ms}
+        if not stale:
+            return []
+        claimed = await redis_call(client.xclaim(PACKAGE_STREAM, self.group, self.consumer, self.claim_idle_ms,
+                                                 list(stale)))
+        # The entries trimmed from the stream have no fields
+        entries = [(entry_id, fields) for entry_id, fields in claimed if fields]
+        dead = [(entry_id, fields) for entry_id, fields in entries if stale[entry_id] >= self.max_deliveries]
+        if dead:
+            await self.dead_letter(dead)
+        gone = [entry_id for entry_id, fields in claimed if not fields]
+        if gone:
+            await redis_call(client.xack(PACKAGE_STREAM, self.group, *gone))
+        return [(entry_id, fields) for entry_id, fields in entries if stale[entry_id] < self.max_deliveries]
+
+    async def dead_letter(self, entries: list[tuple[str, dict]]):
+        """
+            Moves the entries to the dead letter stream of the group.
+        """
+        def build(pipe):
+            for entry_id, fields in entries:
+                pipe.xadd(DEAD_LETTER_STREAM.format(group=self.group), {**fields, 'entry_id': entry_id},
+                          maxlen=PACKAGE_STREAM_MAXLEN, approximate=True)
+            pipe.xack(PACKAGE_STREAM, self.group, *(entry_id for entry_id, _ in entries))
+
+        await execute_pipeline(build, transaction=True)
+        logger.error(f'{len(entries)} package stream events of the group {self.group} '
+                     f'moved to the dead letter stream after {self.max_deliveries} deliveries')
+
+    async def process(self, entries: list[tuple[str, dict]]) -> int:
+        """
+            Handles the entries not processed by the group yet and acknowledges all of them.
+
+            Args:
+                entries (list[tuple[str, dict]]): Stream entries by entry id
+
+            Returns:
+                int: The number of handled events
+
+            Raises:
+                Exception: If the handler fails, the entries stay pending
+        """
+        if not entries:
+            return 0
+        # A relayed again event may come in the same batch as the first copy
+        unique = {}
+        for _, fields in entries:
+            event = parse_event(fields)
+            unique.setdefault(event['event_id'], event)
+        events = list(unique.values())
+        processed_keys = [PROCESSED_KEY.format(group=self.group, event_id=event['event_id']) for event in events]
+
+        def check(pipe):
+            for key in processed_keys:
+                pipe.exists(key)
+
+        processed = await execute_pipeline(check)
+        fresh = [event for event, done in zip(events, processed) if not done]
+        if fresh:
+            await self.handler(fresh)
+
+        def acknowledge(pipe):
+            for key in processed_keys:
+                pipe.set(key, 1, ex=PROCESSED_TTL)
+            pipe.xack(PACKAGE_STREAM, self.group, *(entry_id for entry_id, _ in entries))
+
+        await execute_pipeline(acknowledge, transaction=True)
+        return len(fresh)
+
+    async def run(self):
+        """
+            Reads and handles the events until cancelled.
+        """
+        # The client may swallow the cancellation while waiting for the entries
+        while not asyncio.current_task().cancelling():
+            try:
+                entries = await self.read()
+                if entries:
+                    await self.process(entries)
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                logger.error(f'Package stream consumer {self.group} error: {str(ex) or type(ex).__name__}')
+                await asyncio.sleep(1)
@@ -1,4 +1,8 @@
-from redis.asyncio import Redis
+from typing import Awaitable, Callable, TypeVar
+
+import asyncio
+from redis.asyncio import Redis, BlockingConnectionPool
+from redis.asyncio.client import Pipeline
 import os
 import logging
 
@@ -7,26 +11,93 @@ redis_client = None
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+T = TypeVar('T')
+
+# Maximum number of connections opened by one process
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 50))
+# Time to wait for a free connection when all of them are in use
+REDIS_POOL_TIMEOUT = float(os.getenv('REDIS_POOL_TIMEOUT', 0.2))
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 0.5))
+REDIS_CONNECT_TIMEOUT = float(os.getenv('REDIS_CONNECT_TIMEOUT', 0.5))
+# Idle connections are checked with PING before reuse after this number of seconds
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 15))
+# Total time budget of one call, including waiting for a connection
+REDIS_CALL_TIMEOUT = float(os.getenv('REDIS_CALL_TIMEOUT', 0.5))
+
 
 # Creates or returns connection to redis
 async def get_redis_client() -> Redis:
     """
         Provides a Redis client instance.
 
-        Creates a new Redis connection on the first call and reuses the same instance
-        for any later calls.
+        Creates a client over a bounded connection pool on the first call and reuses the same
+        instance for any later calls. When all connections are busy, a call waits for a free one
+        no longer than REDIS_POOL_TIMEOUT instead of opening more connections.
 
         Returns:
             Redis: Async Redis client instance
     """
     global redis_client
     if redis_client is None:
-        redis_client = Redis(
+        pool = BlockingConnectionPool(
             host=os.getenv('REDIS_HOST', 'redis'),
             port=int(os.getenv('REDIS_PORT', 6379)),
             db=0,
             decode_responses=True,
-            socket_timeout=5,
-            socket_connect_timeout=5
+            max_connections=REDIS_MAX_CONNECTIONS,
+            timeout=REDIS_POOL_TIMEOUT,
+            socket_timeout=REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+            socket_keepalive=True,
+            health_check_interval=REDIS_HEALTH_CHECK_INTERVAL
         )
+        # The client owns the pool and closes it with itself
+        redis_client = Redis.from_pool(pool)
     return redis_client
+
+
+async def redis_call(operation: Awaitable[T], timeout: float = REDIS_CALL_TIMEOUT) -> T:
+    """
+        Awaits a Redis operation within the call time budget.
+
+        Args:
+            operation (Awaitable): The Redis command coroutine
+            timeout (float): Time budget in seconds
+
+        Returns:
+            The command result
+
+        Raises:
+            TimeoutError: If the operation did not complete in time
+    """
+    return await asyncio.wait_for(operation, timeout=timeout)
+
+
+async def execute_pipeline(build: Callable[[Pipeline], None],
+                           transaction: bool = False,
+                           timeout: float = REDIS_CALL_TIMEOUT) -> list:
+    """
+        Sends several commands in one round trip.
+
+        Args:
+            build (Callable): Queues the commands on the given pipeline
+            transaction (bool): Whether the commands are wrapped in MULTI/EXEC
+            timeout (float): Time budget of the whole batch in seconds
+
+        Returns:
+            list: The command results in the order the commands were queued
+    """
+    client = await get_redis_client()
+    async with client.pipeline(transaction=transaction) as pipe:
+        build(pipe)
+        return await redis_call(pipe.execute(), timeout=timeout)
+
+
+async def close_redis_client():
+    """
+        Closes the Redis client and its connection pool, if they were created.
+    """
+    global redis_client
+    if redis_client is not None:
+        await redis_client.aclose()
+        redis_client = None
@@ -0,0 +1,54 @@
+import json
+import logging
+import os
+
+from redis_db.redis_setup import get_redis_client, redis_call
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# The ETag of the summary depends on the session version and the latest rate version, so a cached entry
+# is never stale, it is only not used any more
+SUMMARY_COSTS_KEY = 'session_summary_costs:{etag}'
+SUMMARY_COSTS_TTL = int(os.getenv('SUMMARY_COSTS_TTL', 3600))
+
+
+async def get_summary_costs(etag: str) -> dict[int, tuple[int, float]] | None:
+    """
+        Returns the read-time delivery cost changes of the session summary cached under its ETag.
+
+        Args:
+            etag (str): The ETag of the session summary
+
+        Returns:
+            dict[int, tuple[int, float]] | None: The priced count and the delivery cost changes by package type,
+                None if they are not cached or Redis is not available
+    """
+    try:
+        redis_client = await get_redis_client()
+        cached = await redis_call(redis_client.get(SUMMARY_COSTS_KEY.format(etag=etag)))
+    except Exception as ex:
+        logger.warning(f'Failed to read the cached summary costs: {str(ex) or type(ex).__name__}')
+        return None
+    if cached is None:
+        return None
+    return {int(type_id): (priced_count, delivery_cost)
+            for type_id, (priced_count, delivery_cost) in json.loads(cached).items()}
+
+
+async def cache_summary_costs(etag: str, costs: dict[int, tuple[int, float]]):
+    """
+        Caches the read-time delivery cost changes of the session summary under its ETag.
+
+        A failure is logged, the next request calculates the changes again.
+
+        Args:
+            etag (str): The ETag of the session summary
+            costs (dict[int, tuple[int, float]]): The priced count and the delivery cost changes by package type
+    """
+    try:
+        redis_client = await get_redis_client()
+        await redis_call(redis_client.set(SUMMARY_COSTS_KEY.format(etag=etag), json.dumps(costs),
+                                          ex=SUMMARY_COSTS_TTL))
+    except Exception as ex:
+        logger.warning(f'Failed to cache the summary costs: {str(ex) or type(ex).__name__}')
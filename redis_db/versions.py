@@ -0,0 +1,202 @@
+import logging
+import os
+import uuid
+from typing import Iterable
+
+import asyncio
+
+from redis_db.redis_setup import get_redis_client, redis_call, execute_pipeline
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SESSION_VERSION_KEY = 'package_version:{session_id}'
+# Random value renewed when Redis loses its data, so that the restarted counters do not repeat old versions
+VERSION_EPOCH_KEY = 'package_version_epoch'
+# The session cookie lives 30 days
+SESSION_VERSION_TTL = 30 * 24 * 3600
+RECENT_WRITE_KEY = 'package_write:{session_id}'
+# Seconds the session reads from the primary database after its packages changed, longer than the replica lag
+READ_YOUR_WRITES_WINDOW = int(os.getenv('READ_YOUR_WRITES_WINDOW', 5))
+
+
+# Sessions whose version bump failed, by the number of the failure, they get no ETag until the bump is retried
+pending_bumps: dict[str, int] = {}
+# Beyond this number of the pending sessions the version epoch is renewed instead, which changes all versions
+MAX_PENDING_BUMPS = int(os.getenv('MAX_PENDING_BUMPS', 10000))
+# The number of the failure since which the epoch renewal is pending, no session gets an ETag until then
+pending_epoch_renewal: int | None = None
+failed_bumps = 0
+# Pause before retrying the failed bumps, doubled after every failed attempt up to BUMP_MAX_RETRY_DELAY
+BUMP_RETRY_DELAY = float(os.getenv('BUMP_RETRY_DELAY', 1))
+BUMP_MAX_RETRY_DELAY = float(os.getenv('BUMP_MAX_RETRY_DELAY', 30))
+retry_task: asyncio.Task | None = None
+
+
+def queue_bumps(pipe, session_ids: Iterable[str]):
+    """
+        Queues the version bump and the recent write mark of the sessions on the pipeline.
+    """
+    for session_id in session_ids:
+        key = SESSION_VERSION_KEY.format(session_id=session_id)
+        pipe.incr(key)
+        pipe.expire(key, SESSION_VERSION_TTL)
+        pipe.set(RECENT_WRITE_KEY.format(session_id=session_id), 1, ex=READ_YOUR_WRITES_WINDOW)
+
+
+def drop_pending_bumps(bumps: dict[str, int]):
+    """
+        Forgets the pending bumps covered by a successful bump, a session failed again since then stays pending.
+
+        Args:
+            bumps (dict[str, int]): Bumped sessions by the number of the last failure the bump covers
+    """
+    for session_id, failure in bumps.items():
+        if pending_bumps.get(session_id, failure + 1) <= failure:
+            del pending_bumps[session_id]
+
+
+def is_bump_pending(session_id: str) -> bool:
+    """
+        Checks whether the version of the session may be stale because its bump failed.
+    """
+    return pending_epoch_renewal is not None or session_id in pending_bumps
+
+
+async def bump_session_versions(session_ids: Iterable[str]):
+    """
+        Increments the package version of the sessions, invalidating their cached package lists,
+        and marks the sessions as recent writers, so that they read from the primary database.
+
+        A failure is logged and does not fail the caller, whose write is already committed. The sessions
+        are kept in pending_bumps instead and bumped again in the background, see retry_pending_bumps(),
+        until then the process gives them no ETag and reads their packages from the primary database.
+
+        Args:
+            session_ids (Iterable[str]): Sessions whose packages changed
+    """
+    session_ids = set(session_ids)
+    if not session_ids:
+        return
+    failure = failed_bumps
+    try:
+        await execute_pipeline(lambda pipe: queue_bumps(pipe, session_ids))
+    except Exception as ex:
+        logger.error(f'Failed to bump the package version of {len(session_ids)} sessions: '
+                     f'{str(ex) or type(ex).__name__}')
+        keep_pending(session_ids)
+        return
+    # The bump also covers the earlier failed bumps of the sessions
+    drop_pending_bumps({session_id: failure for session_id in session_ids if session_id in pending_bumps})
+
+
+def keep_pending(session_ids: set[str]):
+    """
+        Remembers the sessions of a failed bump and starts retrying them in the background.
+
+        Args:
+            session_ids (set[str]): Sessions whose bump failed
+    """
+    global failed_bumps, pending_epoch_renewal, retry_task
+    failed_bumps += 1
+    if pending_epoch_renewal is not None or len(pending_bumps) + len(session_ids) > MAX_PENDING_BUMPS:
+        if pending_epoch_renewal is None:
+            logger.warning(f'More than {MAX_PENDING_BUMPS} sessions wait for the version bump, '
+                           f'the version epoch is renewed instead')
+        pending_epoch_renewal = failed_bumps
+        pending_bumps.clear()
+    else:
+        pending_bumps.update(dict.fromkeys(session_ids, failed_bumps))
+
+    loop = asyncio.get_running_loop()
+    if retry_task is None or retry_task.done() or retry_task.get_loop() is not loop:
+        retry_task = loop.create_task(retry_pending_bumps())
+
+
+async def retry_pending_bumps():
+    """
+        Retries the failed bumps with a backoff until none is pending.
+
+        The retried bump changes the version of the sessions, or the epoch of all of them, in Redis,
+        so that the other processes, which never saw the failure, stop answering 304 to the old ETags.
+    """
+    global pending_epoch_renewal
+    delay = BUMP_RETRY_DELAY
+    while pending_bumps or pending_epoch_renewal is not None:
+        await asyncio.sleep(delay)
+        renewal, bumps = pending_epoch_renewal, dict(pending_bumps)
+        try:
+            if renewal is not None:
+                redis_client = await get_redis_client()
+                await redis_call(redis_client.set(VERSION_EPOCH_KEY, uuid.uuid4().hex))
+            else:
+                await execute_pipeline(lambda pipe: queue_bumps(pipe, bumps))
+        except Exception as ex:
+            delay = min(delay * 2, BUMP_MAX_RETRY_DELAY)
+            logger.warning(f'Failed to retry the package version bumps, the next attempt in {delay} s: '
+                           f'{str(ex) or type(ex).__name__}')
+            continue
+        delay = BUMP_RETRY_DELAY
+        if renewal is not None:
+            logger.info('The version epoch is renewed after the failed bumps')
+            if pending_epoch_renewal == renewal:
+                pending_epoch_renewal = None
+        else:
+            logger.info(f'The package versions of {len(bumps)} sessions are bumped after a failure')
+            drop_pending_bumps(bumps)
+
+
+async def stop_retrying_bumps():
+    """
+        Cancels the retry of the failed bumps, the pending sessions keep their versions.
+    """
+    global retry_task
+    if retry_task is not None:
+        retry_task.cancel()
+        await asyncio.gather(retry_task, return_exceptions=True)
+        retry_task = None
+
+
+async def get_session_version(session_id: str) -> str | None:
+    """
+        Returns the package version of the session.
+
+        Args:
+            session_id (str): Session identifier
+
+        Returns:
+            str | None: The version, None if Redis is not available or the last bump of the session failed
+    """
+    if is_bump_pending(session_id):
+        return None
+    try:
+        redis_client = await get_redis_client()
+        epoch, version = await redis_call(redis_client.mget(VERSION_EPOCH_KEY,
+                                                            SESSION_VERSION_KEY.format(session_id=session_id)))
+        if epoch is None:
+            await redis_call(redis_client.set(VERSION_EPOCH_KEY, uuid.uuid4().hex, nx=True))
+            epoch = await redis_call(redis_client.get(VERSION_EPOCH_KEY))
+    except Exception as ex:
+        logger.warning(f'Failed to read the package version: {str(ex) or type(ex).__name__}')
+        return None
+    return f'{epoch}:{version or 0}'
+
+
+async def has_recent_write(session_id: str) -> bool:
+    """
+        Checks whether the packages of the session changed within READ_YOUR_WRITES_WINDOW seconds.
+
+        Args:
+            session_id (str): Session identifier
+
+        Returns:
+            bool: True if they did, if their version bump is pending or if Redis is not available
+    """
+    if is_bump_pending(session_id):
+        return True
+    try:
+        redis_client = await get_redis_client()
+        return bool(await redis_call(redis_client.exists(RECENT_WRITE_KEY.format(session_id=session_id))))
+    except Exception as ex:
+        logger.warning(f'Failed to check the recent writes of the session: {str(ex) or type(ex).__name__}')
+        return True
@@ -0,0 +1,129 @@
+"""
+    Production entry point.
+
+    Usage:
+        python serve.py --role api [--workers N]
+        python serve.py --role worker
+
+    The 'api' role runs N uvicorn worker processes with uvloop and httptools, which serve
+    requests but do not run the background tasks. The 'worker' role runs the background tasks
+    in a single process without serving requests. Both roles drain gracefully on SIGTERM:
+    the api workers stop accepting connections and finish the requests in flight, the worker
+    cancels its tasks, and both close the database pool and the Redis client before exiting.
+
+    `python main.py` keeps the development mode: a single reloading process doing both.
+"""
+import argparse
+import logging
+import os
+import signal
+
+import asyncio
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def read_env():
+    """
+        Reads .env from the working directory.
+
+        Returns:
+            Env: The environment reader
+    """
+    from environs import Env
+
+    env = Env()
+    env.read_env(path=os.path.join(os.getcwd(), '.env'), recurse=True)
+    return env
+
+
+def run_api(host: str, port: int, workers: int, graceful_timeout: int, access_log: bool):
+    """
+        Serves the application with several worker processes.
+
+        Args:
+            host (str): Bind address
+            port (int): Bind port
+            workers (int): Number of worker processes
+            graceful_timeout (int): Seconds given to the requests in flight on shutdown
+            access_log (bool): Whether every request is logged
+    """
+    import uvicorn
+
+    # Inherited by the worker processes, so that their lifespan does not start the background tasks
+    os.environ['SERVICE_ROLE'] = 'api'
+    logger.info(f'Starting the api role with {workers} workers on {host}:{port}')
+    uvicorn.run(
+        'main:app',
+        host=host,
+        port=port,
+        workers=workers,
+        loop='uvloop',
+        http='httptools',
+        lifespan='on',
+        access_log=access_log,
+        log_level='info',
+        proxy_headers=True,
+        forwarded_allow_ips='*',
+        timeout_graceful_shutdown=graceful_timeout
+    )
+
+
+async def run_worker(graceful_timeout: int):
+    """
+        Runs the background tasks until SIGTERM or SIGINT is received.
+
+        Args:
+            graceful_timeout (int): Seconds given to the tasks to finish after the cancellation
+    """
+    from redis_db.redis_setup import close_redis_client
+    from redis_db.versions import stop_retrying_bumps
+    from tasks.background import start_background_tasks, stop_background_tasks
+    from utils.cbr_client import close_cbr_client
+    from utils.session import init_engine, dispose_engine
+
+    os.environ['SERVICE_ROLE'] = 'worker'
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    init_engine()
+    tasks = start_background_tasks()
+    logger.info('The worker role started')
+    await stop.wait()
+
+    logger.info('Stopping the worker role')
+    try:
+        await asyncio.wait_for(stop_background_tasks(tasks), timeout=graceful_timeout)
+    except asyncio.TimeoutError:
+        logger.error(f'The background tasks did not stop in {graceful_timeout} seconds')
+    await close_cbr_client()
+    await stop_retrying_bumps()
+    await close_redis_client()
+    await dispose_engine()
+
+
+def main():
+    env = read_env()
+    parser = argparse.ArgumentParser(description='Delivery service production launcher')
+    parser.add_argument('--role', choices=['api', 'worker'], default=env.str('SERVICE_ROLE', 'api'))
+    parser.add_argument('--host', default=env.str('SERVER_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=env.int('SERVER_PORT', 8888))
+    parser.add_argument('--workers', type=int, default=env.int('WEB_CONCURRENCY', os.cpu_count() or 1))
+    parser.add_argument('--graceful-timeout', type=int, default=env.int('GRACEFUL_TIMEOUT', 25))
+    parser.add_argument('--access-log', action='store_true', default=env.bool('ACCESS_LOG', False))
+    args = parser.parse_args()
+
+    if args.role == 'api':
+        run_api(args.host, args.port, args.workers, args.graceful_timeout, args.access_log)
+    else:
+        import uvloop
+
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+            runner.run(run_worker(args.graceful_timeout))
+
+
+if __name__ == '__main__':
+    main()
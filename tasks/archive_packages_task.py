@@ -0,0 +1,155 @@
+import logging
+import os
+from datetime import datetime, timedelta
+
+import asyncio
+from sqlalchemy import select, insert, delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from db.packages import PackageTable, PackageArchiveTable
+from redis_db.versions import bump_session_versions
+from utils.pricing import read_time_pricing, price_packages
+from utils.session import get_shard_factories
+from utils.summary import SummaryDeltas, apply_summary_deltas
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Assigned packages without client activity for this number of days are moved to the archive
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 90))
+# Number of packages moved in one transaction
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 1000))
+# Pause between batches so that the archiving does not starve the other queries
+ARCHIVE_BATCH_PAUSE = float(os.getenv('ARCHIVE_BATCH_PAUSE', 0.1))
+# Interval between archiving runs
+ARCHIVE_INTERVAL = int(os.getenv('ARCHIVE_INTERVAL', 3600))
+
+ARCHIVE_COLUMNS = ['id', 'name', 'weight', 'type_id', 'content_value_usd', 'session_id', 'delivery_cost',
+                   'shipping_company_id', 'last_activity_at']
+
+
+async def store_read_time_costs(db: AsyncSession, ids: list[int]):
+    """
+        Stores the delivery cost calculated from the rate versions of the packages and counts it in the session summary.
+
+        Args:
+            db (AsyncSession): Database session, the caller commits
+            ids (list[int]): Locked package ids
+    """
+    packages = (await db.execute(
+        select(PackageTable.id, PackageTable.session_id, PackageTable.type_id, PackageTable.weight,
+               PackageTable.content_value_usd, PackageTable.delivery_cost, PackageTable.rate_version_id)
+        .where(PackageTable.id.in_(ids))
+    )).all()
+    costs = await price_packages(db,
+                                 [package.type_id for package in packages],
+                                 [package.weight for package in packages],
+                                 [package.content_value_usd for package in packages],
+                                 [package.rate_version_id for package in packages])
+    changes = []
+    deltas = SummaryDeltas()
+    for package, delivery_cost in zip(packages, costs):
+        if delivery_cost != package.delivery_cost:
+            changes.append({'id': package.id, 'delivery_cost': delivery_cost})
+            deltas.change_cost(package.session_id, package.type_id, package.delivery_cost, delivery_cost)
+    if changes:
+        await db.execute(update(PackageTable), changes)
+        await apply_summary_deltas(db, deltas)
+
+
+async def archive_packages_batch(db: AsyncSession, cutoff: datetime, batch_size: int) -> int:
+    """
+        Moves one batch of inactive priced packages from the package table to the archive.
+
+        Only the packages assigned to a shipping company are archived, since the assignment updates
+        the package table only. The batch is copied and deleted in a single transaction, so a package
+        is always visible in exactly one of the tables. In the read-time pricing mode the delivery cost
+        is calculated and stored before the copy, so the archive keeps the final cost.
+
+        Args:
+            db (AsyncSession): Database session
+            cutoff (datetime): Packages with the last activity before this moment are archived
+            batch_size (int): Maximum number of packages moved
+
+        Returns:
+            int: The number of archived packages
+    """
+    stmt = (
+        select(PackageTable.id, PackageTable.session_id)
+        .where(PackageTable.delivery_cost.is_not(None), PackageTable.shipping_company_id.is_not(None),
+               PackageTable.last_activity_at < cutoff)
+        .order_by(PackageTable.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    packages = (await db.execute(stmt)).all()
+    if not packages:
+        await db.commit()
+        return 0
+
+    ids = [package.id for package in packages]
+    if read_time_pricing():
+        await store_read_time_costs(db, ids)
+    await db.execute(
+        insert(PackageArchiveTable).from_select(
+            ARCHIVE_COLUMNS,
+            select(*[getattr(PackageTable, column) for column in ARCHIVE_COLUMNS]).where(PackageTable.id.in_(ids))
+        )
+    )
+    await db.execute(delete(PackageTable).where(PackageTable.id.in_(ids)))
+    await db.commit()
+    # The archived packages leave the package lists of their sessions
+    await bump_session_versions(package.session_id for package in packages)
+    return len(ids)
+
+
+async def archive_packages(db: AsyncSession,
+                           older_than_days: int = ARCHIVE_AFTER_DAYS,
+                           batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+        Moves all inactive priced and assigned packages to the archive in bounded batches.
+
+        Args:
+            db (AsyncSession): Database session
+            older_than_days (int): Number of days without activity before a package is archived
+            batch_size (int): Maximum number of packages moved in one transaction
+
+        Returns:
+            int: The total number of archived packages
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    total = 0
+    while True:
+        archived = await archive_packages_batch(db, cutoff, batch_size)
+        total += archived
+        if archived < batch_size:
+            break
+        await asyncio.sleep(ARCHIVE_BATCH_PAUSE)
+    logger.info(f'Archived {total} packages inactive since {cutoff}')
+    return total
+
+
+# The scheduled job of moving inactive packages out of the package table
+async def archive_packages_job() -> dict[str, int]:
+    """
+        Executes a single archiving pass on all shards in parallel.
+
+        Returns:
+            dict[str, int]: The number of archived packages
+
+        Raises:
+            Exception: The error of a shard, after its transaction is rolled back, so that the run is failed
+    """
+    async def archive_shard(shard: int, session_factory: sessionmaker) -> int:
+        async with session_factory() as db:
+            try:
+                return await archive_packages(db)
+            except Exception as ex:
+                await db.rollback()
+                logger.error(f'The package archiving task error on shard {shard}: {str(ex)}')
+                raise
+
+    archived = await asyncio.gather(*(archive_shard(shard, session_factory)
+                                      for shard, session_factory in enumerate(get_shard_factories())))
+    return {'archived': sum(archived)}
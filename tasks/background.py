@@ -0,0 +1,63 @@
+import logging
+
+import asyncio
+
+from tasks.scheduler import Scheduler, Job, IntervalSchedule, CronSchedule
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+scheduler: Scheduler | None = None
+
+
+def get_scheduler() -> Scheduler:
+    """
+        Returns the scheduler of the periodic background jobs.
+
+        The task modules are imported here, so that importing the application stays cheap
+        for the processes that do not run them.
+
+        Returns:
+            Scheduler: The scheduler with all the jobs registered
+    """
+    global scheduler
+    if scheduler is None:
+        from tasks.usd_rate_task import refresh_usd_rate_job, USD_RATE_SCHEDULE
+        from tasks.calculate_delivery_cost_task import calculate_delivery_cost_job, CALCULATION_INTERVAL
+        from tasks.archive_packages_task import archive_packages_job, ARCHIVE_INTERVAL
+
+        scheduler = Scheduler([
+            Job('refresh_usd_rate', refresh_usd_rate_job, CronSchedule(USD_RATE_SCHEDULE),
+                run_on_start=True, missed_runs='run_once', retry_delay=60, max_retry_delay=1800),
+            Job('calculate_delivery_cost', calculate_delivery_cost_job, IntervalSchedule(CALCULATION_INTERVAL),
+                run_on_start=True, retry_delay=20, max_retry_delay=CALCULATION_INTERVAL),
+            Job('archive_packages', archive_packages_job, IntervalSchedule(ARCHIVE_INTERVAL),
+                run_on_start=True, retry_delay=60, max_retry_delay=ARCHIVE_INTERVAL)
+        ])
+    return scheduler
+
+
+def start_background_tasks() -> list[asyncio.Task]:
+    """
+        Starts the periodic background jobs, the outbox relay and the package stream consumers.
+
+        Returns:
+            list[asyncio.Task]: The started loops
+    """
+    from tasks.package_stream import start_package_stream
+
+    logger.info('Starting the background tasks')
+    return [*get_scheduler().start(), *start_package_stream()]
+
+
+async def stop_background_tasks(tasks: list[asyncio.Task]):
+    """
+        Cancels the background tasks and waits for them to finish.
+
+        Args:
+            tasks (list[asyncio.Task]): The tasks returned by start_background_tasks()
+    """
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    logger.info('The background tasks stopped')
@@ -1,20 +1,55 @@
 import logging
-from datetime import datetime
+import os
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
 
 import asyncio
 from redis.asyncio import Redis
-from sqlalchemy import select, update
+from sqlalchemy import select, update, func, ColumnElement
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncEngine
+from sqlalchemy.orm import sessionmaker
 
 from db.packages import PackageTable
-from redis_db.redis_setup import get_redis_client
-from utils.session import AsyncSessionLocal
+from redis_db.package_events import publish_package_events
+from redis_db.redis_setup import get_redis_client, redis_call
+from redis_db.versions import bump_session_versions
+from utils.pricing import read_time_pricing, publish_rate_version
+from utils.session import get_shard_factories, shard_count
+from utils.sharding import shard_for_session
+from utils.concurrency import AdaptiveSemaphore
+from utils.outbox import add_outbox_events, DELIVERY_COST_CALCULATED, PACKAGE_REGISTERED
+from utils.summary import SummaryDeltas, apply_summary_deltas
+from utils.tariffs import CompiledTariff, DEFAULT_TARIFF, get_tariff
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Interval between delivery cost calculations
+CALCULATION_INTERVAL = int(os.getenv('CALCULATION_INTERVAL', 300))
+# Number of package ids recalculated in one transaction
+RECALCULATION_CHUNK_SIZE = int(os.getenv('RECALCULATION_CHUNK_SIZE', 1000))
+# Maximum number of chunks recalculated at once, each on its own connection
+RECALCULATION_CONCURRENCY = int(os.getenv('RECALCULATION_CONCURRENCY', 4))
+# Retries of a chunk failed with a deadlock or a lock wait timeout
+RECALCULATION_MAX_RETRIES = int(os.getenv('RECALCULATION_MAX_RETRIES', 3))
+RECALCULATION_RETRY_DELAY = 0.05
+# MySQL deadlock and lock wait timeout
+RETRYABLE_ERROR_CODES = (1213, 1205)
+# Number of days searched for the last available rate, the rates are stored for two days
+USD_RATE_LOOKUP_DAYS = int(os.getenv('USD_RATE_LOOKUP_DAYS', 7))
+# Maximum age of the last known rate used while Redis is not available
+USD_RATE_FALLBACK_MAX_AGE = int(os.getenv('USD_RATE_FALLBACK_MAX_AGE', 48 * 3600))
+
+# The last USD rate seen by the process and the monotonic time it was seen at
+last_known_usd_rate: tuple[float, float] | None = None
+
 
 # Calculates delivery cost
-def calculate_delivery_cost(weight: float, content_value_usd: float, usd_rate: float | None) -> float | None:
+def calculate_delivery_cost(weight: float, content_value_usd: float, usd_rate: float | None,
+                            type_id: int | None = None, tariff: CompiledTariff = DEFAULT_TARIFF) -> float | None:
     """
         Calculates delivery cost in roubles.
 
@@ -22,6 +57,8 @@ def calculate_delivery_cost(weight: float, content_value_usd: float, usd_rate: f
             weight (float): The package weight in kilograms
             content_value_usd (float): THe declared value of package contents in USD
             usd_rate (float | None): The current USD exchange rate
+            type_id (int | None): The package type id
+            tariff (CompiledTariff): The tariff to price by, the base formula by default
 
         Returns:
             float | None:
@@ -32,110 +69,334 @@ def calculate_delivery_cost(weight: float, content_value_usd: float, usd_rate: f
         logger.warning('No USD rate available for calculating the delivery cost')
         return None
     else:
-        delivery_cost_rub = (weight * 0.5 + content_value_usd * 0.01) * usd_rate
-        delivery_cost_rub = round(delivery_cost_rub, 2)
+        delivery_cost_rub = tariff.price(type_id, weight, content_value_usd, usd_rate)
 
-    logger.info(f'The calculated delivery cost: {delivery_cost_rub} RUB (rate: {usd_rate})')
+    logger.debug('The calculated delivery cost: %s RUB (rate: %s, tariff: %s)', delivery_cost_rub, usd_rate,
+                 tariff.version)
     return delivery_cost_rub
 
 
+def remember_usd_rate(usd_rate: float):
+    """
+        Keeps the USD rate in the process as the last known value.
+
+        Args:
+            usd_rate (float): The USD exchange rate read from or written to Redis
+    """
+    global last_known_usd_rate
+    last_known_usd_rate = (float(usd_rate), time.monotonic())
+
+
+def get_last_known_usd_rate() -> float | None:
+    """
+        Returns the last USD rate seen by the process, if it is not older than USD_RATE_FALLBACK_MAX_AGE.
+    """
+    if last_known_usd_rate is None:
+        return None
+    usd_rate, seen_at = last_known_usd_rate
+    if time.monotonic() - seen_at > USD_RATE_FALLBACK_MAX_AGE:
+        return None
+    return usd_rate
+
+
 async def get_usd_rate(redis_client: Redis) -> float | None:
     """
         Retrieves the USD exchange rate.
 
+        The rates of the last USD_RATE_LOOKUP_DAYS days are read with one MGET and the most recent
+        one is used. When Redis is not available, the last known rate of the process is used,
+        so that pricing keeps working during an outage.
+
         Args:
             redis_client (Redis): Async Redis client instance
 
         Returns:
             float | None:
                 - The USD rate if available
-                - None if no rates in Redis
+                - None if no rates in Redis and no last known rate
     """
+    today = datetime.utcnow()
+    # The most recent day first
+    cache_keys = [f'usd_rate:{(today - timedelta(days=days)).strftime("%Y-%m-%d")}'
+                  for days in range(USD_RATE_LOOKUP_DAYS)]
     try:
-        # USD rate from redis
+        rates = await redis_call(redis_client.mget(cache_keys))
+    except Exception as ex:
+        usd_rate = get_last_known_usd_rate()
+        logger.error(f'Failed to read the USD rate from Redis, using the last known rate {usd_rate}: '
+                     f'{str(ex) or type(ex).__name__}')
+        return usd_rate
 
-        today = datetime.utcnow().strftime('%Y-%m-%d')
-        cache_key = f'usd_rate:{today}'
+    usd_rate = next((rate for rate in rates if rate), None)
+    if not usd_rate:
+        logger.warning('No USD rate available for calculating the delivery cost')
+        return None
 
-        # Trying to get the current USD rate
-        usd_rate = await redis_client.get(cache_key)
+    usd_rate = float(usd_rate)
+    remember_usd_rate(usd_rate)
+    return usd_rate
 
-        if not usd_rate:
-            # If there is no rate for today, then trying to find the last available rate
-            keys = await redis_client.keys('usd_rate:*')
-            if keys:
-                sorted_keys = sorted(keys, reverse=True)
-                for key in sorted_keys:
-                    usd_rate = await redis_client.get(key)
-                    if usd_rate:
-                        break
 
-        if not usd_rate:
-            logger.warning('No USD rate available for calculating the delivery cost')
-            return None
+async def recalculate_packages(db: AsyncSession, usd_rate: float | None, tariff: CompiledTariff,
+                               *conditions: ColumnElement[bool]) -> int:
+    """
+        Recalculates the delivery cost of the packages matching the conditions.
 
-        usd_rate = float(usd_rate)
+        The package rows are locked until the commit, so concurrent recalculations do not
+        count the same cost change twice in the session summary. Only the changed costs are written,
+        together with their outbox events. After the commit the package version of the changed sessions
+        is bumped and the calculated costs are published to the package event subscribers.
+        The whole batch is priced by the tariff in one pass.
 
-        return usd_rate
+        Args:
+            db (AsyncSession): Database session
+            usd_rate (float | None): The USD exchange rate
+            tariff (CompiledTariff): The tariff in effect
+            conditions (ColumnElement[bool]): Conditions selecting the packages
 
-    except Exception as ex:
-        logger.error(f'The delivery calculation error: {str(ex)}')
-        return None
+        Returns:
+            int: The number of selected packages
+    """
+    stmt = (
+        select(PackageTable.id, PackageTable.session_id, PackageTable.type_id, PackageTable.weight,
+               PackageTable.content_value_usd, PackageTable.delivery_cost)
+        .where(*conditions)
+        .order_by(PackageTable.id)
+        .with_for_update()
+    )
+    packages = (await db.execute(stmt)).all()
+    if not packages:
+        await db.commit()
+        return 0
+
+    changes = []
+    events = []
+    deltas = SummaryDeltas()
+    _, _, type_ids, weights, content_values_usd, _ = zip(*packages)
+    costs = tariff.price_batch(type_ids, weights, content_values_usd, usd_rate)
+    for (package_id, session_id, type_id, _, _, old_cost), delivery_cost in zip(packages, costs):
+        if delivery_cost != old_cost:
+            changes.append({'id': package_id, 'session_id': session_id, 'delivery_cost': delivery_cost})
+            deltas.change_cost(session_id, type_id, old_cost, delivery_cost)
+            if delivery_cost is not None:
+                events.append({'session_id': session_id, 'type': DELIVERY_COST_CALCULATED,
+                               'package_id': package_id, 'delivery_cost': delivery_cost})
+    if changes:
+        await db.execute(update(PackageTable), [{'id': change['id'], 'delivery_cost': change['delivery_cost']}
+                                                for change in changes])
+        await apply_summary_deltas(db, deltas)
+        await add_outbox_events(db, events)
+    await db.commit()
+    await bump_session_versions(change['session_id'] for change in changes)
+    await publish_package_events(events)
+    return len(packages)
+
+
+async def recalculate_chunk(db: AsyncSession, usd_rate: float | None, tariff: CompiledTariff,
+                            after_id: int, until_id: int) -> int:
+    """
+        Recalculates the delivery cost of one chunk of packages in an id range.
+
+        Args:
+            db (AsyncSession): Database session
+            usd_rate (float | None): The USD exchange rate
+            tariff (CompiledTariff): The tariff in effect
+            after_id (int): The chunk starts after this package id
+            until_id (int): The chunk ends with this package id
+
+        Returns:
+            int: The number of packages in the chunk
+    """
+    return await recalculate_packages(db, usd_rate, tariff, PackageTable.id > after_id, PackageTable.id <= until_id)
 
 
-# Delivery cost calculation task and renewing the delivery_cost field in the package table
-async def calculate_delivery_cost_task():
+def is_retryable(ex: DBAPIError) -> bool:
     """
-        The background task for periodic delivery cost calculations.
+        Checks whether the database error is a deadlock or a lock wait timeout, which succeed on a retry.
+    """
+    return bool(ex.orig is not None and ex.orig.args and ex.orig.args[0] in RETRYABLE_ERROR_CODES)
+
+
+async def recalculate_chunk_with_retries(bind: AsyncEngine, usd_rate: float | None, tariff: CompiledTariff,
+                                         after_id: int, until_id: int) -> int:
     """
-    logger.info('Starting calculating the delivery cost task')
-    r = await get_redis_client()
+        Recalculates one chunk in its own session, retrying it on deadlocks.
+
+        A retried chunk is recalculated from scratch, which is safe because only the costs
+        that differ from the stored ones are written.
+
+        Args:
+            bind (AsyncEngine): The engine the chunk sessions are opened on
+            usd_rate (float | None): The USD exchange rate
+            tariff (CompiledTariff): The tariff in effect
+            after_id (int): The chunk starts after this package id
+            until_id (int): The chunk ends with this package id
+
+        Returns:
+            int: The number of packages in the chunk
+    """
+    attempt = 0
     while True:
         try:
-            usd_rate = await get_usd_rate(r)
-            async with AsyncSessionLocal() as db:
-                stmt = select(PackageTable)
-                packages = (await db.execute(stmt)).all()
-
-                for package in packages:
-                    delivery_cost = calculate_delivery_cost(package[0].weight, package[0].content_value_usd, usd_rate)
-                    update_stmt = update(PackageTable).where(PackageTable.id == package[0].id).values(
-                        delivery_cost=delivery_cost)
-                    await db.execute(update_stmt)
-                    await db.commit()
-            # Waiting for 5 minutes before the next calculation
-            await asyncio.sleep(300)
-
-        except asyncio.CancelledError:
-            logger.info('The delivery cost task cancelled')
-            raise
-        except Exception as ex:
-            logger.error(f'The delivery cost task error: {str(ex)}')
-            # Waiting for 20 seconds before repeating
-            await asyncio.sleep(20)
-
-
-# One-time delivery cost calculation task and renewing the delivery_cost field in the package table
-async def calculate_delivery_cost_task_one_time():
-    """
-        Executes single-pass delivery cost calculations for all packages.
-    """
-    logger.info('Starting calculating the delivery cost task')
+            async with AsyncSession(bind=bind, expire_on_commit=False) as db:
+                return await recalculate_chunk(db, usd_rate, tariff, after_id, until_id)
+        except DBAPIError as ex:
+            if not is_retryable(ex) or attempt >= RECALCULATION_MAX_RETRIES:
+                raise
+            attempt += 1
+            delay = RECALCULATION_RETRY_DELAY * 2 ** attempt * random.uniform(0.5, 1.5)
+            logger.warning(f'Retrying the chunk ({after_id}, {until_id}] in {delay:.2f} s '
+                           f'after attempt {attempt}: {str(ex.orig)}')
+            await asyncio.sleep(delay)
+
+
+async def recalculate_delivery_costs(db: AsyncSession, usd_rate: float | None,
+                                     chunk_size: int = RECALCULATION_CHUNK_SIZE,
+                                     tariff: CompiledTariff | None = None,
+                                     concurrency: int = RECALCULATION_CONCURRENCY) -> int:
+    """
+        Recalculates the delivery cost of all the packages in the package table chunk by chunk.
+
+        The table is split into chunks of chunk_size packages by keyset, so the gaps in the ids, e.g. between
+        the packages moved to a shard and its own id range, cost nothing. The chunks are recalculated
+        concurrently by up to `concurrency` workers, each chunk in its own transaction on its own
+        connection. The number of chunks in flight shrinks when the chunk latency grows, so that
+        the recalculation backs off while the database is loaded.
+
+        Args:
+            db (AsyncSession): Database session, its engine provides the worker connections
+            usd_rate (float | None): The USD exchange rate
+            chunk_size (int): Number of packages per transaction
+            tariff (CompiledTariff | None): The tariff to price by, the tariff in effect by default
+            concurrency (int): Maximum number of chunks recalculated at once
+
+        Returns:
+            int: The number of processed chunks with packages
+    """
+    if not usd_rate:
+        logger.warning('No USD rate available for calculating the delivery cost')
+    if tariff is None:
+        tariff = await get_tariff(db)
+    # The worker sessions must not wait for locks held by this one
+    await db.commit()
+
+    boundaries_lock = asyncio.Lock()
+    last_id = 0
+    limiter = AdaptiveSemaphore(max(concurrency, 1))
+    chunks = 0
+    started = time.perf_counter()
+
+    async def next_chunk() -> tuple[int, int] | None:
+        # Every chunk starts after the last id of the previous one and ends with its chunk_size-th package
+        nonlocal last_id
+        async with boundaries_lock:
+            until_id = (await db.execute(
+                select(PackageTable.id).where(PackageTable.id > last_id).order_by(PackageTable.id)
+                .offset(chunk_size - 1).limit(1)
+            )).scalar()
+            if until_id is None:
+                until_id = (await db.execute(select(func.max(PackageTable.id))
+                                             .where(PackageTable.id > last_id))).scalar()
+            await db.commit()
+            if until_id is None:
+                return None
+            after_id, last_id = last_id, until_id
+            return after_id, until_id
+
+    async def worker():
+        nonlocal chunks
+        while (chunk := await next_chunk()) is not None:
+            await limiter.acquire()
+            chunk_started = time.perf_counter()
+            latency = None
+            try:
+                if await recalculate_chunk_with_retries(db.bind, usd_rate, tariff, *chunk):
+                    chunks += 1
+                latency = time.perf_counter() - chunk_started
+            finally:
+                limiter.release(latency)
+
+    async with asyncio.TaskGroup() as group:
+        for _ in range(max(concurrency, 1)):
+            group.create_task(worker())
+    logger.info(f'Recalculated {chunks} chunks in {time.perf_counter() - started:.2f} s, '
+                f'final concurrency {limiter.limit} of {concurrency}')
+    return chunks
+
+
+async def update_delivery_costs(db: AsyncSession, usd_rate: float | None, tariff: CompiledTariff | None = None):
+    """
+        Applies the current USD rate and tariff to the package delivery costs.
+
+        In the read-time pricing mode only a new rate version is inserted, otherwise all the packages
+        are recalculated.
+
+        Args:
+            db (AsyncSession): Database session
+            usd_rate (float | None): The USD exchange rate
+            tariff (CompiledTariff | None): The tariff to price by, the tariff in effect by default
+    """
+    if read_time_pricing():
+        await publish_rate_version(db, usd_rate)
+    else:
+        await recalculate_delivery_costs(db, usd_rate, tariff=tariff)
+
+
+# Prices the packages announced by the registration events of the package stream
+async def price_registered_packages(events: list[dict]):
+    """
+        Calculates the delivery cost of the newly registered packages, so that they do not wait
+        for the next recalculation.
+
+        Only the packages still without a cost are priced, which makes a repeated event harmless.
+        Nothing is done in the read-time pricing mode, where the costs are calculated on reading,
+        and without a USD rate, the recalculation prices the packages when the rate is available.
+
+        Args:
+            events (list[dict]): Package stream events
+    """
+    ids_by_shard = defaultdict(list)
+    for event in events:
+        if event['type'] == PACKAGE_REGISTERED:
+            ids_by_shard[shard_for_session(event['session_id'], shard_count())].append(event['package_id'])
+    if not ids_by_shard or read_time_pricing():
+        return
+    usd_rate = await get_usd_rate(await get_redis_client())
+    if not usd_rate:
+        return
+    session_factories = get_shard_factories()
+    # The tariffs are kept in the primary database
+    async with session_factories[0]() as db:
+        tariff = await get_tariff(db)
+    for shard, ids in ids_by_shard.items():
+        async with session_factories[shard]() as db:
+            await recalculate_packages(db, usd_rate, tariff, PackageTable.id.in_(ids),
+                                       PackageTable.delivery_cost.is_(None))
+
+
+# The scheduled job of the delivery cost calculation
+async def calculate_delivery_cost_job() -> dict[str, float | None]:
+    """
+        Applies the current USD rate and tariff to the package delivery costs of all shards in parallel.
+
+        Only packages in the package table are recalculated, archived packages keep
+        their final delivery cost.
+
+        Returns:
+            dict[str, float | None]: The applied USD rate and the number of shards
+    """
     redis_client = await get_redis_client()
-    try:
-        usd_rate = await get_usd_rate(redis_client)
-        async with AsyncSessionLocal() as db:
-            stmt = select(PackageTable)
-            packages = (await db.execute(stmt)).all()
-
-            for package in packages:
-                delivery_cost = calculate_delivery_cost(package[0].weight, package[0].content_value_usd, usd_rate)
-                update_stmt = update(PackageTable).where(PackageTable.id == package[0].id).values(
-                    delivery_cost=delivery_cost)
-                await db.execute(update_stmt)
-                await db.commit()
-    except asyncio.CancelledError:
-        logger.info('The delivery cost task cancelled')
-        raise
-    except Exception as ex:
-        logger.error(f'The delivery cost task error: {str(ex)}')
+    usd_rate = await get_usd_rate(redis_client)
+    session_factories = get_shard_factories()
+    # The tariffs are kept in the primary database
+    async with session_factories[0]() as db:
+        tariff = None if read_time_pricing() else await get_tariff(db)
+
+    async def update_shard(session_factory: sessionmaker):
+        async with session_factory() as db:
+            await update_delivery_costs(db, usd_rate, tariff)
+
+    async with asyncio.TaskGroup() as group:
+        for session_factory in session_factories:
+            group.create_task(update_shard(session_factory))
+    return {'usd_rate': usd_rate, 'shards': len(session_factories)}
@@ -0,0 +1,96 @@
+import logging
+import os
+
+import asyncio
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.packages import PackageOutboxTable
+from redis_db.package_stream import StreamConsumer, add_to_stream
+from utils.session import get_shard_factories
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Number of outbox events relayed to the stream in one transaction
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 500))
+# Pause of the relay when the outbox is drained
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 0.5))
+
+
+async def relay_outbox(db: AsyncSession, shard: int, batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """
+        Moves one batch of the outbox events of a shard to the package stream.
+
+        The events are locked with SKIP LOCKED, so several relays share the outbox, and deleted
+        only after they are added to the stream. If the relay stops in between, the events are added
+        again with the same event ids and the consumers skip them.
+
+        Args:
+            db (AsyncSession): Session of the shard
+            shard (int): Shard index, a part of the event ids
+            batch_size (int): Maximum number of events
+
+        Returns:
+            int: The number of relayed events
+    """
+    rows = (await db.execute(
+        select(PackageOutboxTable)
+        .order_by(PackageOutboxTable.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )).scalars().all()
+    if not rows:
+        await db.commit()
+        return 0
+    await add_to_stream([
+        {'event_id': f'{shard}-{row.id}', 'type': row.event_type, 'package_id': row.package_id,
+         'session_id': row.session_id, **row.payload}
+        for row in rows
+    ])
+    await db.execute(delete(PackageOutboxTable).where(PackageOutboxTable.id.in_([row.id for row in rows])))
+    await db.commit()
+    return len(rows)
+
+
+async def run_outbox_relay():
+    """
+        Relays the outbox events of all the shards until cancelled.
+    """
+    while not asyncio.current_task().cancelling():
+        try:
+            drained = True
+            for shard, session_factory in enumerate(get_shard_factories()):
+                async with session_factory() as db:
+                    if await relay_outbox(db, shard) == OUTBOX_BATCH_SIZE:
+                        drained = False
+            if drained:
+                await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            logger.error(f'Outbox relay error: {str(ex) or type(ex).__name__}')
+            await asyncio.sleep(1)
+
+
+def get_consumers() -> list[StreamConsumer]:
+    """
+        Returns the consumer groups of the package stream.
+
+        Returns:
+            list[StreamConsumer]: The consumers of this process, one per group
+    """
+    from tasks.calculate_delivery_cost_task import price_registered_packages
+
+    return [StreamConsumer('pricing', price_registered_packages)]
+
+
+def start_package_stream() -> list[asyncio.Task]:
+    """
+        Starts the outbox relay and the package stream consumers.
+
+        Returns:
+            list[asyncio.Task]: The started loops
+    """
+    return [asyncio.create_task(run_outbox_relay()),
+            *(asyncio.create_task(consumer.run()) for consumer in get_consumers())]
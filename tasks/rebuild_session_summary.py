@@ -0,0 +1,45 @@
+"""
+    Rebuilds the session summary from the package and package archive tables.
+
+    Usage:
+        python -m tasks.rebuild_session_summary
+
+    Used to backfill the summary after the migration and to repair it after manual changes of packages.
+"""
+import logging
+
+import asyncio
+
+from utils.session import get_shard_factories, dispose_engine
+from utils.summary import rebuild_session_summary
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# Executes the session summary rebuild by request
+async def rebuild_session_summary_one_time() -> dict[str, int]:
+    """
+        Executes a single rebuild of the session summary on every shard.
+
+        Returns:
+            dict[str, int]: The number of summary rows
+    """
+    logger.info('Starting the session summary rebuild')
+    rows = 0
+    for session_factory in get_shard_factories():
+        async with session_factory() as db:
+            rows += await rebuild_session_summary(db)
+    logger.info(f'The session summary rebuilt with {rows} rows')
+    return {'rows': rows}
+
+
+async def main():
+    try:
+        await rebuild_session_summary_one_time()
+    finally:
+        await dispose_engine()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,174 @@
+"""
+    Prepares the shards and moves the packages of the sessions to the shards they belong to.
+
+    Usage:
+        python -m tasks.reshard init
+        python -m tasks.reshard move [--dry-run] [--batch-size 100]
+
+    `init` sets the package id counter of every shard to its own range, so that the ids allocated
+    by different shards never collide. It is run once after migrating a new shard.
+
+    `move` is run after a shard is appended to DATABASE_SHARD_HOSTS and the application is restarted
+    with it. The jump hash moves the sessions only to the new shard, and until their packages are copied
+    those sessions see only the packages registered after the restart. A move is repeatable: the rows
+    are copied with INSERT IGNORE and the summary of the moved sessions is recomputed on the target,
+    so an interrupted run is completed by running it again.
+"""
+import argparse
+import json
+import logging
+
+import asyncio
+from sqlalchemy import select, delete, func, text, union
+from sqlalchemy.dialects.mysql import insert
+
+from db.packages import PackageTable, PackageArchiveTable, SessionSummaryTable
+from redis_db.versions import bump_session_versions
+from utils.session import get_shard_factories, dispose_engine
+from utils.sharding import shard_for_session, first_package_id
+from utils.summary import rebuild_session_summary
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Number of sessions moved in one transaction
+RESHARD_BATCH_SIZE = 100
+
+
+async def init_shards() -> dict[int, int]:
+    """
+        Moves the package id counter of every shard after the primary one to the start of its range.
+
+        Returns:
+            dict[int, int]: The next package id by shard
+    """
+    next_ids = {}
+    for shard, session_factory in enumerate(get_shard_factories()):
+        if shard == 0:
+            continue
+        async with session_factory() as db:
+            max_id = (await db.execute(select(func.max(PackageTable.id)))).scalar() or 0
+            next_ids[shard] = max(max_id + 1, first_package_id(shard))
+            if max_id < first_package_id(shard):
+                await db.execute(text(f'ALTER TABLE package AUTO_INCREMENT = {first_package_id(shard)}'))
+                logger.info(f'Shard {shard} allocates package ids from {first_package_id(shard)}')
+    return next_ids
+
+
+async def misplaced_sessions(db, shard: int, shards: int) -> dict[int, list[str]]:
+    """
+        Finds the sessions of the shard that belong to other shards.
+
+        Args:
+            db (AsyncSession): Session of the shard
+            shard (int): Shard index
+            shards (int): Number of shards
+
+        Returns:
+            dict[int, list[str]]: The misplaced sessions by their target shard
+    """
+    session_ids = (await db.execute(union(
+        select(PackageTable.session_id),
+        select(PackageArchiveTable.session_id),
+        select(SessionSummaryTable.session_id)
+    ))).scalars().all()
+    targets: dict[int, list[str]] = {}
+    for session_id in session_ids:
+        target = shard_for_session(session_id, shards)
+        if target != shard:
+            targets.setdefault(target, []).append(session_id)
+    return targets
+
+
+async def copy_rows(source, target, table, session_ids: list[str]) -> int:
+    """
+        Copies the rows of the sessions from the source shard, skipping the rows already copied.
+    """
+    rows = (await source.execute(
+        select(table.__table__).where(table.session_id.in_(session_ids))
+    )).mappings().all()
+    if rows:
+        await target.execute(insert(table).prefix_with('IGNORE'), [dict(row) for row in rows])
+    return len(rows)
+
+
+async def move_sessions(source, target, session_ids: list[str]) -> int:
+    """
+        Moves the packages, archived packages and summary of the sessions between two shards.
+
+        The target transaction is committed before the rows are deleted from the source,
+        so a failure in between leaves the rows on both shards until the next run.
+
+        Returns:
+            int: The number of moved packages, archived ones included
+    """
+    moved = await copy_rows(source, target, PackageTable, session_ids)
+    moved += await copy_rows(source, target, PackageArchiveTable, session_ids)
+    # Commits the copied rows together with their summary
+    await rebuild_session_summary(target, session_ids)
+
+    for table in (PackageTable, PackageArchiveTable, SessionSummaryTable):
+        await source.execute(delete(table).where(table.session_id.in_(session_ids)))
+    await source.commit()
+    await bump_session_versions(session_ids)
+    return moved
+
+
+async def move_packages(dry_run: bool = False, batch_size: int = RESHARD_BATCH_SIZE) -> dict[str, int]:
+    """
+        Moves the sessions found on other shards than the ones they belong to.
+
+        Only moves to the shards after the source one are done. The package id ranges of the shards follow
+        their order, and the sessions move only to the appended shards when the shards are added,
+        so a move backwards means the shards were removed or reordered.
+
+        Args:
+            dry_run (bool): Only count the misplaced sessions
+            batch_size (int): Number of sessions moved in one transaction
+
+        Returns:
+            dict[str, int]: The number of misplaced sessions and moved packages
+
+        Raises:
+            RuntimeError: If a session has to move to a shard before its current one
+    """
+    session_factories = get_shard_factories()
+    sessions = packages = 0
+    for shard, session_factory in enumerate(session_factories):
+        async with session_factory() as source:
+            targets = await misplaced_sessions(source, shard, len(session_factories))
+            await source.commit()
+            if any(target < shard for target in targets):
+                raise RuntimeError(f'Shard {shard} holds sessions of the shards before it, '
+                                   f'removing or reordering the shards is not supported')
+            for target_shard, session_ids in sorted(targets.items()):
+                sessions += len(session_ids)
+                logger.info(f'{len(session_ids)} sessions move from shard {shard} to shard {target_shard}')
+                if dry_run:
+                    continue
+                async with session_factories[target_shard]() as target:
+                    for start in range(0, len(session_ids), batch_size):
+                        packages += await move_sessions(source, target, session_ids[start:start + batch_size])
+    return {'sessions': sessions, 'packages': packages}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Package shards maintenance')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('init', help='set the package id ranges of the shards')
+    move = commands.add_parser('move', help='move the sessions to the shards they belong to')
+    move.add_argument('--dry-run', action='store_true')
+    move.add_argument('--batch-size', type=int, default=RESHARD_BATCH_SIZE)
+    args = parser.parse_args()
+    try:
+        if args.command == 'init':
+            result = await init_shards()
+        else:
+            result = await move_packages(args.dry_run, args.batch_size)
+        print(json.dumps(result, indent=2))
+    finally:
+        await dispose_engine()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
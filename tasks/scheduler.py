@@ -0,0 +1,359 @@
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+import asyncio
+
+from redis_db.redis_setup import get_redis_client, redis_call, execute_pipeline
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Number of runs kept in the history of every job
+JOB_HISTORY_SIZE = 50
+JOB_RUNS_KEY = 'job_runs:{name}'
+JOB_STATE_KEY = 'job_state:{name}'
+JOB_LOCK_KEY = 'job_lock:{name}'
+# Lifetime of the lock of a running job, in case its process dies without releasing it
+JOB_LOCK_TTL = int(os.getenv('JOB_LOCK_TTL', 3600))
+# Deletes the lock only if it is still held by the releasing run
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class IntervalSchedule:
+    """
+        Runs a job every `seconds` seconds, each delay randomly spread by `jitter` of it.
+    """
+    def __init__(self, seconds: float, jitter: float = 0.1):
+        self.seconds = seconds
+        self.jitter = jitter
+
+    def next_run(self, after: datetime) -> datetime:
+        return after + timedelta(seconds=self.seconds * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def __str__(self) -> str:
+        return f'every {self.seconds:g} s'
+
+
+class CronSchedule:
+    """
+        Runs a job by a five-field cron expression in UTC: minute, hour, day of month, month, day of week.
+
+        The fields support '*', numbers, ranges 'a-b', lists 'a,b' and steps '*/n' or 'a-b/n'.
+        The day of week is 0-6 starting with Sunday, 7 is Sunday too. As in cron, when both
+        the day of month and the day of week are restricted, a day matching either of them is used.
+    """
+    FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f'Cron expression must have 5 fields: {expression}')
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self.parse_field(value, *limits) for value, limits in zip(fields, self.FIELD_RANGES)
+        )
+        self.weekdays = {weekday % 7 for weekday in weekdays}
+        self.days_restricted = fields[2] != '*'
+        self.weekdays_restricted = fields[4] != '*'
+
+    @staticmethod
+    def parse_field(value: str, low: int, high: int) -> set[int]:
+        """
+            Expands one cron field to the set of matching values.
+        """
+        values = set()
+        for part in value.split(','):
+            part_range, _, step = part.partition('/')
+            if part_range == '*':
+                start, end = low, high
+            elif '-' in part_range:
+                start, end = (int(bound) for bound in part_range.split('-'))
+            else:
+                start = end = int(part_range)
+            if start < low or end > high or start > end:
+                raise ValueError(f'Cron field {value} is out of range {low}-{high}')
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def day_matches(self, moment: datetime) -> bool:
+        # datetime.weekday() starts with Monday
+        day_match = moment.day in self.days
+        weekday_match = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.days_restricted and self.weekdays_restricted:
+            return day_match or weekday_match
+        return day_match and weekday_match
+
+    def next_run(self, after: datetime) -> datetime:
+        """
+            Finds the first matching minute after the given moment, skipping whole non-matching
+            months, days and hours.
+        """
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not self.day_matches(moment):
+                moment = (moment + timedelta(days=1)).replace(hour=0, minute=0)
+            elif moment.hour not in self.hours:
+                moment = (moment + timedelta(hours=1)).replace(minute=0)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f'Cron expression {self.expression} never matches')
+
+    def __str__(self) -> str:
+        return f'cron {self.expression}'
+
+
+class JobAlreadyRunning(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    """
+        A scheduled job.
+
+        Attributes:
+            name: Job name
+            func: Coroutine function doing the work, its result is kept in the run history
+            schedule: IntervalSchedule or CronSchedule
+            run_on_start: Whether the job runs when the scheduler starts
+            missed_runs: 'skip' drops the runs missed while the job was running or the process was busy,
+                'run_once' runs the job once immediately for all of them
+            retry_delay: Delay before the first retry of a failed run, doubled for every next failure
+            max_retry_delay: Maximum delay between retries
+    """
+    name: str
+    func: Callable[[], Awaitable[dict | None]]
+    schedule: IntervalSchedule | CronSchedule
+    run_on_start: bool = False
+    missed_runs: str = 'skip'
+    retry_delay: float = 20
+    max_retry_delay: float = 600
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    history: deque = field(default_factory=lambda: deque(maxlen=JOB_HISTORY_SIZE))
+    next_run_at: datetime | None = None
+    failures: int = 0
+
+    def retry_after(self) -> float:
+        """
+            Returns the backoff delay after the current number of consecutive failures.
+        """
+        delay = min(self.retry_delay * 2 ** (self.failures - 1), self.max_retry_delay)
+        return delay * random.uniform(0.9, 1.1)
+
+
+class Scheduler:
+    """
+        Runs the registered jobs by their schedules in the current event loop.
+
+        A job never runs concurrently with itself: a scheduled run waits for a manual one of
+        the same process to finish, and is skipped when the job is running in another process,
+        which is tracked by a Redis lock. A manual run of a running job is rejected. A failed run is
+        retried with exponential backoff instead of the regular schedule. Every run is timed
+        and kept in the job history, which is also stored in Redis, so that the history of
+        the worker process can be read by the api processes.
+    """
+    def __init__(self, jobs: list[Job]):
+        self.jobs = {job.name: job for job in jobs}
+
+    def start(self) -> list[asyncio.Task]:
+        """
+            Starts the job loops.
+
+            Returns:
+                list[asyncio.Task]: The job loop tasks, cancelled to stop the scheduler
+        """
+        return [asyncio.create_task(self.run_job_loop(job), name=f'job:{job.name}') for job in self.jobs.values()]
+
+    async def run_job_loop(self, job: Job):
+        """
+            Runs the job by its schedule until cancelled.
+        """
+        now = datetime.utcnow()
+        job.next_run_at = now if job.run_on_start else job.schedule.next_run(now)
+        logger.info(f'Job {job.name} scheduled {job.schedule}, next run at {job.next_run_at} UTC')
+        while True:
+            await self.save_state(job)
+            await asyncio.sleep(max((job.next_run_at - datetime.utcnow()).total_seconds(), 0))
+            scheduled_at = job.next_run_at
+            async with job.lock:
+                record = await self.execute(job, 'schedule')
+
+            now = datetime.utcnow()
+            if record['status'] == 'skipped':
+                job.next_run_at = job.schedule.next_run(now)
+                continue
+            if record['status'] == 'error':
+                job.next_run_at = now + timedelta(seconds=job.retry_after())
+                continue
+            job.next_run_at = job.schedule.next_run(scheduled_at)
+            if job.next_run_at <= now:
+                missed = job.next_run_at
+                # The runs scheduled while the job was running
+                job.next_run_at = now if job.missed_runs == 'run_once' else job.schedule.next_run(now)
+                logger.warning(f'Job {job.name} missed the run at {missed} UTC, '
+                               f'next run at {job.next_run_at} UTC')
+
+    async def run_now(self, name: str) -> dict:
+        """
+            Runs a job immediately, outside of its schedule.
+
+            Args:
+                name (str): Job name
+
+            Returns:
+                dict: The run record
+
+            Raises:
+                KeyError: If there is no such job
+                JobAlreadyRunning: If the job is running
+        """
+        job = self.jobs[name]
+        if job.lock.locked():
+            raise JobAlreadyRunning(f'Job {name} is already running')
+        async with job.lock:
+            record = await self.execute(job, 'manual')
+        if record['status'] == 'skipped':
+            raise JobAlreadyRunning(f'Job {name} is already running in another process')
+        return record
+
+    async def execute(self, job: Job, trigger: str) -> dict:
+        """
+            Runs the job once and records the run.
+        """
+        record = {'job': job.name, 'trigger': trigger, 'started_at': datetime.utcnow().isoformat()}
+        token = uuid.uuid4().hex
+        if not await self.acquire_lock(job, token):
+            logger.info(f'Job {job.name} is running in another process, the run is skipped')
+            record.update(status='skipped', seconds=0)
+            return record
+
+        started = time.perf_counter()
+        logger.info(f'Job {job.name} started ({trigger})')
+        try:
+            result = await job.func()
+            job.failures = 0
+            record.update(status='ok', result=result)
+        except asyncio.CancelledError:
+            logger.info(f'Job {job.name} cancelled')
+            raise
+        except Exception as ex:
+            job.failures += 1
+            logger.error(f'Job {job.name} failed ({job.failures} in a row): {str(ex) or type(ex).__name__}')
+            record.update(status='error', error=str(ex) or type(ex).__name__)
+        finally:
+            await self.release_lock(job, token)
+        record['seconds'] = round(time.perf_counter() - started, 3)
+        logger.info(f'Job {job.name} finished with {record["status"]} in {record["seconds"]} s')
+        job.history.appendleft(record)
+        await self.save_run(job, record)
+        return record
+
+    async def acquire_lock(self, job: Job, token: str) -> bool:
+        """
+            Takes the Redis lock of the job.
+
+            Without Redis the job runs, guarded by the process lock only.
+
+            Returns:
+                bool: False if the job is running in another process
+        """
+        try:
+            redis_client = await get_redis_client()
+            return bool(await redis_call(redis_client.set(JOB_LOCK_KEY.format(name=job.name), token,
+                                                          nx=True, ex=JOB_LOCK_TTL)))
+        except Exception as ex:
+            logger.warning(f'Failed to lock job {job.name}: {str(ex) or type(ex).__name__}')
+            return True
+
+    async def release_lock(self, job: Job, token: str):
+        try:
+            redis_client = await get_redis_client()
+            await redis_call(redis_client.eval(RELEASE_LOCK_SCRIPT, 1, JOB_LOCK_KEY.format(name=job.name), token))
+        except Exception as ex:
+            logger.warning(f'Failed to unlock job {job.name}: {str(ex) or type(ex).__name__}')
+
+    async def save_run(self, job: Job, record: dict):
+        """
+            Stores the run record in the Redis history of the job.
+        """
+        key = JOB_RUNS_KEY.format(name=job.name)
+
+        def build(pipe):
+            pipe.lpush(key, json.dumps(record, default=str))
+            pipe.ltrim(key, 0, JOB_HISTORY_SIZE - 1)
+
+        try:
+            await execute_pipeline(build)
+        except Exception as ex:
+            logger.warning(f'Failed to store the run of job {job.name}: {str(ex) or type(ex).__name__}')
+
+    async def save_state(self, job: Job):
+        """
+            Stores the schedule state of the job in Redis.
+        """
+        try:
+            redis_client = await get_redis_client()
+            await redis_call(redis_client.hset(JOB_STATE_KEY.format(name=job.name), mapping={
+                'next_run_at': job.next_run_at.isoformat(),
+                'failures': job.failures
+            }))
+        except Exception as ex:
+            logger.warning(f'Failed to store the state of job {job.name}: {str(ex) or type(ex).__name__}')
+
+    async def status(self) -> list[dict]:
+        """
+            Returns the schedule, the state and the recent runs of every job.
+
+            The state and the history are read from Redis, which has the ones of the process
+            running the schedule, and from the process memory when Redis is not available.
+
+            Returns:
+                list[dict]: The job statuses
+        """
+        def build(pipe):
+            for name in self.jobs:
+                pipe.hgetall(JOB_STATE_KEY.format(name=name))
+                pipe.lrange(JOB_RUNS_KEY.format(name=name), 0, JOB_HISTORY_SIZE - 1)
+                pipe.exists(JOB_LOCK_KEY.format(name=name))
+
+        try:
+            stored = await execute_pipeline(build)
+        except Exception as ex:
+            logger.warning(f'Failed to read the job history: {str(ex) or type(ex).__name__}')
+            stored = None
+
+        statuses = []
+        for number, job in enumerate(self.jobs.values()):
+            if stored is not None:
+                state, runs, locked = stored[3 * number:3 * number + 3]
+                runs = [json.loads(run) for run in runs]
+            else:
+                state, runs, locked = {}, list(job.history), False
+            statuses.append({
+                'name': job.name,
+                'schedule': str(job.schedule),
+                'missed_runs': job.missed_runs,
+                'running': job.lock.locked() or bool(locked),
+                'next_run_at': state.get('next_run_at') or (job.next_run_at.isoformat() if job.next_run_at else None),
+                'failures': int(state.get('failures', job.failures)),
+                'runs': runs
+            })
+        return statuses
@@ -1,108 +1,73 @@
 import logging
-from datetime import datetime, timedelta
+import os
+from datetime import datetime
 
-import asyncio
-import httpx
-
-from redis_db.redis_setup import get_redis_client
+from redis_db.redis_setup import execute_pipeline
+from tasks.calculate_delivery_cost_task import remember_usd_rate
+from utils.cbr_client import Rates, RateSourceError, get_cbr_client
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# The rate is published by CBR on working days, 12:00 Moscow time
+USD_RATE_SCHEDULE = os.getenv('USD_RATE_SCHEDULE', '0 9 * * 1-5')
+RATE_KEY = '{code}_rate:{date}'
+# Saving for two days in case of weekend
+RATE_TTL = 48 * 3600
+
 
-# Fetches the USD rate and stores it into redis
-async def fetch_and_store_rate():
+# Stores all the fetched rates into redis
+async def store_rates(rates: Rates):
     """
-        Fetches the USD exchange rate and stores it in Redis.
+        Stores the rates of all currencies for today with one Redis pipeline.
 
-        Returns:
-            float | None:
-                - The USD rate on success
-                - None on failure
+        A failure is logged, the rates are still used by the process.
+
+        Args:
+            rates (Rates): The fetched rates
     """
-    logger.info('Fetching USD/RUB rate from CBR...')
+    today = datetime.utcnow().strftime('%Y-%m-%d')
+
+    def build(pipe):
+        for code, value in rates.values.items():
+            pipe.setex(RATE_KEY.format(code=code.lower(), date=today), RATE_TTL, value)
+
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                'https://www.cbr-xml-daily.ru/daily_json.js',
-                timeout=30.0
-            )
-            response.raise_for_status()
-            data = response.json()
-            usd_rate = data['Valute']['USD']['Value']
-
-            r = await get_redis_client()
-            today = datetime.utcnow().strftime('%Y-%m-%d')
-            cache_key = f'usd_rate:{today}'
-
-            try:
-                # Saving for two days in case of weekend
-                await r.setex(cache_key, 48 * 3600, usd_rate)
-                logger.info(f'USD rate updated: {usd_rate}')
-            except ConnectionError:
-                logger.error('Redis connection error during set')
-            except Exception as ex:
-                logger.error(f'Failed to save rate to Redis: {str(ex)}')
-
-            return usd_rate
-    except httpx.HTTPError as ex:
-        logger.error(f'HTTP error: {str(ex)}')
+        await execute_pipeline(build)
     except Exception as ex:
-        logger.error(f'Failed to fetch USD rate: {str(ex)}')
-    return None
+        logger.error(f'Failed to save the rates to Redis: {str(ex) or type(ex).__name__}')
 
 
-# Task for periodic the USD exchange rate updates
-async def usd_rate_task():
+# Fetches the rates and stores them into redis
+async def fetch_and_store_rate() -> Rates:
     """
-        The background task for the USD rate updates.
+        Fetches the exchange rates and stores them in Redis.
+
+        Returns:
+            Rates: The fetched rates
+
+        Raises:
+            RateSourceError: If the rates are not fetched
     """
-    logger.info('Starting rate update task')
-
-    await fetch_and_store_rate()
-
-    while True:
-        try:
-            # Time till the next update (12:00 Moscow timezone)
-            now = datetime.utcnow()
-            next_run = (now + timedelta(days=1)).replace(
-                hour=9, minute=0, second=0, microsecond=0  # UTC 9:00
-            )
-
-            # If it is already after 12:00, then the next run is set
-            if now > next_run:
-                next_run += timedelta(days=1)
-
-            sleep_seconds = (next_run - now).total_seconds()
-            logger.info(f"Next rate update in {sleep_seconds:.0f} seconds at {next_run} UTC")
-
-            # Sleeps till the next update
-            await asyncio.sleep(sleep_seconds)
-
-            # Checks if the working day
-            if next_run.weekday() < 5:
-                await fetch_and_store_rate()
-            else:
-                logger.info("Skipping update on weekend")
-        except asyncio.CancelledError:
-            logger.error("USD rate update task cancelled")
-            raise
-        except Exception as ex:
-            logger.error(f"Scheduler error: {str(ex)}")
-            await asyncio.sleep(60)
-
-
-# Executes the USD exchange rate update by request
-async def usd_rate_task_one_time():
+    logger.info('Fetching the rates from CBR...')
+    rates = await get_cbr_client().fetch_rates()
+    if 'USD' not in rates.values:
+        raise RateSourceError('The CBR response has no USD rate')
+    # Prices keep using the new rate even if it cannot be saved to Redis
+    remember_usd_rate(rates.values['USD'])
+    await store_rates(rates)
+    logger.info(f'USD rate {"updated" if rates.modified else "not changed"}: {rates.values["USD"]}')
+    return rates
+
+
+# The scheduled job of the USD exchange rate updates
+async def refresh_usd_rate_job() -> dict:
     """
-        Executes a single USD rate update request.
+        Fetches and stores the rates, a failed fetch fails the run, so that the scheduler retries it.
+
+        Returns:
+            dict: The USD rate, its publication date and whether it changed since the previous fetch
     """
-    logger.info("Starting the rate update task")
-    try:
-        await fetch_and_store_rate()
-    except asyncio.CancelledError:
-        logger.error("The USD rate update task cancelled")
-        raise
-    except Exception as ex:
-        logger.error(f"Scheduler error: {str(ex)}")
-        await asyncio.sleep(60)
+    rates = await fetch_and_store_rate()
+    return {'usd_rate': rates.values['USD'], 'date': rates.date, 'modified': rates.modified,
+            'currencies': len(rates.values)}
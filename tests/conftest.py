@@ -1,6 +1,7 @@
 import os
 
 import pytest
+from environs import Env
 from httpx import AsyncClient
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
@@ -10,17 +11,33 @@ from httpx import ASGITransport
 
 from db.base import Base
 from main import app
-from utils.session import get_session_id, get_db
+from utils.db_utils import database_url
+from utils.session import get_session_id, get_db, get_session_factory
 from db.packages import PackageTypeTable
+from db import tariffs # noqa: F401
+from redis_db.redis_setup import get_redis_client, close_redis_client, redis_call
+
+# Database credentials come from .env, the application no longer reads it on import
+Env().read_env()
 
 # Set testing mode
 os.environ['TESTING'] = 'True'
 os.environ['TEST_DATABASE_NAME'] = 'test_delivery_service'
 
 
-# Test database settings
-TEST_DB_URL = (f'mysql+asyncmy://{os.environ["DATABASE_USER"]}:{os.environ["DATABASE_PASSWORD"]}'
-               f'@{os.environ["DATABASE_HOST"]}:{os.environ["DATABASE_PORT"]}/{os.environ["TEST_DATABASE_NAME"]}')
+# The driver of the test database, the driver comparison tests run on all of them
+TEST_DATABASE_DRIVER = os.environ.get('TEST_DATABASE_DRIVER', 'asyncmy')
+
+
+@pytest.fixture(scope='session')
+def database_driver():
+    return TEST_DATABASE_DRIVER
+
+
+def get_test_db_url(driver: str) -> str:
+    return database_url(os.environ['DATABASE_USER'], os.environ['DATABASE_PASSWORD'],
+                        f'{os.environ["DATABASE_HOST"]}:{os.environ["DATABASE_PORT"]}',
+                        os.environ['TEST_DATABASE_NAME'], driver)
 
 
 @pytest.fixture(scope='session')
@@ -37,10 +54,11 @@ def apply_migrations():
         conn.execute(text(f'DROP DATABASE {os.environ["TEST_DATABASE_NAME"]}'))
 
 
-@pytest.fixture(autouse=True)
-async def db(apply_migrations):
+# Only the tests using the database need a MySQL server
+@pytest.fixture
+async def db(apply_migrations, database_driver):
     engine = create_async_engine(
-        TEST_DB_URL,
+        get_test_db_url(database_driver),
         pool_pre_ping=True,
         echo=False
     )
@@ -55,6 +73,7 @@ async def db(apply_migrations):
 
     async with async_session() as session:
         try:
+            await prepopulate_db(session)
             yield session
         finally:
             await session.close()
@@ -65,6 +84,11 @@ async def db(apply_migrations):
 async def client(db):
     app.dependency_overrides[get_db] = lambda: db
     app.dependency_overrides[get_session_id] = lambda: 'test_session_id'
+    app.dependency_overrides[get_session_factory] = lambda: sessionmaker(
+        bind=db.bind,
+        class_=AsyncSession,
+        expire_on_commit=False
+    )
 
     async with AsyncClient(
             transport=ASGITransport(app=app),
@@ -73,8 +97,20 @@ async def client(db):
         yield ac
 
 
-# Fixture for prepopulating package types
-@pytest.fixture(autouse=True)
+# Only the tests using Redis need a Redis server, the client is closed in the event loop of the test
+@pytest.fixture
+async def redis_client():
+    client = await get_redis_client()
+    try:
+        await redis_call(client.ping())
+    except Exception as ex:
+        await close_redis_client()
+        pytest.skip(f'Redis is not available: {str(ex) or type(ex).__name__}')
+    yield client
+    await close_redis_client()
+
+
+# Prepopulates package types
 async def prepopulate_db(db):
     package_types = ['одежда', 'электроника', 'разное']
     await db.execute(text('DELETE FROM package_type WHERE id > 3'))
@@ -11,3 +11,31 @@ async def test_manual_refresh_usd_rate(client):
 async def test_calculate_delivery_cost(client):
     response = await client.post('/api/v1/tasks/calculate_delivery_cost')
     assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_archive_job_rolls_back_a_failed_shard(monkeypatch):
+    from tasks import archive_packages_task
+
+    class FakeSession:
+        rolled_back = False
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *args):
+            pass
+
+        async def rollback(self):
+            self.rolled_back = True
+
+    db = FakeSession()
+
+    async def failing_archive(session):
+        raise RuntimeError('Deadlock found when trying to get lock')
+
+    monkeypatch.setattr(archive_packages_task, 'get_shard_factories', lambda: [lambda: db])
+    monkeypatch.setattr(archive_packages_task, 'archive_packages', failing_archive)
+    with pytest.raises(RuntimeError):
+        await archive_packages_task.archive_packages_job()
+    assert db.rolled_back
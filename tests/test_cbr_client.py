@@ -0,0 +1,63 @@
+import httpx
+import pytest
+
+from utils.cbr_client import CbrClient, CircuitBreaker, CircuitOpenError, RateSourceError
+
+RATES = {
+    'Date': '2026-10-17T11:30:00+03:00',
+    'Valute': {
+        'USD': {'Nominal': 1, 'Value': 81.5},
+        'JPY': {'Nominal': 100, 'Value': 53.2}
+    }
+}
+
+
+class FakeCbr:
+    """
+        Serves the rates with an ETag, failing the given number of requests first.
+    """
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.requests: list[httpx.Request] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if self.failures:
+            self.failures -= 1
+            return httpx.Response(503)
+        if request.headers.get('If-None-Match') == '"v1"':
+            return httpx.Response(304, headers={'ETag': '"v1"'})
+        return httpx.Response(200, json=RATES, headers={'ETag': '"v1"'})
+
+
+@pytest.mark.asyncio
+async def test_conditional_fetch():
+    cbr = FakeCbr()
+    client = CbrClient(transport=httpx.MockTransport(cbr), retry_delay=0)
+
+    rates = await client.fetch_rates()
+    assert rates.modified
+    assert rates.values == {'USD': 81.5, 'JPY': 0.532}
+
+    rates = await client.fetch_rates()
+    assert not rates.modified
+    assert rates.values['USD'] == 81.5
+    assert cbr.requests[1].headers['If-None-Match'] == '"v1"'
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_retries_and_circuit_breaker():
+    cbr = FakeCbr(failures=2)
+    client = CbrClient(transport=httpx.MockTransport(cbr), max_retries=2, retry_delay=0,
+                       breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60))
+    assert (await client.fetch_rates()).values['USD'] == 81.5
+    assert len(cbr.requests) == 3
+
+    cbr.failures = 3
+    with pytest.raises(RateSourceError):
+        await client.fetch_rates()
+    with pytest.raises(CircuitOpenError):
+        await client.fetch_rates()
+    assert len(cbr.requests) == 6
+    await client.close()
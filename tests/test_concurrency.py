@@ -0,0 +1,22 @@
+import pytest
+
+from utils.concurrency import AdaptiveSemaphore
+
+
+@pytest.mark.asyncio
+async def test_adaptive_semaphore_follows_latency():
+    semaphore = AdaptiveSemaphore(max_limit=4, min_limit=1, latency_tolerance=2.0)
+    for _ in range(4):
+        await semaphore.acquire()
+        semaphore.release(0.1)
+    assert semaphore.limit == 4
+
+    for _ in range(2):
+        await semaphore.acquire()
+        semaphore.release(1.0)
+    assert semaphore.limit == 2
+
+    for _ in range(10):
+        await semaphore.acquire()
+        semaphore.release(0.1)
+    assert semaphore.limit > 2
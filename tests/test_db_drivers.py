@@ -0,0 +1,51 @@
+import pytest
+from sqlalchemy import select, update, text
+from sqlalchemy.exc import DBAPIError
+
+from db.packages import PackageTable
+from tasks.calculate_delivery_cost_task import is_retryable
+from utils.db_utils import DATABASE_DRIVERS
+
+# The only tests running on every driver, the rest of the suite uses TEST_DATABASE_DRIVER
+pytestmark = pytest.mark.parametrize('database_driver', DATABASE_DRIVERS)
+
+
+async def add_packages(db, count: int) -> list[int]:
+    packages = [PackageTable(name=f'Driver {number}', weight=1.0, type_id=1, content_value_usd=10,
+                             session_id='test_session_id') for number in range(count)]
+    db.add_all(packages)
+    await db.commit()
+    return [package.id for package in packages]
+
+
+@pytest.mark.asyncio
+async def test_rowcount_counts_matched_rows(db):
+    # The claims of the shipping companies compare the rowcount with the number of the matched packages
+    package_id, = await add_packages(db, 1)
+    result = await db.execute(update(PackageTable).where(PackageTable.id == package_id).values(name='Driver 0'))
+    await db.commit()
+    assert result.rowcount == 1
+
+
+@pytest.mark.asyncio
+async def test_bulk_update(db):
+    package_ids = await add_packages(db, 3)
+    # The bulk update by primary key of the delivery cost recalculation
+    await db.execute(update(PackageTable), [{'id': package_id, 'delivery_cost': float(number)}
+                                            for number, package_id in enumerate(package_ids)])
+    await db.commit()
+    costs = (await db.execute(select(PackageTable.delivery_cost).where(PackageTable.id.in_(package_ids))
+                              .order_by(PackageTable.id))).scalars().all()
+    assert costs == [0.0, 1.0, 2.0]
+
+
+@pytest.mark.asyncio
+async def test_lock_wait_timeout_is_retryable(db):
+    package_id, = await add_packages(db, 1)
+    async with db.bind.connect() as holder, db.bind.connect() as waiter:
+        await holder.execute(select(PackageTable.id).where(PackageTable.id == package_id).with_for_update())
+        await waiter.execute(text('SET SESSION innodb_lock_wait_timeout = 1'))
+        with pytest.raises(DBAPIError) as error:
+            await waiter.execute(update(PackageTable).where(PackageTable.id == package_id).values(delivery_cost=1.0))
+        assert is_retryable(error.value)
+        await holder.rollback()
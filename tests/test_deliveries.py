@@ -1,14 +1,32 @@
+import json
+from datetime import datetime, timedelta
+
 import pytest
 from httpx import AsyncClient, ASGITransport
+from sqlalchemy import select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
 
+from endpoints import deliveries
 from main import app
-from utils.session import get_db, get_session_id
+from db.packages import PackageTable
+from db.tariffs import RateVersionTable
+from utils import pricing
+from utils.pricing import publish_rate_version
+from tasks.archive_packages_task import archive_packages
+from tasks.calculate_delivery_cost_task import recalculate_delivery_costs
+from utils.session import get_db, get_session_id, get_session_factory
 
 
 @pytest.fixture
 async def client(db):
     app.dependency_overrides[get_db] = lambda: db
     app.dependency_overrides[get_session_id] = lambda: 'test_session_id'
+    app.dependency_overrides[get_session_factory] = lambda: sessionmaker(
+        bind=db.bind,
+        class_=AsyncSession,
+        expire_on_commit=False
+    )
 
     async with AsyncClient(
             transport=ASGITransport(app=app),
@@ -96,3 +114,243 @@ async def test_get_nonexistent_package(client):
     response = await client.get('/api/v1/package/9999')
     assert response.status_code == 200
     assert response.json()['message'] == 'No package for id 9999'
+
+
+@pytest.mark.asyncio
+async def test_get_archived_package_by_id(client, db):
+    package = {
+        'name': 'Old Package',
+        'weight': 3.0,
+        'type_name': 'одежда',
+        'content_value_usd': 30.0
+    }
+    create_resp = await client.post('/api/v1/package', json=package)
+    package_id = create_resp.json()['id']
+    await db.execute(update(PackageTable).where(PackageTable.id == package_id).values(
+        delivery_cost=150.0, shipping_company_id=1, last_activity_at=datetime.utcnow() - timedelta(days=365)))
+    await db.commit()
+
+    archived = await archive_packages(db, older_than_days=30, batch_size=10)
+    assert archived >= 1
+    assert (await db.execute(select(PackageTable).where(PackageTable.id == package_id))).first() is None
+
+    response = await client.get(f'/api/v1/package/{package_id}')
+    assert response.status_code == 200
+    data = response.json()
+    assert data['name'] == 'Old Package'
+    assert data['delivery_cost'] == 150.0
+
+
+@pytest.mark.asyncio
+async def test_unassigned_package_is_not_archived(client, db):
+    create_resp = await client.post('/api/v1/package', json={'name': 'Unassigned Package', 'weight': 3.0,
+                                                             'type_name': 'одежда', 'content_value_usd': 30.0})
+    package_id = create_resp.json()['id']
+    await db.execute(update(PackageTable).where(PackageTable.id == package_id).values(
+        delivery_cost=150.0, last_activity_at=datetime.utcnow() - timedelta(days=365)))
+    await db.commit()
+
+    await archive_packages(db, older_than_days=30, batch_size=10)
+    assert (await db.execute(select(PackageTable.id).where(PackageTable.id == package_id))).scalar() == package_id
+    await db.commit()
+
+    # The package can still be assigned, one by one and in bulk
+    response = await client.post(f'/api/v1/package/{package_id}/1')
+    assert response.status_code == 200
+    response = await client.post('/api/v1/shipping_company/1/packages', json={'package_ids': [package_id]})
+    assert response.json()['already_assigned'] == [package_id]
+
+@pytest.mark.asyncio
+async def test_export_packages(client):
+    packages = [
+        {'name': 'Export1', 'weight': 1.0, 'type_name': 'одежда', 'content_value_usd': 10},
+        {'name': 'Export2', 'weight': 2.0, 'type_name': 'разное', 'content_value_usd': 20}
+    ]
+    for pkg in packages:
+        await client.post('/api/v1/package', json=pkg)
+
+    response = await client.get('/api/v1/packages/export?format=ndjson&type_name=разное')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('application/x-ndjson')
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert rows and all(row['type_name'] == 'разное' for row in rows)
+    assert rows[-1]['name'] == 'Export2'
+    assert rows[-1]['delivery_cost'] == 'Не рассчитано'
+
+    response = await client.get('/api/v1/packages/export?format=csv')
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    assert lines[0] == 'id,name,weight,type_id,type_name,content_value_usd,delivery_cost'
+    assert len(lines) >= 3
+
+
+@pytest.mark.asyncio
+async def test_session_summary(client, db):
+    before = (await client.get('/api/v1/packages/summary')).json()
+    for pkg in [
+        {'name': 'Summary1', 'weight': 1.0, 'type_name': 'электроника', 'content_value_usd': 10.5},
+        {'name': 'Summary2', 'weight': 2.0, 'type_name': 'электроника', 'content_value_usd': 20}
+    ]:
+        await client.post('/api/v1/package', json=pkg)
+
+    response = await client.get('/api/v1/packages/summary')
+    assert response.status_code == 200
+    after = response.json()
+    assert after['package_count'] == before['package_count'] + 2
+    assert after['total_value_usd'] == pytest.approx(before['total_value_usd'] + 30.5)
+
+    await recalculate_delivery_costs(db, usd_rate=100.0)
+    summary = (await client.get('/api/v1/packages/summary')).json()
+    assert summary['priced_count'] == summary['package_count']
+    assert summary['total_delivery_cost'] > 0
+    electronics = next(item for item in summary['by_type'] if item['type_name'] == 'электроника')
+    assert electronics['package_count'] >= 2
+
+
+@pytest.mark.asyncio
+async def test_read_time_pricing(client, db, monkeypatch):
+    monkeypatch.setattr(pricing, 'PRICING_MODE', 'read_time')
+    monkeypatch.setattr(pricing, 'rate_versions', {})
+    monkeypatch.setattr(pricing, 'current_rate_version_id', None)
+    monkeypatch.setattr(pricing, 'current_rate_version_checked_at', None)
+
+    response = await client.post('/api/v1/package', json={'name': 'ReadTime', 'weight': 4.0,
+                                                           'type_name': 'разное', 'content_value_usd': 100})
+    package_id = response.json()['id']
+    version = await publish_rate_version(db, 50.0)
+    assert (await publish_rate_version(db, 50.0)).id == version.id
+
+    package = (await client.get(f'/api/v1/package/{package_id}')).json()
+    assert package['delivery_cost'] == 150.0
+    stored_cost = (await db.execute(select(PackageTable.delivery_cost).where(PackageTable.id == package_id))).scalar()
+    assert stored_cost is None
+
+    unpriced = (await client.get('/api/v1/packages', params={'has_delivery_cost': False})).json()
+    assert unpriced['total'] == 0
+    summary = (await client.get('/api/v1/packages/summary')).json()
+    assert summary['priced_count'] == summary['package_count']
+
+    await publish_rate_version(db, 60.0)
+    package = (await client.get(f'/api/v1/package/{package_id}')).json()
+    assert package['delivery_cost'] == 180.0
+
+    await db.execute(delete(RateVersionTable))
+    await db.commit()
+
+
+@pytest.mark.asyncio
+async def test_read_time_summary_is_calculated_once_per_rate_version(client, db, redis_client, monkeypatch):
+    monkeypatch.setattr(pricing, 'PRICING_MODE', 'read_time')
+    await client.post('/api/v1/package', json={'name': 'ReadTimeSummary', 'weight': 4.0,
+                                              'type_name': 'разное', 'content_value_usd': 100})
+    await publish_rate_version(db, 50.0)
+    calculate, calculations = deliveries.read_time_summary_costs, []
+
+    async def read_time_summary_costs(summary_db, session_id):
+        calculations.append(session_id)
+        return await calculate(summary_db, session_id)
+
+    monkeypatch.setattr(deliveries, 'read_time_summary_costs', read_time_summary_costs)
+    try:
+        first = (await client.get('/api/v1/packages/summary')).json()
+        assert (await client.get('/api/v1/packages/summary')).json() == first
+        assert len(calculations) == 1
+
+        await publish_rate_version(db, 60.0)
+        second = (await client.get('/api/v1/packages/summary')).json()
+        assert len(calculations) == 2
+        assert second['total_delivery_cost'] > first['total_delivery_cost']
+    finally:
+        await db.execute(delete(RateVersionTable))
+        await db.commit()
+
+
+@pytest.mark.asyncio
+async def test_read_time_export_with_cold_rate_cache(client, db, monkeypatch):
+    monkeypatch.setattr(pricing, 'PRICING_MODE', 'read_time')
+    response = await client.post('/api/v1/package', json={'name': 'ReadTimeExport', 'weight': 4.0,
+                                                           'type_name': 'разное', 'content_value_usd': 100})
+    package_id = response.json()['id']
+    version = await publish_rate_version(db, 50.0)
+    await db.execute(update(PackageTable).where(PackageTable.id == package_id).values(rate_version_id=version.id))
+    await db.commit()
+    # The rate versions are loaded while the export cursor is open
+    monkeypatch.setattr(pricing, 'rate_versions', {})
+    monkeypatch.setattr(pricing, 'current_rate_version_id', None)
+    monkeypatch.setattr(pricing, 'current_rate_version_checked_at', None)
+
+    try:
+        response = await client.get('/api/v1/packages/export')
+        assert response.status_code == 200
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert next(row for row in rows if row['id'] == package_id)['delivery_cost'] == 150.0
+    finally:
+        await db.execute(update(PackageTable).where(PackageTable.id == package_id).values(rate_version_id=None))
+        await db.execute(delete(RateVersionTable))
+        await db.commit()
+
+
+@pytest.mark.asyncio
+async def test_package_types_not_modified(client):
+    response = await client.get('/api/v1/package_types')
+    etag = response.headers['ETag']
+    assert response.headers['Cache-Control'] == 'private, max-age=300'
+
+    response = await client.get('/api/v1/package_types', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.content == b''
+
+
+@pytest.mark.asyncio
+async def test_packages_not_modified_until_session_version_changes(client, monkeypatch):
+    from endpoints import deliveries
+
+    version = 'epoch:1'
+
+    async def get_session_version(session_id):
+        return version
+
+    monkeypatch.setattr(deliveries, 'get_session_version', get_session_version)
+    etag = (await client.get('/api/v1/packages')).headers['ETag']
+    assert (await client.get('/api/v1/packages', headers={'If-None-Match': etag})).status_code == 304
+    other_page = await client.get('/api/v1/packages', params={'size': 5}, headers={'If-None-Match': etag})
+    assert other_page.status_code == 200
+
+    version = 'epoch:2'
+    response = await client.get('/api/v1/packages', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+@pytest.mark.asyncio
+async def test_assign_shipping_company(client):
+    package_ids = []
+    for number in range(3):
+        response = await client.post('/api/v1/package', json={'name': f'Carrier {number}', 'weight': 1.0,
+                                                               'type_name': 'разное', 'content_value_usd': 10})
+        package_ids.append(response.json()['id'])
+
+    assert (await client.post(f'/api/v1/package/{package_ids[0]}/7')).status_code == 200
+    assert (await client.post(f'/api/v1/package/{package_ids[0]}/8')).status_code == 409
+    assert (await client.post('/api/v1/package/999999/8')).status_code == 404
+
+    response = await client.post('/api/v1/shipping_company/9/packages',
+                                 json={'package_ids': [*package_ids, 999999, package_ids[1]]})
+    assert response.status_code == 200
+    assert response.json() == {'assigned': package_ids[1:], 'already_assigned': package_ids[:1],
+                               'not_found': [999999]}
+
+
+@pytest.mark.asyncio
+async def test_lookup_packages(client):
+    response = await client.post('/api/v1/package', json={'name': 'Lookup', 'weight': 2.0,
+                                                           'type_name': 'электроника', 'content_value_usd': 50})
+    package_id = response.json()['id']
+
+    response = await client.post('/api/v1/packages/lookup', json={'package_ids': [package_id, 999999, package_id]})
+    assert response.status_code == 200
+    assert response.json() == {
+        'packages': {str(package_id): (await client.get(f'/api/v1/package/{package_id}')).json()},
+        'not_found': [999999]
+    }
+    assert (await client.post('/api/v1/packages/lookup', json={'package_ids': []})).status_code == 422
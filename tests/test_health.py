@@ -0,0 +1,51 @@
+import pytest
+
+from main import app
+from utils import session
+
+
+@pytest.mark.asyncio
+async def test_liveness(client):
+    response = await client.get('/api/v1/health/live')
+    assert response.status_code == 200
+    assert response.json()['status'] == 'alive'
+
+
+@pytest.mark.asyncio
+async def test_readiness(client):
+    app.state.ready = False
+    response = await client.get('/api/v1/health/ready')
+    assert response.status_code == 503
+
+    app.state.ready = True
+    response = await client.get('/api/v1/health/ready')
+    assert response.status_code == 200
+    assert response.json()['status'] == 'ready'
+
+
+class FakeConnection:
+    def __init__(self, fail: bool):
+        self.fail = fail
+        self.closed = False
+
+    async def execute(self, statement):
+        if self.fail:
+            raise ConnectionError('Lost connection to MySQL server')
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_prewarm_closes_the_opened_connections_on_error(monkeypatch):
+    connections = [FakeConnection(fail=number == 1) for number in range(3)]
+    opened = iter(connections)
+
+    class FakeEngine:
+        async def connect(self):
+            return next(opened)
+
+    monkeypatch.setattr(session, 'init_engine', lambda: FakeEngine())
+    with pytest.raises(ConnectionError):
+        await session.prewarm_pool(len(connections))
+    assert all(connection.closed for connection in connections)
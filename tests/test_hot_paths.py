@@ -0,0 +1,9 @@
+from benchmarks.hot_paths import compare, medians
+
+
+def test_compare_flags_slowdowns_beyond_the_threshold():
+    report = {'benchmarks': [{'name': 'fast', 'stats': {'median': 1.2e-6}},
+                             {'name': 'slow', 'stats': {'median': 1.5e-6}},
+                             {'name': 'new', 'stats': {'median': 9e-6}}]}
+    rows = compare({'fast': 1.0, 'slow': 1.0}, medians(report), threshold=0.3)
+    assert {row['name']: row['regression'] for row in rows} == {'fast': False, 'new': False, 'slow': True}
@@ -0,0 +1,81 @@
+import uuid
+
+import asyncio
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+
+from middleware import idempotency
+from middleware.idempotency import IdempotencyMiddleware
+from middleware.session import SessionMiddleware
+
+
+class StubRedis:
+    def __init__(self):
+        self.values = {}
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+
+
+@pytest.fixture
+async def idempotent_client(monkeypatch):
+    stub = StubRedis()
+
+    async def get_redis_client():
+        return stub
+
+    monkeypatch.setattr(idempotency, 'get_redis_client', get_redis_client)
+    idempotent_app = FastAPI()
+    idempotent_app.state.calls = 0
+
+    @idempotent_app.post('/api/v1/package')
+    async def register(package: dict):
+        idempotent_app.state.calls += 1
+        await asyncio.sleep(0.1)
+        return {'id': idempotent_app.state.calls}
+
+    idempotent_app.add_middleware(IdempotencyMiddleware)
+    idempotent_app.add_middleware(SessionMiddleware)
+    async with AsyncClient(
+            transport=ASGITransport(app=idempotent_app),
+            base_url='http://test',
+            headers={'X-Session-ID': str(uuid.uuid4())}
+    ) as ac:
+        yield ac, idempotent_app
+
+
+@pytest.mark.asyncio
+async def test_retries_get_the_first_result(idempotent_client):
+    client, idempotent_app = idempotent_client
+    headers = {'Idempotency-Key': 'first'}
+    package = {'name': 'Idempotent'}
+
+    first, concurrent = await asyncio.gather(client.post('/api/v1/package', json=package, headers=headers),
+                                             client.post('/api/v1/package', json=package, headers=headers))
+    retry = await client.post('/api/v1/package', json=package, headers=headers)
+    assert first.json() == concurrent.json() == retry.json() == {'id': 1}
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert idempotent_app.state.calls == 1
+
+    other = await client.post('/api/v1/package', json=package, headers={'Idempotency-Key': 'second'})
+    assert other.json() == {'id': 2}
+
+
+@pytest.mark.asyncio
+async def test_key_reuse_with_different_body_is_rejected(idempotent_client):
+    client, _ = idempotent_client
+    headers = {'Idempotency-Key': 'reused'}
+    await client.post('/api/v1/package', json={'name': 'First'}, headers=headers)
+
+    response = await client.post('/api/v1/package', json={'name': 'Second'}, headers=headers)
+    assert response.status_code == 422
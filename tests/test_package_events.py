@@ -0,0 +1,29 @@
+import json
+from contextlib import asynccontextmanager
+
+import asyncio
+import pytest
+
+from endpoints import deliveries
+from endpoints.deliveries import package_event_stream
+
+
+@pytest.mark.asyncio
+async def test_package_event_stream_formats_events(monkeypatch):
+    queue = asyncio.Queue()
+    event = {'type': 'delivery_cost_calculated', 'package_id': 1, 'delivery_cost': 12.5}
+    queue.put_nowait(event)
+
+    @asynccontextmanager
+    async def subscribe(session_id):
+        assert session_id == 'session'
+        yield queue
+
+    monkeypatch.setattr(deliveries.package_event_broker, 'subscribe', subscribe)
+    monkeypatch.setattr(deliveries, 'SSE_HEARTBEAT_INTERVAL', 0.01)
+
+    stream = package_event_stream('session')
+    assert await anext(stream) == 'retry: 5000\n\n'
+    assert await anext(stream) == f'event: delivery_cost_calculated\ndata: {json.dumps(event)}\n\n'
+    assert await anext(stream) == ': keep-alive\n\n'
+    await stream.aclose()
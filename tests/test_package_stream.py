@@ -0,0 +1,81 @@
+import uuid
+
+import pytest
+from sqlalchemy import select
+
+from db.packages import PackageOutboxTable
+from redis_db import package_stream
+from redis_db.package_stream import StreamConsumer, add_to_stream
+from tasks.package_stream import relay_outbox
+
+
+@pytest.fixture
+async def stream(monkeypatch, redis_client):
+    # The stream, its dead letter streams and the processed event marks of a test share its prefix
+    name = f'package_stream_test:{uuid.uuid4()}'
+    monkeypatch.setattr(package_stream, 'PACKAGE_STREAM', name)
+    monkeypatch.setattr(package_stream, 'DEAD_LETTER_STREAM', f'{name}:dead:{{group}}')
+    monkeypatch.setattr(package_stream, 'PROCESSED_KEY', f'{name}:processed:{{group}}:{{event_id}}')
+    yield name
+    keys = [key async for key in redis_client.scan_iter(match=f'{name}:*')]
+    await redis_client.delete(name, *keys)
+
+
+def registered(event_id: str) -> dict:
+    return {'event_id': event_id, 'type': 'package_registered', 'package_id': 1, 'session_id': 'session',
+            'weight': 1.5}
+
+
+@pytest.mark.asyncio
+async def test_consumer_handles_a_relayed_event_once(stream, redis_client):
+    handled = []
+
+    async def handler(events):
+        handled.extend(events)
+
+    consumer = StreamConsumer('test', handler, consumer='c1')
+    # The relay adds the event again if it stops before deleting it from the outbox
+    await add_to_stream([registered('0-1')])
+    await add_to_stream([registered('0-1')])
+    for _ in range(2):
+        await consumer.process(await consumer.read())
+
+    assert handled == [registered('0-1')]
+    assert await redis_client.xpending_range(stream, 'test', min='-', max='+', count=10) == []
+
+
+@pytest.mark.asyncio
+async def test_failed_events_are_redelivered_then_dead_lettered(stream, redis_client):
+    calls = 0
+
+    async def handler(events):
+        nonlocal calls
+        calls += 1
+        raise RuntimeError('failed')
+
+    consumer = StreamConsumer('test', handler, consumer='c1', claim_idle_ms=0, max_deliveries=2)
+    await add_to_stream([registered('0-1')])
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            await consumer.process(await consumer.read())
+    assert await consumer.read() == []
+
+    assert calls == 2
+    dead = await redis_client.xrange(package_stream.DEAD_LETTER_STREAM.format(group='test'))
+    assert [fields['event_id'] for _, fields in dead] == ['0-1']
+    assert await redis_client.xpending_range(stream, 'test', min='-', max='+', count=10) == []
+
+
+@pytest.mark.asyncio
+async def test_registration_event_is_relayed_from_the_outbox(client, db, stream, redis_client):
+    response = await client.post('/api/v1/package', json={'name': 'Outbox', 'weight': 1.0,
+                                                          'type_name': 'одежда', 'content_value_usd': 10})
+    package_id = response.json()['id']
+    rows = (await db.execute(select(PackageOutboxTable))).scalars().all()
+    assert [(row.event_type, row.package_id) for row in rows] == [('package_registered', package_id)]
+
+    assert await relay_outbox(db, 0) == 1
+    assert (await db.execute(select(PackageOutboxTable))).scalars().all() == []
+    entries = await redis_client.xrange(stream)
+    assert [(fields['event_id'], fields['package_id']) for _, fields in entries] == [(f'0-{rows[0].id}',
+                                                                                     str(package_id))]
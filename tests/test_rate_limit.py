@@ -0,0 +1,61 @@
+import uuid
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+
+from middleware.rate_limit import RateLimitMiddleware, TokenBucket
+from middleware.session import SessionMiddleware
+
+
+def make_limited_app() -> FastAPI:
+    limited_app = FastAPI()
+
+    @limited_app.get('/api/v1/limited')
+    async def limited():
+        return {'message': 'ok'}
+
+    limited_app.add_middleware(RateLimitMiddleware, rate=1, burst=3, enabled=True)
+    limited_app.add_middleware(SessionMiddleware)
+    return limited_app
+
+
+@pytest.fixture
+async def limited_client():
+    async with AsyncClient(
+            transport=ASGITransport(app=make_limited_app()),
+            base_url='http://test',
+            headers={'X-Session-ID': str(uuid.uuid4())}
+    ) as ac:
+        yield ac
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=1, capacity=2)
+    assert bucket.consume() == (True, 0.0)
+    assert bucket.consume() == (True, 0.0)
+    allowed, retry_after = bucket.consume()
+    assert not allowed
+    assert 0 < retry_after <= 1
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_rejects_flooding_session(limited_client):
+    statuses = [(await limited_client.get('/api/v1/limited')).status_code for _ in range(3)]
+    assert statuses == [200, 200, 200]
+
+    response = await limited_client.get('/api/v1/limited')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_counts_requests_without_a_session_by_address():
+    async with AsyncClient(transport=ASGITransport(app=make_limited_app(), client=('10.0.0.1', 50000)),
+                           base_url='http://test') as ac:
+        statuses = []
+        for _ in range(4):
+            # The client drops the session cookie and gets a new session id every time
+            ac.cookies.clear()
+            statuses.append((await ac.get('/api/v1/limited')).status_code)
+    assert statuses == [200, 200, 200, 429]
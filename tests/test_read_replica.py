@@ -0,0 +1,66 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from db.base import Base
+from db.packages import PackageTable, PackageTypeTable
+from redis_db import versions
+from utils import session
+
+# A second MySQL server standing in for the replica, e.g. the mysql_replica service of docker-compose
+REPLICA_HOST = os.environ.get('TEST_REPLICA_DATABASE_HOST')
+REPLICA_PORT = os.environ.get('TEST_REPLICA_DATABASE_PORT', '3306')
+
+pytestmark = pytest.mark.skipif(not REPLICA_HOST, reason='TEST_REPLICA_DATABASE_HOST is not set')
+
+
+@pytest.fixture
+async def replica(db, monkeypatch):
+    server = f'{os.environ["DATABASE_USER"]}:{os.environ["DATABASE_PASSWORD"]}@{REPLICA_HOST}:{REPLICA_PORT}'
+    database = os.environ['TEST_DATABASE_NAME']
+    admin = create_engine(f'mysql+pymysql://{server}/')
+    with admin.connect() as connection:
+        connection.execute(text(f'DROP DATABASE IF EXISTS {database}'))
+        connection.execute(text(f'CREATE DATABASE {database}'))
+
+    engine = create_async_engine(db.bind.url.set(host=REPLICA_HOST, port=int(REPLICA_PORT)))
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    async with sessionmaker(bind=engine, class_=AsyncSession)() as replica_db:
+        replica_db.add_all([PackageTypeTable(type_name=name) for name in ('одежда', 'электроника', 'разное')])
+        replica_db.add(PackageTable(name='Replica', weight=1.0, type_id=1, content_value_usd=10,
+                                    session_id='test_session_id'))
+        await replica_db.commit()
+
+    monkeypatch.setattr(session, 'read_engine', engine)
+    session.ReadSessionLocal.configure(bind=engine)
+    yield engine
+    await engine.dispose()
+    with admin.connect() as connection:
+        connection.execute(text(f'DROP DATABASE {database}'))
+
+
+@pytest.mark.asyncio
+async def test_reads_go_to_primary_after_a_write(client, replica, monkeypatch):
+    recent_write = False
+
+    async def has_recent_write(session_id):
+        return recent_write
+
+    monkeypatch.setattr(versions, 'has_recent_write', has_recent_write)
+    await client.post('/api/v1/package', json={'name': 'Primary', 'weight': 1.0,
+                                               'type_name': 'одежда', 'content_value_usd': 10})
+
+    response = await client.get('/api/v1/packages')
+    assert [package['name'] for package in response.json()['items']] == ['Replica']
+    # A lagging replica may return an older version of the packages than the ETag describes
+    assert 'ETag' not in response.headers
+
+    recent_write = True
+    response = await client.get('/api/v1/packages')
+    names = [package['name'] for package in response.json()['items']]
+    assert 'Primary' in names and 'Replica' not in names
+    assert response.headers['ETag'].startswith('W/')
@@ -0,0 +1,56 @@
+from datetime import datetime
+
+import asyncio
+import pytest
+
+from tasks.scheduler import CronSchedule, IntervalSchedule, Job, JobAlreadyRunning, Scheduler
+
+
+def test_cron_schedule_skips_weekends():
+    schedule = CronSchedule('0 9 * * 1-5')
+    # Friday after the run
+    assert schedule.next_run(datetime(2026, 10, 16, 9, 0)) == datetime(2026, 10, 19, 9, 0)
+    assert schedule.next_run(datetime(2026, 10, 19, 8, 59, 30)) == datetime(2026, 10, 19, 9, 0)
+
+
+def test_cron_schedule_fields():
+    schedule = CronSchedule('*/15 1,13 1 * 0')
+    assert schedule.next_run(datetime(2026, 10, 25, 1, 14)) == datetime(2026, 10, 25, 1, 15)
+    # The 1st day of month or Sunday
+    assert schedule.next_run(datetime(2026, 10, 19, 13, 45)) == datetime(2026, 10, 25, 1, 0)
+    assert CronSchedule('0 0 29 2 *').next_run(datetime(2026, 3, 1)) == datetime(2028, 2, 29)
+    with pytest.raises(ValueError):
+        CronSchedule('60 * * * *')
+
+
+def test_interval_schedule_jitter():
+    after = datetime(2026, 10, 19)
+    delay = (IntervalSchedule(100, jitter=0.1).next_run(after) - after).total_seconds()
+    assert 90 <= delay <= 110
+
+
+@pytest.mark.asyncio
+async def test_run_now_rejects_running_job_and_backs_off():
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def work():
+        started.set()
+        await release.wait()
+        raise RuntimeError('failed')
+
+    job = Job('test', work, IntervalSchedule(60), retry_delay=10, max_retry_delay=30)
+    scheduler = Scheduler([job])
+    run = asyncio.create_task(scheduler.run_now('test'))
+    await started.wait()
+    with pytest.raises(JobAlreadyRunning):
+        await scheduler.run_now('test')
+    release.set()
+    record = await run
+
+    assert record['status'] == 'error'
+    assert record['trigger'] == 'manual'
+    assert job.history[0] is record
+    assert 9 <= job.retry_after() <= 11
+    job.failures = 5
+    assert job.retry_after() <= 33
@@ -0,0 +1,56 @@
+import uuid
+
+import pytest
+
+from redis_db import versions
+from redis_db.redis_setup import execute_pipeline
+from redis_db.versions import bump_session_versions, get_session_version, has_recent_write
+
+
+# The version reads and the retried bumps need Redis, the first bumps fail
+@pytest.fixture
+def failing_redis(monkeypatch, redis_client):
+    monkeypatch.setattr(versions, 'pending_bumps', {})
+    monkeypatch.setattr(versions, 'pending_epoch_renewal', None)
+    monkeypatch.setattr(versions, 'retry_task', None)
+    monkeypatch.setattr(versions, 'BUMP_RETRY_DELAY', 0.01)
+
+    async def failing_pipeline(build, transaction=False):
+        raise ConnectionError('Redis is down')
+
+    monkeypatch.setattr(versions, 'execute_pipeline', failing_pipeline)
+
+
+@pytest.mark.asyncio
+async def test_failed_bump_hides_the_version_until_it_is_retried(failing_redis, monkeypatch):
+    session_id = str(uuid.uuid4())
+    before = await get_session_version(session_id)
+
+    await bump_session_versions([session_id])
+    # The clients holding the ETag of the old version must not get 304, without waiting for Redis on every read
+    assert await get_session_version(session_id) is None
+    assert await has_recent_write(session_id)
+
+    # Redis is back, the failed bump is retried in the background
+    monkeypatch.setattr(versions, 'execute_pipeline', execute_pipeline)
+    await versions.retry_task
+    after = await get_session_version(session_id)
+    assert after is not None and after != before
+    assert versions.pending_bumps == {}
+
+
+@pytest.mark.asyncio
+async def test_too_many_failed_bumps_renew_the_epoch(failing_redis, monkeypatch):
+    monkeypatch.setattr(versions, 'MAX_PENDING_BUMPS', 1)
+    other_session_id = str(uuid.uuid4())
+    before = await get_session_version(other_session_id)
+
+    await bump_session_versions([str(uuid.uuid4()), str(uuid.uuid4())])
+    assert versions.pending_bumps == {}
+    assert await get_session_version(other_session_id) is None
+
+    monkeypatch.setattr(versions, 'execute_pipeline', execute_pipeline)
+    await versions.retry_task
+    assert versions.pending_epoch_renewal is None
+    after = await get_session_version(other_session_id)
+    assert after is not None and after != before
@@ -0,0 +1,131 @@
+import os
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, text, select, func, delete
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from db.base import Base
+from db.packages import PackageTable, PackageTypeTable, SessionSummaryTable, PackageOutboxTable
+from tasks import reshard
+from tasks.calculate_delivery_cost_task import recalculate_delivery_costs
+from utils import db_utils, session
+from utils.sharding import jump_hash, shard_for_session, package_home_shard, first_package_id, PACKAGE_ID_SHARD_SHIFT
+
+# A second MySQL server standing in for shard 1, e.g. the mysql_shard1 service of docker-compose
+SHARD_HOST = os.environ.get('TEST_SHARD_DATABASE_HOST')
+SHARD_PORT = os.environ.get('TEST_SHARD_DATABASE_PORT', '3306')
+
+needs_shard = pytest.mark.skipif(not SHARD_HOST, reason='TEST_SHARD_DATABASE_HOST is not set')
+
+
+def test_jump_hash_moves_keys_only_to_the_new_bucket():
+    keys = range(10000)
+    before = [jump_hash(key, 4) for key in keys]
+    after = [jump_hash(key, 5) for key in keys]
+    moved = [new for old, new in zip(before, after) if old != new]
+    assert set(moved) == {4}
+    assert 1500 < len(moved) < 2500
+
+
+def test_shard_for_session_is_stable_and_balanced():
+    session_ids = [str(uuid.UUID(int=number)) for number in range(4000)]
+    shards = [shard_for_session(session_id, 4) for session_id in session_ids]
+    assert shards == [shard_for_session(session_id, 4) for session_id in session_ids]
+    assert all(800 < shards.count(shard) < 1200 for shard in range(4))
+    assert shard_for_session(session_ids[0], 1) == 0
+
+
+def test_package_home_shard():
+    assert package_home_shard(12345, 3) == 0
+    assert package_home_shard(first_package_id(2) + 7, 3) == 2
+    # Ids of the shards that are not configured fall back to the primary database
+    assert package_home_shard(first_package_id(5), 3) == 0
+
+
+@pytest.mark.asyncio
+async def test_recalculation_skips_the_gap_before_the_shard_id_range(db):
+    # The packages moved from shard 0 keep their small ids next to the own ids of the shard
+    session_id = str(uuid.uuid4())
+    db.add_all([PackageTable(name='Moved', weight=1.0, type_id=1, content_value_usd=10, session_id=session_id),
+                PackageTable(id=first_package_id(1), name='Own', weight=1.0, type_id=1, content_value_usd=10,
+                             session_id=session_id)])
+    await db.commit()
+    try:
+        packages = (await db.execute(select(func.count()).select_from(PackageTable))).scalar()
+        assert await recalculate_delivery_costs(db, usd_rate=100.0, chunk_size=1) == packages
+        costs = (await db.execute(select(PackageTable.delivery_cost)
+                                  .where(PackageTable.session_id == session_id))).scalars().all()
+        assert len(costs) == 2 and None not in costs
+    finally:
+        await db.execute(delete(PackageTable).where(PackageTable.session_id == session_id))
+        await db.execute(delete(SessionSummaryTable).where(SessionSummaryTable.session_id == session_id))
+        await db.execute(delete(PackageOutboxTable).where(PackageOutboxTable.session_id == session_id))
+        await db.commit()
+        # The next packages of the test database get small ids again
+        await db.execute(text('ALTER TABLE package AUTO_INCREMENT = 1'))
+
+
+@pytest.fixture
+async def shard(db, monkeypatch):
+    server = f'{os.environ["DATABASE_USER"]}:{os.environ["DATABASE_PASSWORD"]}@{SHARD_HOST}:{SHARD_PORT}'
+    database = os.environ['TEST_DATABASE_NAME']
+    admin = create_engine(f'mysql+pymysql://{server}/')
+    with admin.connect() as connection:
+        connection.execute(text(f'DROP DATABASE IF EXISTS {database}'))
+        connection.execute(text(f'CREATE DATABASE {database}'))
+
+    engine = create_async_engine(db.bind.url.set(host=SHARD_HOST, port=int(SHARD_PORT)))
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    shard_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    async with shard_factory() as shard_db:
+        shard_db.add_all([PackageTypeTable(type_name=name) for name in ('одежда', 'электроника', 'разное')])
+        await shard_db.commit()
+
+    primary_factory = sessionmaker(bind=db.bind, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr(db_utils, 'DATABASE_SHARD_URLS', [db_utils.DATABASE_URL, str(engine.url)])
+    monkeypatch.setattr(session, 'async_engine', db.bind)
+    monkeypatch.setattr(session, 'shard_factories', [shard_factory])
+    monkeypatch.setattr(reshard, 'get_shard_factories', lambda: [primary_factory, shard_factory])
+    await reshard.init_shards()
+    yield shard_factory
+    await engine.dispose()
+    with admin.connect() as connection:
+        connection.execute(text(f'DROP DATABASE {database}'))
+
+
+@needs_shard
+@pytest.mark.asyncio
+async def test_packages_are_stored_on_the_session_shard(client, db, shard):
+    # test_session_id belongs to shard 1 of 2
+    assert shard_for_session('test_session_id', 2) == 1
+    response = await client.post('/api/v1/package', json={'name': 'Sharded', 'weight': 1.0,
+                                                          'type_name': 'одежда', 'content_value_usd': 10})
+    package_id = response.json()['id']
+    assert package_id >> PACKAGE_ID_SHARD_SHIFT == 1
+    assert (await db.execute(select(PackageTable.id))).scalars().all() == []
+
+    names = [package['name'] for package in (await client.get('/api/v1/packages')).json()['items']]
+    assert names == ['Sharded']
+    assert (await client.get(f'/api/v1/package/{package_id}')).json()['name'] == 'Sharded'
+
+
+@needs_shard
+@pytest.mark.asyncio
+async def test_reshard_moves_the_session_packages(client, db, shard):
+    db.add(PackageTable(name='Misplaced', weight=1.0, type_id=1, content_value_usd=10, session_id='test_session_id'))
+    db.add(SessionSummaryTable(session_id='test_session_id', type_id=1, package_count=1, total_value_usd=10,
+                               priced_count=0, total_delivery_cost=0))
+    await db.commit()
+
+    assert await reshard.move_packages(dry_run=True) == {'sessions': 1, 'packages': 0}
+    assert await reshard.move_packages() == {'sessions': 1, 'packages': 1}
+    assert await reshard.move_packages() == {'sessions': 0, 'packages': 0}
+
+    assert (await db.execute(select(PackageTable.id))).scalars().all() == []
+    names = [package['name'] for package in (await client.get('/api/v1/packages')).json()['items']]
+    assert names == ['Misplaced']
+    summary = (await client.get('/api/v1/packages/summary')).json()
+    assert summary['package_count'] == 1
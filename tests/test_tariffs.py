@@ -0,0 +1,50 @@
+import pytest
+from sqlalchemy import delete
+
+from db.tariffs import TariffTable, TariffRateTable
+from utils import tariffs
+from utils.tariffs import CompiledTariff, TariffRate, DEFAULT_TARIFF, get_tariff
+
+
+@pytest.fixture(autouse=True)
+def reset_tariff(monkeypatch):
+    monkeypatch.setattr(tariffs, 'tariff', DEFAULT_TARIFF)
+    monkeypatch.setattr(tariffs, 'tariff_checked_at', None)
+
+
+def test_default_tariff_keeps_base_formula():
+    assert DEFAULT_TARIFF.price(1, 2.0, 100.0, 90.0) == round((2.0 * 0.5 + 100.0 * 0.01) * 90.0, 2)
+    assert DEFAULT_TARIFF.price(1, 2.0, 100.0, None) is None
+
+
+def test_tariff_brackets_and_minimum_charge():
+    tariff = CompiledTariff(version=2, rates={
+        1: [TariffRate(weight_from=10, weight_rate=0.3, value_rate=0.02),
+            TariffRate(weight_from=0, weight_rate=1.0, value_rate=0.02, min_charge=5)],
+        None: [TariffRate(weight_from=0, weight_rate=0.5, value_rate=0.01, base_fee=1)]
+    })
+    costs = tariff.price_batch([1, 1, 1, 2], [2.0, 10.0, 20.0, 2.0], [10.0, 10.0, 10.0, 10.0], 100.0)
+    assert costs == [500.0, 320.0, 620.0, 210.0]
+
+    without_default = CompiledTariff(version=3, rates={1: [TariffRate(weight_from=0, weight_rate=1, value_rate=0)]})
+    assert without_default.price(2, 1.0, 1.0, 100.0) is None
+
+
+@pytest.mark.asyncio
+async def test_new_tariff_version_is_loaded(db):
+    assert (await get_tariff(db)) is DEFAULT_TARIFF
+
+    db.add(TariffTable(id=10, name='express'))
+    await db.flush()
+    db.add(TariffRateTable(tariff_id=10, type_id=None, weight_from=0, weight_rate=2, value_rate=0,
+                           base_fee=0, min_charge=0))
+    await db.commit()
+    tariffs.tariff_checked_at = None
+
+    try:
+        tariff = await get_tariff(db)
+        assert tariff.version == 10
+        assert tariff.price(1, 3.0, 100.0, 10.0) == 60.0
+    finally:
+        await db.execute(delete(TariffTable))
+        await db.commit()
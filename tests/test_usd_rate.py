@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from tasks import calculate_delivery_cost_task
+from tasks.calculate_delivery_cost_task import get_usd_rate, remember_usd_rate
+
+
+class StubRedis:
+    def __init__(self, values: dict[str, str] | None = None, error: Exception | None = None):
+        self.values = values or {}
+        self.error = error
+
+    async def mget(self, keys):
+        if self.error:
+            raise self.error
+        return [self.values.get(key) for key in keys]
+
+
+@pytest.fixture(autouse=True)
+def reset_last_known_rate(monkeypatch):
+    monkeypatch.setattr(calculate_delivery_cost_task, 'last_known_usd_rate', None)
+
+
+@pytest.mark.asyncio
+async def test_usd_rate_uses_most_recent_day():
+    today = datetime.utcnow()
+    values = {
+        f'usd_rate:{(today - timedelta(days=1)).strftime("%Y-%m-%d")}': '91.5',
+        f'usd_rate:{(today - timedelta(days=2)).strftime("%Y-%m-%d")}': '90.0'
+    }
+    assert await get_usd_rate(StubRedis(values)) == 91.5
+
+
+@pytest.mark.asyncio
+async def test_usd_rate_falls_back_to_last_known_value():
+    assert await get_usd_rate(StubRedis(error=ConnectionError('Redis is down'))) is None
+
+    remember_usd_rate(92.25)
+    assert await get_usd_rate(StubRedis(error=ConnectionError('Redis is down'))) == 92.25
+    assert await get_usd_rate(StubRedis()) is None
@@ -0,0 +1,210 @@
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass
+
+import asyncio
+import httpx
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CBR_RATES_URL = os.getenv('CBR_RATES_URL', 'https://www.cbr-xml-daily.ru/daily_json.js')
+CBR_TIMEOUT = float(os.getenv('CBR_TIMEOUT', 10))
+# Attempts of one fetch after the first one, for connection errors, 429 and 5xx responses
+CBR_MAX_RETRIES = int(os.getenv('CBR_MAX_RETRIES', 3))
+# Delay before the first retry, doubled for every next one and randomly spread by half of it
+CBR_RETRY_DELAY = float(os.getenv('CBR_RETRY_DELAY', 0.5))
+# Consecutive failed fetches opening the circuit, and the seconds it stays open
+CBR_FAILURE_THRESHOLD = int(os.getenv('CBR_FAILURE_THRESHOLD', 5))
+CBR_RESET_TIMEOUT = float(os.getenv('CBR_RESET_TIMEOUT', 300))
+
+
+class RateSourceError(Exception):
+    pass
+
+
+class CircuitOpenError(RateSourceError):
+    pass
+
+
+class CircuitBreaker:
+    """
+        Stops calling a failing service for a while.
+
+        After `failure_threshold` consecutive failures the circuit opens and the calls are rejected
+        for `reset_timeout` seconds. Then one trial call is let through: its success closes the circuit,
+        its failure opens it again.
+    """
+    def __init__(self, failure_threshold: int = CBR_FAILURE_THRESHOLD, reset_timeout: float = CBR_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def check(self):
+        """
+            Raises:
+                CircuitOpenError: If the circuit is open
+        """
+        if self.state == 'open':
+            retry_in = self.reset_timeout - (time.monotonic() - self.opened_at)
+            raise CircuitOpenError(f'The circuit is open after {self.failures} failures, '
+                                   f'next attempt in {retry_in:.0f} seconds')
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == 'half_open' or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+@dataclass
+class Rates:
+    """
+        Exchange rates of one CBR publication.
+
+        Attributes:
+            date: Publication date as given by CBR
+            values: RUB per one unit of every currency by its code
+            modified: False if the rates were not changed since the previous fetch
+    """
+    date: str
+    values: dict[str, float]
+    modified: bool = True
+
+
+class CbrClient:
+    """
+        Client of the CBR daily rates, kept for the process lifetime.
+
+        The connection is reused between fetches and the fetches are conditional: the ETag and
+        Last-Modified of the last response are sent back, and a 304 response returns the rates
+        already known. Connection errors, 429 and 5xx responses are retried with a jittered
+        exponential backoff, and a fetch failed after all the retries counts towards the circuit breaker.
+
+        The transport can be replaced, e.g. by httpx.MockTransport in tests.
+    """
+    def __init__(self,
+                 url: str = CBR_RATES_URL,
+                 transport: httpx.AsyncBaseTransport | None = None,
+                 timeout: float = CBR_TIMEOUT,
+                 max_retries: int = CBR_MAX_RETRIES,
+                 retry_delay: float = CBR_RETRY_DELAY,
+                 breaker: CircuitBreaker | None = None):
+        self.url = url
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.client = httpx.AsyncClient(
+            transport=transport,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=2, max_keepalive_connections=1),
+            headers={'Accept': 'application/json'}
+        )
+        self.etag: str | None = None
+        self.last_modified: str | None = None
+        self.rates: Rates | None = None
+        # Fetches of several callers share one request
+        self.lock = asyncio.Lock()
+
+    async def fetch_rates(self) -> Rates:
+        """
+            Fetches the current rates.
+
+            Returns:
+                Rates: The rates, with modified=False if they did not change since the previous fetch
+
+            Raises:
+                CircuitOpenError: If the circuit is open
+                RateSourceError: If the rates are not fetched
+        """
+        async with self.lock:
+            self.breaker.check()
+            try:
+                response = await self.request()
+                rates = self.parse(response)
+            except RateSourceError:
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            return rates
+
+    async def request(self) -> httpx.Response:
+        """
+            Sends the conditional request, retrying the transient failures.
+        """
+        headers = {}
+        if self.rates is not None:
+            if self.etag:
+                headers['If-None-Match'] = self.etag
+            if self.last_modified:
+                headers['If-Modified-Since'] = self.last_modified
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.client.get(self.url, headers=headers)
+                if response.status_code != 429 and response.status_code < 500:
+                    return response
+                error = f'HTTP {response.status_code}'
+            except httpx.TransportError as ex:
+                error = str(ex) or type(ex).__name__
+            if attempt < self.max_retries:
+                delay = self.retry_delay * 2 ** attempt * random.uniform(0.5, 1.5)
+                logger.warning(f'CBR request failed: {error}, retrying in {delay:.2f} seconds')
+                await asyncio.sleep(delay)
+        raise RateSourceError(f'CBR request failed after {self.max_retries + 1} attempts: {error}')
+
+    def parse(self, response: httpx.Response) -> Rates:
+        """
+            Reads the rates from the response, or returns the known ones for 304.
+        """
+        if response.status_code == 304 and self.rates is not None:
+            return Rates(self.rates.date, self.rates.values, modified=False)
+        if response.status_code != 200:
+            raise RateSourceError(f'Unexpected CBR response: HTTP {response.status_code}')
+        try:
+            data = response.json()
+            values = {code: float(valute['Value']) / valute['Nominal'] for code, valute in data['Valute'].items()}
+            rates = Rates(data['Date'], values)
+        except (ValueError, KeyError, TypeError, ZeroDivisionError) as ex:
+            raise RateSourceError(f'Malformed CBR response: {str(ex) or type(ex).__name__}')
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+        self.rates = rates
+        return rates
+
+    async def close(self):
+        await self.client.aclose()
+
+
+cbr_client: CbrClient | None = None
+
+
+def get_cbr_client() -> CbrClient:
+    """
+        Returns the process-wide CBR client, creating it on the first call.
+    """
+    global cbr_client
+    if cbr_client is None:
+        cbr_client = CbrClient()
+    return cbr_client
+
+
+async def close_cbr_client():
+    global cbr_client
+    if cbr_client is not None:
+        await cbr_client.close()
+        cbr_client = None
@@ -0,0 +1,67 @@
+import asyncio
+
+
+class AdaptiveSemaphore:
+    """
+        Semaphore whose limit adapts to the latency of the guarded operations.
+
+        The limit grows by one after a full round of operations completed within the tolerance
+        of the baseline latency, and shrinks by one when an operation is slower. The baseline is
+        the lowest observed latency, slowly drifting towards the recent ones, so that a lasting
+        change of the load does not shrink the limit forever. When the limit shrinks, the permits
+        are retired as the operations in flight release them.
+    """
+    # Share of the difference the baseline moves towards a slower latency on every observation
+    BASELINE_DRIFT = 0.05
+
+    def __init__(self, max_limit: int, min_limit: int = 1, latency_tolerance: float = 2.0):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.latency_tolerance = latency_tolerance
+        self.limit = max_limit
+        self.semaphore = asyncio.Semaphore(max_limit)
+        # Permits to be retired on release after the limit shrank
+        self.retiring = 0
+        self.baseline: float | None = None
+        self.fast_in_row = 0
+
+    async def acquire(self):
+        await self.semaphore.acquire()
+
+    def release(self, latency: float | None = None):
+        """
+            Returns the permit and adapts the limit to the latency of the completed operation.
+
+            Args:
+                latency (float | None): Duration of the operation in seconds, None if it failed
+        """
+        if self.retiring:
+            self.retiring -= 1
+        else:
+            self.semaphore.release()
+        if latency is not None:
+            self.observe(latency)
+
+    def observe(self, latency: float):
+        """
+            Adapts the limit to the latency of a completed operation.
+        """
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+        else:
+            self.baseline += (latency - self.baseline) * self.BASELINE_DRIFT
+
+        if latency > self.baseline * self.latency_tolerance:
+            self.fast_in_row = 0
+            if self.limit > self.min_limit:
+                self.limit -= 1
+                self.retiring += 1
+        else:
+            self.fast_in_row += 1
+            if self.fast_in_row >= self.limit and self.limit < self.max_limit:
+                self.fast_in_row = 0
+                self.limit += 1
+                if self.retiring:
+                    self.retiring -= 1
+                else:
+                    self.semaphore.release()
@@ -1,11 +1,57 @@
 from environs import Env
+from marshmallow.validate import OneOf
 
 env = Env()
 env.read_env()
 
+# The async MySQL drivers the application runs on, see benchmarks/db_drivers.py for their comparison
+DATABASE_DRIVERS = ('aiomysql', 'asyncmy')
+DATABASE_DRIVER = env.str('DATABASE_DRIVER', 'aiomysql', validate=OneOf(DATABASE_DRIVERS))
+
+
+def database_url(user: str, password: str, server: str, name: str = '', driver: str = DATABASE_DRIVER) -> str:
+    """
+        Builds the SQLAlchemy URL of a MySQL database.
+
+        Args:
+            user (str): Database user
+            password (str): Database password
+            server (str): 'host:port' of the server
+            name (str): Database name, none for a server-level connection
+            driver (str): SQLAlchemy driver name, one of DATABASE_DRIVERS for the application
+
+        Returns:
+            str: The database URL
+    """
+    return f'mysql+{driver}://{user}:{password}@{server}/{name}'
+
+
 DATABASE_USER = env.str('DATABASE_USER')
 DATABASE_PASSWORD = env.str('DATABASE_PASSWORD')
 DATABASE_HOST = env.str('DATABASE_HOST')
 DATABASE_NAME = env.str('DATABASE_NAME')
 DATABASE_PORT = env.str('DATABASE_PORT')
-DATABASE_URL = f'mysql+aiomysql://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}'
+DATABASE_URL = database_url(DATABASE_USER, DATABASE_PASSWORD, f'{DATABASE_HOST}:{DATABASE_PORT}', DATABASE_NAME)
+
+DATABASE_POOL_SIZE = env.int('DATABASE_POOL_SIZE', 50)
+DATABASE_MAX_OVERFLOW = env.int('DATABASE_MAX_OVERFLOW', 20)
+# Number of pool connections opened during the application startup
+DATABASE_POOL_PREWARM = env.int('DATABASE_POOL_PREWARM', 10)
+
+# Optional read-only replica serving the GET endpoints, the primary settings are used for the unset ones
+DATABASE_REPLICA_HOST = env.str('DATABASE_REPLICA_HOST', None)
+DATABASE_REPLICA_PORT = env.str('DATABASE_REPLICA_PORT', DATABASE_PORT)
+DATABASE_REPLICA_USER = env.str('DATABASE_REPLICA_USER', DATABASE_USER)
+DATABASE_REPLICA_PASSWORD = env.str('DATABASE_REPLICA_PASSWORD', DATABASE_PASSWORD)
+DATABASE_REPLICA_URL = (database_url(DATABASE_REPLICA_USER, DATABASE_REPLICA_PASSWORD,
+                                     f'{DATABASE_REPLICA_HOST}:{DATABASE_REPLICA_PORT}', DATABASE_NAME)
+                        if DATABASE_REPLICA_HOST else None)
+DATABASE_REPLICA_POOL_SIZE = env.int('DATABASE_REPLICA_POOL_SIZE', DATABASE_POOL_SIZE)
+
+# Databases the packages are sharded to by session id after the primary one, which is shard 0.
+# 'host:port' separated by commas, the shards share the database name and credentials of the primary
+DATABASE_SHARD_HOSTS = env.list('DATABASE_SHARD_HOSTS', [])
+DATABASE_SHARD_URLS = [DATABASE_URL] + [
+    database_url(DATABASE_USER, DATABASE_PASSWORD, host, DATABASE_NAME) for host in DATABASE_SHARD_HOSTS
+]
+DATABASE_SHARD_POOL_SIZE = env.int('DATABASE_SHARD_POOL_SIZE', DATABASE_POOL_SIZE)
@@ -0,0 +1,56 @@
+import hashlib
+import json
+
+from fastapi import Request, Response, status
+
+
+def make_etag(*parts) -> str:
+    """
+        Builds a weak ETag from the values the response depends on.
+
+        The ETag is weak because the compression middleware sends the same resource gzip-encoded
+        or not, and the encodings are not byte-for-byte equal.
+
+        Args:
+            *parts: JSON serializable values
+
+        Returns:
+            str: The quoted ETag with the W/ prefix
+    """
+    digest = hashlib.sha256(json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str).encode())
+    return f'W/"{digest.hexdigest()[:32]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+        Checks whether the If-None-Match header of the request contains the ETag.
+
+        Args:
+            request (Request): The incoming request
+            etag (str): The current ETag of the resource
+
+        Returns:
+            bool: True if the client has the current representation
+    """
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    # If-None-Match uses the weak comparison
+    return any(tag.strip().removeprefix('W/') == etag.removeprefix('W/') for tag in header.split(','))
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    """
+        Builds the 304 response.
+
+        Args:
+            etag (str): The current ETag of the resource
+            cache_control (str): The Cache-Control header value
+
+        Returns:
+            Response: The response without a body
+    """
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                    headers={'ETag': etag, 'Cache-Control': cache_control})
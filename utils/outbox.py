@@ -0,0 +1,29 @@
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.packages import PackageOutboxTable
+
+# The lifecycle events written to the outbox
+PACKAGE_REGISTERED = 'package_registered'
+DELIVERY_COST_CALCULATED = 'delivery_cost_calculated'
+SHIPPING_COMPANY_ASSIGNED = 'shipping_company_assigned'
+
+
+async def add_outbox_events(db: AsyncSession, events: list[dict]):
+    """
+        Writes package lifecycle events to the outbox in the current transaction.
+
+        The events are committed or rolled back together with the package changes they describe,
+        and relayed to the package stream by tasks.package_stream.
+
+        Args:
+            db (AsyncSession): Database session, the caller commits
+            events (list[dict]): Events with the 'session_id', 'type' and 'package_id' keys and the event data
+    """
+    if not events:
+        return
+    await db.execute(insert(PackageOutboxTable), [
+        {'event_type': event['type'], 'package_id': event['package_id'], 'session_id': event['session_id'],
+         'payload': {key: value for key, value in event.items() if key not in ('type', 'package_id', 'session_id')}}
+        for event in events
+    ])
@@ -0,0 +1,83 @@
+import hashlib
+import os
+import time
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.packages import PackageTypeTable
+from models.packages import PackageType
+
+# Package types only change with migrations, so the catalog is reloaded rarely
+PACKAGE_TYPES_CACHE_TTL = int(os.getenv('PACKAGE_TYPES_CACHE_TTL', 300))
+
+package_types: list[PackageType] = []
+package_type_ids: dict[str, int] = {}
+package_types_loaded_at: float | None = None
+# Digest of the loaded catalog, changes only when the catalog changes
+package_types_version: str | None = None
+
+
+async def load_package_types(db: AsyncSession) -> list[PackageType]:
+    """
+        Loads the package type catalog from the database into the in-process cache.
+
+        Args:
+            db (AsyncSession): Database session
+
+        Returns:
+            list[PackageType]: All package types ordered by id
+    """
+    global package_types, package_type_ids, package_types_loaded_at, package_types_version
+    result = await db.execute(select(PackageTypeTable.id, PackageTypeTable.type_name).order_by(PackageTypeTable.id))
+    types = [PackageType(id=type_id, type_name=type_name) for type_id, type_name in result.all()]
+    ids = {}
+    for package_type in types:
+        ids.setdefault(package_type.type_name, package_type.id)
+    package_types, package_type_ids = types, ids
+    package_types_version = hashlib.sha256(
+        '\n'.join(f'{package_type.id}:{package_type.type_name}' for package_type in types).encode()
+    ).hexdigest()
+    package_types_loaded_at = time.monotonic()
+    return package_types
+
+
+def is_package_types_cache_fresh() -> bool:
+    """
+        Checks whether the cached catalog can be used without a reload.
+    """
+    return package_types_loaded_at is not None and time.monotonic() - package_types_loaded_at <= PACKAGE_TYPES_CACHE_TTL
+
+
+async def get_package_types(db: AsyncSession) -> list[PackageType]:
+    """
+        Returns the cached package type catalog, loading it when missing or expired.
+
+        Args:
+            db (AsyncSession): Database session used when the catalog has to be loaded
+
+        Returns:
+            list[PackageType]: All package types ordered by id
+    """
+    if not is_package_types_cache_fresh():
+        await load_package_types(db)
+    return package_types
+
+
+async def get_package_type_id(db: AsyncSession, type_name: str) -> int | None:
+    """
+        Resolves a package type name to its id using the cached catalog.
+
+        The catalog is reloaded once if the name is not found in it.
+
+        Args:
+            db (AsyncSession): Database session used when the catalog has to be loaded
+            type_name (str): Package type name
+
+        Returns:
+            int | None: The type id, None if there is no such type
+    """
+    await get_package_types(db)
+    if type_name not in package_type_ids:
+        await load_package_types(db)
+    return package_type_ids.get(type_name)
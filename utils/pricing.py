@@ -0,0 +1,183 @@
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Sequence
+
+from sqlalchemy import select, true, false, ColumnElement
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.packages import PackageTable
+from db.tariffs import RateVersionTable
+from utils.tariffs import CompiledTariff, compile_tariff, load_tariff
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 'stored': the delivery cost is written to every package by the recalculation task.
+# 'read_time': a rate change inserts one rate_version row and the cost is calculated when packages are read
+PRICING_MODE = os.getenv('PRICING_MODE', 'stored')
+# Interval of checking the database for a new rate version
+RATE_VERSION_CACHE_TTL = int(os.getenv('RATE_VERSION_CACHE_TTL', 30))
+
+
+@dataclass(frozen=True)
+class RateVersion:
+    """
+        Pricing inputs of one rate version.
+    """
+    id: int
+    usd_rate: float
+    tariff: CompiledTariff
+
+
+# Rate versions never change, so they are cached without expiration
+rate_versions: dict[int, RateVersion] = {}
+current_rate_version_id: int | None = None
+current_rate_version_checked_at: float | None = None
+
+
+def read_time_pricing() -> bool:
+    """
+        Checks whether the delivery cost is calculated when packages are read.
+    """
+    return PRICING_MODE == 'read_time'
+
+
+async def get_rate_versions(db: AsyncSession, version_ids: set[int]) -> dict[int, RateVersion]:
+    """
+        Returns the rate versions by id, loading the ones missing in the cache.
+
+        Args:
+            db (AsyncSession): Database session
+            version_ids (set[int]): Rate version ids
+
+        Returns:
+            dict[int, RateVersion]: The found rate versions by id
+    """
+    missing = version_ids - rate_versions.keys()
+    if missing:
+        result = await db.execute(
+            select(RateVersionTable.id, RateVersionTable.usd_rate, RateVersionTable.tariff_id)
+            .where(RateVersionTable.id.in_(missing))
+        )
+        for version_id, usd_rate, tariff_id in result.all():
+            rate_versions[version_id] = RateVersion(version_id, usd_rate, await compile_tariff(db, tariff_id))
+    return {version_id: rate_versions[version_id] for version_id in version_ids if version_id in rate_versions}
+
+
+async def get_current_rate_version(db: AsyncSession) -> RateVersion | None:
+    """
+        Returns the latest rate version, checking for a new one when the cache is expired.
+
+        Args:
+            db (AsyncSession): Database session used when the version has to be checked
+
+        Returns:
+            RateVersion | None: The latest rate version, None if there are no versions yet
+    """
+    global current_rate_version_id, current_rate_version_checked_at
+    if (current_rate_version_checked_at is None
+            or time.monotonic() - current_rate_version_checked_at > RATE_VERSION_CACHE_TTL):
+        result = await db.execute(select(RateVersionTable.id).order_by(RateVersionTable.id.desc()).limit(1))
+        current_rate_version_id = result.scalar_one_or_none()
+        current_rate_version_checked_at = time.monotonic()
+    if current_rate_version_id is None:
+        return None
+    return (await get_rate_versions(db, {current_rate_version_id})).get(current_rate_version_id)
+
+
+async def publish_rate_version(db: AsyncSession, usd_rate: float | None) -> RateVersion | None:
+    """
+        Inserts a new rate version, if the USD rate or the tariff in effect differ from the latest version.
+
+        This single-row insert replaces the recalculation of all the packages in the read-time pricing mode.
+
+        Args:
+            db (AsyncSession): Database session
+            usd_rate (float | None): The current USD exchange rate
+
+        Returns:
+            RateVersion | None: The latest rate version
+    """
+    global current_rate_version_id, current_rate_version_checked_at
+    # The check is forced, so that a version published by another process is seen
+    current_rate_version_checked_at = None
+    current = await get_current_rate_version(db)
+    if not usd_rate:
+        logger.warning('No USD rate available for a new rate version')
+        return current
+
+    tariff = await load_tariff(db)
+    if current is not None and current.usd_rate == usd_rate and current.tariff.version == tariff.version:
+        return current
+
+    version = RateVersionTable(usd_rate=usd_rate, tariff_id=tariff.version or None)
+    db.add(version)
+    await db.commit()
+    rate_versions[version.id] = RateVersion(version.id, usd_rate, tariff)
+    current_rate_version_id, current_rate_version_checked_at = version.id, time.monotonic()
+    logger.info(f'Rate version {version.id} published: USD rate {usd_rate}, tariff {tariff.version}')
+    return rate_versions[version.id]
+
+
+async def price_packages(db: AsyncSession, type_ids: Sequence[int], weights: Sequence[float],
+                         content_values_usd: Sequence[float],
+                         rate_version_ids: Sequence[int | None]) -> list[float | None]:
+    """
+        Calculates the delivery cost of packages by their rate versions.
+
+        Packages without a rate version of their own are priced by the latest version.
+        Every version prices its packages in one batch.
+
+        Args:
+            db (AsyncSession): Database session
+            type_ids (Sequence[int]): Package type ids
+            weights (Sequence[float]): Package weights in kilograms
+            content_values_usd (Sequence[float]): Declared values of package contents in USD
+            rate_version_ids (Sequence[int | None]): Rate versions the packages are bound to
+
+        Returns:
+            list[float | None]: The costs in RUB in the order of the packages, None where there is no rate
+    """
+    current = await get_current_rate_version(db)
+    versions = await get_rate_versions(db, {version_id for version_id in rate_version_ids if version_id is not None})
+    if current is not None:
+        versions[None] = current
+
+    positions: dict[int | None, list[int]] = {}
+    for position, version_id in enumerate(rate_version_ids):
+        positions.setdefault(version_id, []).append(position)
+
+    costs: list[float | None] = [None] * len(type_ids)
+    for version_id, version_positions in positions.items():
+        version = versions.get(version_id)
+        if version is None:
+            continue
+        version_costs = version.tariff.price_batch([type_ids[i] for i in version_positions],
+                                                   [weights[i] for i in version_positions],
+                                                   [content_values_usd[i] for i in version_positions],
+                                                   version.usd_rate)
+        for position, cost in zip(version_positions, version_costs):
+            costs[position] = cost
+    return costs
+
+
+async def priced_condition(db: AsyncSession) -> ColumnElement[bool]:
+    """
+        Builds the condition selecting the packages that have a delivery cost in the read-time pricing mode.
+
+        Args:
+            db (AsyncSession): Database session
+
+        Returns:
+            ColumnElement[bool]: The condition on the package table
+    """
+    current = await get_current_rate_version(db)
+    if current is None:
+        covered = false()
+    elif current.tariff.default is not None:
+        covered = true()
+    else:
+        covered = PackageTable.type_id.in_([type_id for type_id in current.tariff.brackets if type_id is not None])
+    return PackageTable.rate_version_id.is_not(None) | covered
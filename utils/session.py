@@ -1,8 +1,17 @@
-from fastapi import Request, HTTPException
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import asyncio
+from fastapi import Request, HTTPException, Depends
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncEngine, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.util.queue import AsyncAdaptedQueue
 
-from utils.db_utils import DATABASE_URL
+from utils.sharding import shard_for_session
 
 
 def get_session_id(request: Request) -> str:
@@ -24,16 +33,67 @@ def get_session_id(request: Request) -> str:
     return session_id
 
 
-async_engine = create_async_engine(
-    DATABASE_URL,
-    echo=False,
-    pool_size=50,
-    max_overflow=20,
-    pool_recycle=3600
-)
+# Decay time of the average pool checkout wait in seconds
+CHECKOUT_WAIT_DECAY = 5.0
+
+checkout_wait_average = 0.0
+checkout_wait_updated_at = time.monotonic()
+
+
+def record_checkout_wait(seconds: float):
+    """
+        Adds a pool checkout wait to the exponentially decaying average.
+
+        Args:
+            seconds (float): Time spent waiting for a connection
+    """
+    global checkout_wait_average, checkout_wait_updated_at
+    checkout_wait_average = get_checkout_wait()
+    checkout_wait_average += (seconds - checkout_wait_average) * 0.2
+    checkout_wait_updated_at = time.monotonic()
+
+
+def get_checkout_wait() -> float:
+    """
+        Returns the average pool checkout wait.
+
+        The average decays while there are no checkouts, so it goes down again
+        when the load is shed and the pool is idle.
+
+        Returns:
+            float: The average checkout wait in seconds
+    """
+    elapsed = time.monotonic() - checkout_wait_updated_at
+    return checkout_wait_average * math.exp(-elapsed / CHECKOUT_WAIT_DECAY)
+
+
+class TimedQueue(AsyncAdaptedQueue):
+    """
+        Queue of the pooled connections measuring how long the checkouts wait for one of them.
+    """
+    def get(self, block: bool = True, timeout: float | None = None):
+        started = time.perf_counter()
+        try:
+            return super().get(block, timeout)
+        finally:
+            record_checkout_wait(time.perf_counter() - started)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+        Connection pool measuring how long the checkouts wait for a connection.
+
+        Only the wait on the queue is measured, a checkout opening a new overflow connection
+        does not wait, so the connect time does not count as contention.
+    """
+    _queue_class = TimedQueue
+
+
+# The engine is created by init_engine() on the application startup, so importing
+# this module neither reads the environment nor touches the database
+async_engine: AsyncEngine | None = None
 
 AsyncSessionLocal = sessionmaker(
-    bind=async_engine,
     class_=AsyncSession,
     expire_on_commit=False,
     autocommit=False,
@@ -42,8 +102,230 @@ AsyncSessionLocal = sessionmaker(
 )
 
 
+# Session factories of the shards after the primary database, bound by init_engine() if DATABASE_SHARD_HOSTS is set
+shard_engines: list[AsyncEngine] = []
+shard_factories: list[sessionmaker] = []
+
+# The engine of the read replica, created by init_read_engine() if DATABASE_REPLICA_HOST is set
+read_engine: AsyncEngine | None = None
+
+ReadSessionLocal = sessionmaker(
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autocommit=False,
+    autoflush=False,
+    info=None
+)
+
+
+def init_engine() -> AsyncEngine:
+    """
+        Creates the database engines on the first call and binds the session factories to them.
+
+        Returns:
+            AsyncEngine: The engine of the primary database
+
+        Raises:
+            RuntimeError: If the shards are configured with the read-time pricing mode, whose caches
+                of rate versions are shared by all the databases of the process
+    """
+    global async_engine
+    if async_engine is None:
+        from utils.db_utils import (DATABASE_URL, DATABASE_POOL_SIZE, DATABASE_MAX_OVERFLOW, DATABASE_SHARD_URLS,
+                                    DATABASE_SHARD_POOL_SIZE)
+        from utils.pricing import read_time_pricing
+
+        if len(DATABASE_SHARD_URLS) > 1 and read_time_pricing():
+            raise RuntimeError('PRICING_MODE=read_time is not supported with DATABASE_SHARD_HOSTS')
+        async_engine = create_async_engine(
+            DATABASE_URL,
+            echo=False,
+            poolclass=TimedQueuePool,
+            pool_size=DATABASE_POOL_SIZE,
+            max_overflow=DATABASE_MAX_OVERFLOW,
+            pool_recycle=3600
+        )
+        AsyncSessionLocal.configure(bind=async_engine)
+        for url in DATABASE_SHARD_URLS[1:]:
+            engine = create_async_engine(
+                url,
+                echo=False,
+                poolclass=TimedQueuePool,
+                pool_size=DATABASE_SHARD_POOL_SIZE,
+                max_overflow=DATABASE_MAX_OVERFLOW,
+                pool_recycle=3600
+            )
+            shard_engines.append(engine)
+            shard_factories.append(sessionmaker(
+                bind=engine,
+                class_=AsyncSession,
+                expire_on_commit=False,
+                autocommit=False,
+                autoflush=True
+            ))
+    return async_engine
+
+
+def init_read_engine() -> AsyncEngine | None:
+    """
+        Creates the read replica engine on the first call and binds the read session factory to it.
+
+        Returns:
+            AsyncEngine | None: The replica engine, None if no replica is configured
+    """
+    global read_engine
+    if read_engine is None:
+        from utils.db_utils import DATABASE_REPLICA_URL, DATABASE_REPLICA_POOL_SIZE, DATABASE_MAX_OVERFLOW
+
+        if DATABASE_REPLICA_URL is None:
+            return None
+        read_engine = create_async_engine(
+            DATABASE_REPLICA_URL,
+            echo=False,
+            pool_size=DATABASE_REPLICA_POOL_SIZE,
+            max_overflow=DATABASE_MAX_OVERFLOW,
+            pool_recycle=3600,
+            pool_pre_ping=True
+        )
+        ReadSessionLocal.configure(bind=read_engine)
+    return read_engine
+
+
+def is_replica_session(db: AsyncSession) -> bool:
+    """
+        Checks whether the session reads from the read replica.
+
+        Args:
+            db (AsyncSession): Database session
+
+        Returns:
+            bool: True for the sessions of the replica engine
+    """
+    return read_engine is not None and db.bind is read_engine
+
+
+async def dispose_engine():
+    """
+        Closes all pooled connections and drops the engines.
+    """
+    global async_engine, read_engine
+    if async_engine is not None:
+        await async_engine.dispose()
+        async_engine = None
+    for engine in shard_engines:
+        await engine.dispose()
+    shard_engines.clear()
+    shard_factories.clear()
+    if read_engine is not None:
+        await read_engine.dispose()
+        read_engine = None
+
+
+async def prewarm_pool(size: int) -> int:
+    """
+        Opens the given number of pool connections concurrently and returns them to the pool.
+
+        Args:
+            size (int): Number of connections to open
+
+        Returns:
+            int: The number of opened connections
+
+        Raises:
+            Exception: The first error of opening a connection, after every opened connection is closed
+    """
+    engine = init_engine()
+
+    async def open_connection():
+        connection = await engine.connect()
+        try:
+            await connection.execute(text('SELECT 1'))
+        except BaseException:
+            await connection.close()
+            raise
+        return connection
+
+    results = await asyncio.gather(*(open_connection() for _ in range(size)), return_exceptions=True)
+    connections = [result for result in results if not isinstance(result, BaseException)]
+    for connection in connections:
+        await connection.close()
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return len(connections)
+
+
+def get_session_factory() -> sessionmaker:
+    """
+        Provides the database session factory.
+
+        Used by the background tasks and by the endpoints that need a database session
+        outliving the request dependencies, e.g. for streaming responses.
+
+        Returns:
+            sessionmaker: The factory of async database sessions
+    """
+    init_engine()
+    return AsyncSessionLocal
+
+
+def shard_count() -> int:
+    """
+        Returns the number of databases the packages are sharded to, 1 without sharding.
+    """
+    from utils.db_utils import DATABASE_SHARD_URLS
+
+    return len(DATABASE_SHARD_URLS)
+
+
+def get_shard_factory(shard: int) -> sessionmaker:
+    """
+        Provides the database session factory of a shard, shard 0 is the primary database.
+
+        Args:
+            shard (int): Shard index
+
+        Returns:
+            sessionmaker: The factory of async database sessions of the shard
+    """
+    init_engine()
+    return AsyncSessionLocal if shard == 0 else shard_factories[shard - 1]
+
+
+def get_shard_factories() -> list[sessionmaker]:
+    """
+        Provides the database session factories of all the shards.
+
+        Used by the background tasks processing the packages of all sessions.
+
+        Returns:
+            list[sessionmaker]: The factories by shard index
+    """
+    init_engine()
+    return [AsyncSessionLocal, *shard_factories]
+
+
+@asynccontextmanager
+async def shard_session(shard: int, db: AsyncSession) -> AsyncIterator[AsyncSession]:
+    """
+        Provides a session of a shard.
+
+        Args:
+            shard (int): Shard index
+            db (AsyncSession): Session of the primary database, used for shard 0
+
+        Yields:
+            AsyncSession: The session of the shard
+    """
+    if shard == 0:
+        yield db
+        return
+    async with get_shard_factory(shard)() as session:
+        yield session
+
+
 async def get_db() -> AsyncSession:
-    async with AsyncSessionLocal() as session:
+    async with get_session_factory()() as session:
         try:
             yield session
             await session.commit()
@@ -52,3 +334,115 @@ async def get_db() -> AsyncSession:
             raise
         finally:
             await session.close()
+
+
+@asynccontextmanager
+async def read_session(session_id: str, db: AsyncSession) -> AsyncIterator[AsyncSession]:
+    """
+        Opens a session for reading the data of the primary database.
+
+        The session reads from the replica if one is configured, except for the sessions
+        whose packages changed within READ_YOUR_WRITES_WINDOW seconds, which read from the primary,
+        so that the replication lag does not hide their own writes.
+
+        Args:
+            session_id (str): Session identifier
+            db (AsyncSession): Primary database session
+
+        Yields:
+            AsyncSession: The replica session or the primary one
+    """
+    from redis_db.versions import has_recent_write
+
+    if init_read_engine() is None or await has_recent_write(session_id):
+        yield db
+        return
+    async with ReadSessionLocal() as session:
+        try:
+            yield session
+        finally:
+            # Ends the read transaction, so that the next one sees the replicated changes
+            await session.rollback()
+
+
+async def get_read_db(session_id: str = Depends(get_session_id),
+                      db: AsyncSession = Depends(get_db)) -> AsyncSession:
+    """
+        Provides a database session for reading, see read_session().
+
+        The primary session does not take a connection unless it is used.
+
+        Args:
+            session_id (str): Session identifier
+            db (AsyncSession): Primary database session
+
+        Returns:
+            AsyncSession: The replica session or the primary one
+    """
+    async with read_session(session_id, db) as session:
+        yield session
+
+
+async def get_shard_db(session_id: str = Depends(get_session_id),
+                       db: AsyncSession = Depends(get_db)) -> AsyncSession:
+    """
+        Provides a database session of the shard holding the packages of the session.
+
+        Args:
+            session_id (str): Session identifier
+            db (AsyncSession): Primary database session, the session of shard 0
+
+        Returns:
+            AsyncSession: The shard session
+    """
+    shard = shard_for_session(session_id, shard_count())
+    if shard == 0:
+        yield db
+        return
+    async with get_shard_factory(shard)() as session:
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+
+
+async def get_shard_read_db(session_id: str = Depends(get_session_id),
+                            db: AsyncSession = Depends(get_db)) -> AsyncSession:
+    """
+        Provides a database session for reading the packages of the session.
+
+        The replica serves the primary database, so it is used for the sessions of shard 0 only.
+        The sessions of the other shards read from the shard without checking the recent writes.
+
+        Args:
+            session_id (str): Session identifier
+            db (AsyncSession): Primary database session, the session of shard 0
+
+        Returns:
+            AsyncSession: The read session
+    """
+    shard = shard_for_session(session_id, shard_count())
+    if shard == 0:
+        async with read_session(session_id, db) as session:
+            yield session
+        return
+    async with get_shard_factory(shard)() as session:
+        yield session
+
+
+def get_shard_session_factory(session_id: str = Depends(get_session_id),
+                              session_factory: sessionmaker = Depends(get_session_factory)) -> sessionmaker:
+    """
+        Provides the database session factory of the shard holding the packages of the session.
+
+        Args:
+            session_id (str): Session identifier
+            session_factory (sessionmaker): Session factory of the primary database
+
+        Returns:
+            sessionmaker: The factory of the shard sessions
+    """
+    shard = shard_for_session(session_id, shard_count())
+    return session_factory if shard == 0 else get_shard_factory(shard)
@@ -0,0 +1,67 @@
+import hashlib
+
+# Package ids carry the shard that allocated them in the bits above this one, see tasks/reshard.py
+PACKAGE_ID_SHARD_SHIFT = 40
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """
+        Maps the key to one of the buckets with the jump consistent hash.
+
+        When the number of buckets grows from N to N + 1, only 1 / (N + 1) of the keys move,
+        all of them to the new bucket.
+
+        Args:
+            key (int): 64-bit key
+            buckets (int): Number of buckets
+
+        Returns:
+            int: The bucket from 0 to buckets - 1
+    """
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_for_session(session_id: str, shards: int) -> int:
+    """
+        Returns the shard holding the packages of the session.
+
+        Args:
+            session_id (str): Session identifier
+            shards (int): Number of shards
+
+        Returns:
+            int: The shard index
+    """
+    if shards == 1:
+        return 0
+    key = int.from_bytes(hashlib.sha256(session_id.encode()).digest()[:8], 'big')
+    return jump_hash(key, shards)
+
+
+def package_home_shard(package_id: int, shards: int) -> int:
+    """
+        Returns the shard that allocated the package id.
+
+        The package is there unless resharding moved it.
+
+        Args:
+            package_id (int): Package identifier
+            shards (int): Number of shards
+
+        Returns:
+            int: The shard index, 0 for the ids outside of the shard ranges
+    """
+    shard = package_id >> PACKAGE_ID_SHARD_SHIFT
+    return shard if shard < shards else 0
+
+
+def first_package_id(shard: int) -> int:
+    """
+        Returns the first package id allocated by the shard.
+    """
+    return (shard << PACKAGE_ID_SHARD_SHIFT) + 1
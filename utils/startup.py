@@ -0,0 +1,94 @@
+import logging
+import time
+
+from utils.package_types import load_package_types
+from utils.session import get_session_factory, prewarm_pool
+from utils.tariffs import load_tariff
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Steps that have to succeed before the application reports readiness
+REQUIRED_STEPS = ('db_pool', 'package_types')
+
+
+async def warm_up_db_pool() -> dict:
+    """
+        Opens DATABASE_POOL_PREWARM pool connections.
+    """
+    from utils.db_utils import DATABASE_POOL_PREWARM
+
+    return {'connections': await prewarm_pool(DATABASE_POOL_PREWARM)}
+
+
+async def warm_up_package_types() -> dict:
+    """
+        Loads the package type catalog into the cache.
+    """
+    async with get_session_factory()() as db:
+        return {'types': len(await load_package_types(db))}
+
+
+async def warm_up_tariff() -> dict:
+    """
+        Loads and compiles the tariff in effect.
+    """
+    async with get_session_factory()() as db:
+        return {'version': (await load_tariff(db)).version}
+
+
+async def warm_up_usd_rate() -> dict:
+    """
+        Connects to Redis and reads the current USD rate.
+    """
+    from redis_db.redis_setup import get_redis_client, redis_call
+    from tasks.calculate_delivery_cost_task import get_usd_rate
+
+    redis_client = await get_redis_client()
+    await redis_call(redis_client.ping())
+    return {'usd_rate': await get_usd_rate(redis_client)}
+
+
+WARM_UP_STEPS = {
+    'db_pool': warm_up_db_pool,
+    'package_types': warm_up_package_types,
+    'tariff': warm_up_tariff,
+    'usd_rate': warm_up_usd_rate
+}
+
+
+async def warm_up() -> dict[str, dict]:
+    """
+        Opens the pool connections and loads the caches needed by the first requests.
+
+        Every step is timed, a failed step is logged and reported without stopping the others.
+
+        Returns:
+            dict[str, dict]: The report of each step with its duration in seconds,
+                the success flag and the step details
+    """
+    report = {}
+    for name, step in WARM_UP_STEPS.items():
+        started = time.perf_counter()
+        try:
+            details = await step()
+            report[name] = {'ok': True, **details}
+        except Exception as ex:
+            logger.error(f'Warm-up step {name} failed: {str(ex)}')
+            report[name] = {'ok': False, 'error': str(ex)}
+        report[name]['seconds'] = round(time.perf_counter() - started, 4)
+    logger.info(f'Warm-up report: {report}')
+    return report
+
+
+def is_ready(report: dict[str, dict]) -> bool:
+    """
+        Checks whether all the required warm-up steps succeeded.
+
+        Args:
+            report (dict[str, dict]): The warm-up report
+
+        Returns:
+            bool: True if the application can serve requests
+    """
+    return all(report.get(name, {}).get('ok') for name in REQUIRED_STEPS)
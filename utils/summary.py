@@ -0,0 +1,112 @@
+from collections import defaultdict
+
+from sqlalchemy import select, delete, union_all, func, literal
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.packages import PackageTable, PackageArchiveTable, SessionSummaryTable
+
+SUMMARY_COUNTERS = ('package_count', 'total_value_usd', 'priced_count', 'total_delivery_cost')
+
+
+class SummaryDeltas:
+    """
+        Accumulates changes of the session summary counters per session and package type.
+    """
+    def __init__(self):
+        self.deltas: dict[tuple[str, int], dict[str, float]] = defaultdict(
+            lambda: dict.fromkeys(SUMMARY_COUNTERS, 0)
+        )
+
+    def add_package(self, session_id: str, type_id: int, content_value_usd: float,
+                    delivery_cost: float | None = None):
+        """
+            Counts a new package.
+        """
+        delta = self.deltas[(session_id, type_id)]
+        delta['package_count'] += 1
+        delta['total_value_usd'] += content_value_usd
+        self.change_cost(session_id, type_id, None, delivery_cost)
+
+    def change_cost(self, session_id: str, type_id: int, old_cost: float | None, new_cost: float | None):
+        """
+            Counts a change of the package delivery cost.
+        """
+        if old_cost == new_cost:
+            return
+        delta = self.deltas[(session_id, type_id)]
+        delta['priced_count'] += (new_cost is not None) - (old_cost is not None)
+        delta['total_delivery_cost'] += (new_cost or 0) - (old_cost or 0)
+
+    def rows(self) -> list[dict]:
+        """
+            Returns the accumulated non-zero deltas as summary rows.
+
+            The rows are ordered by the primary key, so that concurrent transactions lock
+            the summary rows in the same order and do not deadlock each other.
+        """
+        return [
+            {'session_id': session_id, 'type_id': type_id,
+             **{counter: round(value, 2) for counter, value in delta.items()}}
+            for (session_id, type_id), delta in sorted(self.deltas.items())
+            if any(delta.values())
+        ]
+
+
+async def apply_summary_deltas(db: AsyncSession, deltas: SummaryDeltas):
+    """
+        Adds the deltas to the session summary in the current transaction.
+
+        Missing summary rows are created, so the same statement serves new sessions and new types.
+
+        Args:
+            db (AsyncSession): Database session, the caller commits
+            deltas (SummaryDeltas): The accumulated deltas
+    """
+    rows = deltas.rows()
+    if not rows:
+        return
+    stmt = insert(SessionSummaryTable)
+    stmt = stmt.on_duplicate_key_update({
+        counter: getattr(SessionSummaryTable, counter) + getattr(stmt.inserted, counter)
+        for counter in SUMMARY_COUNTERS
+    })
+    await db.execute(stmt, rows)
+
+
+async def rebuild_session_summary(db: AsyncSession, session_ids: list[str] | None = None) -> int:
+    """
+        Recomputes the session summary from the package and package archive tables.
+
+        Args:
+            db (AsyncSession): Database session
+            session_ids (list[str] | None): Sessions to rebuild the summary of, all sessions if None
+
+        Returns:
+            int: The number of summary rows
+    """
+    active = select(PackageTable.session_id, PackageTable.type_id, PackageTable.content_value_usd,
+                    PackageTable.delivery_cost)
+    archived = select(PackageArchiveTable.session_id, PackageArchiveTable.type_id,
+                      PackageArchiveTable.content_value_usd, PackageArchiveTable.delivery_cost)
+    cleared = delete(SessionSummaryTable)
+    if session_ids is not None:
+        active = active.where(PackageTable.session_id.in_(session_ids))
+        archived = archived.where(PackageArchiveTable.session_id.in_(session_ids))
+        cleared = cleared.where(SessionSummaryTable.session_id.in_(session_ids))
+    packages = union_all(active, archived).subquery()
+    aggregated = select(
+        packages.c.session_id,
+        packages.c.type_id,
+        func.count(),
+        func.coalesce(func.sum(packages.c.content_value_usd), literal(0)),
+        func.count(packages.c.delivery_cost),
+        func.coalesce(func.sum(packages.c.delivery_cost), literal(0))
+    ).group_by(packages.c.session_id, packages.c.type_id)
+
+    await db.execute(cleared)
+    result = await db.execute(
+        insert(SessionSummaryTable).from_select(['session_id', 'type_id', *SUMMARY_COUNTERS], aggregated)
+    )
+    await db.commit()
+    return result.rowcount
@@ -0,0 +1,180 @@
+import logging
+import os
+import time
+from bisect import bisect_right
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Sequence
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.tariffs import TariffTable, TariffRateTable
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Interval of checking the database for a new active tariff version
+TARIFF_CACHE_TTL = int(os.getenv('TARIFF_CACHE_TTL', 60))
+
+
+@dataclass(frozen=True)
+class TariffRate:
+    """
+        Coefficients of one weight bracket, the amounts are in USD.
+    """
+    weight_from: float
+    weight_rate: float
+    value_rate: float
+    base_fee: float = 0.0
+    min_charge: float = 0.0
+
+
+class CompiledTariff:
+    """
+        Tariff version compiled for pricing.
+
+        The rates of every package type are kept as a sorted list of bracket bounds and a parallel
+        list of coefficients, so pricing a package is a dictionary lookup and a binary search.
+        Types without rates of their own use the default rates, if the tariff has them.
+    """
+    def __init__(self, version: int, rates: dict[int | None, list[TariffRate]]):
+        self.version = version
+        self.brackets: dict[int | None, tuple[list[float], list[tuple[float, float, float, float]]]] = {}
+        for type_id, type_rates in rates.items():
+            type_rates = sorted(type_rates, key=lambda rate: rate.weight_from)
+            self.brackets[type_id] = (
+                [rate.weight_from for rate in type_rates],
+                [(rate.weight_rate, rate.value_rate, rate.base_fee, rate.min_charge) for rate in type_rates]
+            )
+        self.default = self.brackets.get(None)
+
+    def price(self, type_id: int | None, weight: float, content_value_usd: float,
+              usd_rate: float | None) -> float | None:
+        """
+            Calculates the delivery cost of one package in roubles.
+
+            Args:
+                type_id (int | None): Package type id
+                weight (float): The package weight in kilograms
+                content_value_usd (float): The declared value of package contents in USD
+                usd_rate (float | None): The USD exchange rate
+
+            Returns:
+                float | None: The cost in RUB, None if there is no rate or no tariff for the type
+        """
+        return self.price_batch([type_id], [weight], [content_value_usd], usd_rate)[0]
+
+    def price_batch(self, type_ids: Sequence[int | None], weights: Sequence[float],
+                    content_values_usd: Sequence[float], usd_rate: float | None) -> list[float | None]:
+        """
+            Calculates the delivery cost of a chunk of packages in one pass.
+
+            Args:
+                type_ids (Sequence[int | None]): Package type ids
+                weights (Sequence[float]): Package weights in kilograms
+                content_values_usd (Sequence[float]): Declared values of package contents in USD
+                usd_rate (float | None): The USD exchange rate
+
+            Returns:
+                list[float | None]: The costs in RUB in the order of the packages
+        """
+        if not usd_rate:
+            return [None] * len(type_ids)
+
+        brackets = self.brackets
+        default = self.default
+        costs = []
+        for type_id, weight, content_value_usd in zip(type_ids, weights, content_values_usd):
+            type_brackets = brackets.get(type_id, default)
+            if type_brackets is None:
+                costs.append(None)
+                continue
+            bounds, coefficients = type_brackets
+            # Weights below the first bracket are priced by the first bracket
+            weight_rate, value_rate, base_fee, min_charge = coefficients[max(bisect_right(bounds, weight) - 1, 0)]
+            cost_usd = max(base_fee + weight * weight_rate + content_value_usd * value_rate, min_charge)
+            costs.append(round(cost_usd * usd_rate, 2))
+        return costs
+
+
+# The tariff used while there are no tariffs in the database
+DEFAULT_TARIFF = CompiledTariff(version=0, rates={None: [TariffRate(weight_from=0, weight_rate=0.5, value_rate=0.01)]})
+
+tariff: CompiledTariff = DEFAULT_TARIFF
+tariff_checked_at: float | None = None
+
+
+async def get_active_tariff_version(db: AsyncSession) -> int | None:
+    """
+        Returns the version of the tariff in effect, None if there are no tariffs.
+    """
+    result = await db.execute(
+        select(TariffTable.id)
+        .where(TariffTable.effective_from <= func.now())
+        .order_by(TariffTable.effective_from.desc(), TariffTable.id.desc())
+        .limit(1)
+    )
+    return result.scalar_one_or_none()
+
+
+async def compile_tariff(db: AsyncSession, version: int | None) -> CompiledTariff:
+    """
+        Loads the rates of a tariff version and compiles them.
+
+        Args:
+            db (AsyncSession): Database session
+            version (int | None): Tariff version, None for the default tariff
+
+        Returns:
+            CompiledTariff: The compiled tariff
+    """
+    if version is None:
+        return DEFAULT_TARIFF
+    if version == tariff.version:
+        return tariff
+    result = await db.execute(
+        select(TariffRateTable.type_id, TariffRateTable.weight_from, TariffRateTable.weight_rate,
+               TariffRateTable.value_rate, TariffRateTable.base_fee, TariffRateTable.min_charge)
+        .where(TariffRateTable.tariff_id == version)
+    )
+    rates = defaultdict(list)
+    for type_id, *coefficients in result.all():
+        rates[type_id].append(TariffRate(*coefficients))
+    return CompiledTariff(version, rates)
+
+
+async def load_tariff(db: AsyncSession) -> CompiledTariff:
+    """
+        Loads and compiles the tariff in effect, if its version differs from the cached one.
+
+        Args:
+            db (AsyncSession): Database session
+
+        Returns:
+            CompiledTariff: The tariff in effect
+    """
+    global tariff, tariff_checked_at
+    compiled = await compile_tariff(db, await get_active_tariff_version(db))
+    if compiled is not tariff:
+        logger.info(f'Tariff version {compiled.version} is in effect')
+    tariff, tariff_checked_at = compiled, time.monotonic()
+    return tariff
+
+
+async def get_tariff(db: AsyncSession) -> CompiledTariff:
+    """
+        Returns the cached tariff, checking for a new version when the cache is expired.
+
+        A new tariff version is picked up by every process within TARIFF_CACHE_TTL seconds
+        without a restart.
+
+        Args:
+            db (AsyncSession): Database session used when the tariff has to be checked
+
+        Returns:
+            CompiledTariff: The tariff in effect
+    """
+    if tariff_checked_at is None or time.monotonic() - tariff_checked_at > TARIFF_CACHE_TTL:
+        await load_tariff(db)
+    return tariff